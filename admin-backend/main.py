@@ -17,15 +17,20 @@ from routes.distributors import router as distributors_router
 from routes.chat import router as chat_router
 from routes.stats import router as stats_router
 from routes.engagement import router as engagement_router
-from routes.quiz import router as quiz_router
-from routes.certificates import router as certificates_router
+from routes.quiz import router as quiz_router, refresh_leaderboard
+from routes.certificates import router as certificates_router, prefetch_certificates
 from routes.checklist import router as checklist_router
 from routes.agenda import router as agenda_router
 from routes.complaints import router as complaints_router
 from routes.vip import router as vip_router
+from routes.jobs import router as jobs_router, start_outbox, stop_outbox
+from routes.media import router as media_router
 
 # Import models to create tables
-from models import init_db
+from models import init_db, async_engine
+from services.loop_monitor import loop_monitor
+from services.http_client import http_client
+from services.render_pool import render_pool
 
 # Initialize database
 init_db()
@@ -53,6 +58,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # ─── Public routes (no token required) ───
@@ -62,6 +68,8 @@ app.include_router(auth_router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(tickets_router, prefix="/api/tickets", tags=["Tickets"])
 # Chat: public chat widget from the official platform
 app.include_router(chat_router, prefix="/api/chat", tags=["Chat Widget"])
+# Media: bulk WhatsApp images, downloaded by Evolution API by their content hash
+app.include_router(media_router, prefix="/api/media", tags=["Media"])
 
 # ─── Protected routes (require admin JWT token) ───
 app.include_router(stats_router, prefix="/api/stats", tags=["Statistics"], dependencies=[Depends(verify_token)])
@@ -73,6 +81,26 @@ app.include_router(checklist_router, prefix="/api/checklist", tags=["قائمة
 app.include_router(agenda_router, prefix="/api/agenda", tags=["الأجندة"], dependencies=[Depends(verify_token)])
 app.include_router(complaints_router, prefix="/api/complaints", tags=["الشكاوى المباشرة"], dependencies=[Depends(verify_token)])
 app.include_router(vip_router, prefix="/api/vip", tags=["كبار الزوار"], dependencies=[Depends(verify_token)])
+app.include_router(jobs_router, prefix="/api/jobs", tags=["Message Jobs"], dependencies=[Depends(verify_token)])
+
+
+@app.on_event("startup")
+async def on_startup():
+    loop_monitor.start()
+    await http_client.start()
+    await refresh_leaderboard()
+    render_pool.start()
+    await start_outbox()
+    await prefetch_certificates()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await loop_monitor.stop()
+    await stop_outbox()
+    await http_client.stop()
+    render_pool.shutdown()
+    await async_engine.dispose()
 
 
 @app.get("/")
@@ -87,7 +115,7 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "event_loop_lag": loop_monitor.snapshot()}
 
 
 if __name__ == "__main__":
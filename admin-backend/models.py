@@ -1,14 +1,24 @@
 """
 Be Star Ticketing System - Database Models
 """
+from contextlib import contextmanager, asynccontextmanager
 from datetime import datetime
-import random
-import string
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum as SQLEnum, Float, Table
+import asyncio
+import os
+from sqlalchemy import bindparam, create_engine, event, delete, func, insert, select, update, BigInteger, Index, UniqueConstraint, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum as SQLEnum, Float, Table
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session, sessionmaker, relationship, deferred
 import enum
 import json
+import secrets
+import threading
+
+from services.phones import normalize_phone
+from services.ticket_codes import CODE_SPACE, CodeAllocator
+from services.ticket_qr import ticket_qr
 
 Base = declarative_base()
 
@@ -37,6 +47,7 @@ class Customer(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
     phone = Column(String(20), unique=True, nullable=False, index=True)
+    phone_normalized = Column(String(20), nullable=True, index=True)   # services.phones; set with phone
     email = Column(String(100), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -45,6 +56,10 @@ class Customer(Base):
 
 class Ticket(Base):
     __tablename__ = "tickets"
+    __table_args__ = (
+        # Keyset pagination for the newest-first ticket lists (services.pagination)
+        Index("ix_tickets_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(6), unique=True, nullable=False, index=True)
@@ -52,16 +67,22 @@ class Ticket(Base):
     status = Column(String(30), default="pending")
     price = Column(Integer, nullable=False)
     
-    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
     customer = relationship("Customer", back_populates="tickets")
     
     payment_method = Column(String(50), nullable=True)
-    payment_proof = Column(Text, nullable=True)
+    # Legacy inline data / free-text proof info; deferred so list queries never pull it
+    payment_proof = deferred(Column(Text, nullable=True))
+    # Uploaded proof image lives in services.blob_store, keyed by SHA-256
+    payment_proof_key = Column(String(64), nullable=True, index=True)
+    payment_proof_size = Column(Integer, nullable=True)
+    payment_proof_mime = Column(String(50), nullable=True)
     
 
     # Guest name for this specific ticket (defaults to customer name if empty)
     guest_name = Column(String(100), nullable=True)
     guest_phone = Column(String(20), nullable=True)
+    guest_phone_normalized = Column(String(20), nullable=True, index=True)
     
     approved_by = Column(Integer, ForeignKey("admins.id"), nullable=True)
     approved_at = Column(DateTime, nullable=True)
@@ -76,13 +97,14 @@ class Ticket(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     @staticmethod
-    def generate_unique_code(session):
-        """Generate a unique 6-digit ticket code"""
-        while True:
-            code = ''.join(random.choices(string.digits, k=6))
-            existing = session.query(Ticket).filter(Ticket.code == code).first()
-            if not existing:
-                return code
+    def generate_unique_code(session=None):
+        """Next ticket code from this process's reserved block (services.ticket_codes)"""
+        return allocate_ticket_codes(1)[0]
+
+    @staticmethod
+    async def generate_unique_code_async(session=None):
+        """Async twin of generate_unique_code(); a block reservation waits off the event loop"""
+        return (await allocate_ticket_codes_async(1))[0]
 
 
 class TicketDraft(Base):
@@ -97,6 +119,9 @@ class TicketDraft(Base):
     ticket_type = Column(String(50), nullable=True)
     email = Column(String(100), nullable=True)
     payment_proof = Column(Text, nullable=True)
+    payment_proof_key = Column(String(64), nullable=True, index=True)
+    payment_proof_size = Column(Integer, nullable=True)
+    payment_proof_mime = Column(String(50), nullable=True)
     
     is_completed = Column(Boolean, default=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -166,6 +191,9 @@ class QuizGroup(Base):
 class QuizGroupMember(Base):
     """ربط مشارك (ticket) بمجموعة مسابقة"""
     __tablename__ = "quiz_group_members"
+    __table_args__ = (
+        Index("ix_quiz_group_members_group_ticket", "group_id", "ticket_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey("quiz_groups.id", ondelete="CASCADE"), nullable=False)
@@ -200,6 +228,7 @@ class Question(Base):
     
     options = relationship("QuestionOption", back_populates="question", cascade="all, delete-orphan")
     answers = relationship("Answer", back_populates="question", cascade="all, delete-orphan")
+    deliveries = relationship("QuizDelivery", cascade="all, delete-orphan")
     
     def get_target_groups(self):
         try:
@@ -227,6 +256,12 @@ class QuestionOption(Base):
 class Answer(Base):
     """إجابة مشارك على سؤال"""
     __tablename__ = "answers"
+    __table_args__ = (
+        # Covers the leaderboard aggregation (GROUP BY ticket_id) without touching the table
+        Index("ix_answers_ticket_points", "ticket_id", "points_earned", "is_correct"),
+        # One answer per participant per question; submit_answer relies on ON CONFLICT DO NOTHING
+        UniqueConstraint("question_id", "ticket_id", name="uq_answers_question_ticket"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False)
@@ -245,18 +280,577 @@ class Answer(Base):
     ticket = relationship("Ticket")
 
 
+class QuizDelivery(Base):
+    """وقت وصول السؤال لكل مشارك — المهلة بتتحسب من وقت الوصول مش من وقت بدء الإرسال"""
+    __tablename__ = "quiz_deliveries"
+    __table_args__ = (
+        UniqueConstraint("question_id", "phone", name="uq_quiz_deliveries_question_phone"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False)
+    phone = Column(String(20), nullable=False)       # normalized like Answer.phone
+    instance = Column(String(100), nullable=True)    # Evolution instance that delivered it
+    delivered_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)    # delivered_at + time_limit_seconds
+
+
 # Database setup
 def get_database_url():
-    import os
     return os.getenv("DATABASE_URL", "sqlite:///./data/bestar.db")
 
 
-def create_db_engine():
-    engine = create_engine(
-        get_database_url(),
-        connect_args={"check_same_thread": False}
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def _env_bool(name, default):
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+def create_db_engine(url=None):
+    """Build an Engine with the pool settings from the environment.
+
+    DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_RECYCLE / DB_POOL_PRE_PING tune
+    the connection pool. In-memory SQLite keeps SQLAlchemy's default
+    single-connection pool, which does not accept those options. Pre-ping
+    defaults off for SQLite: a local file cannot drop the connection, and the
+    extra round trip shows up on every checkout.
+    """
+    url = url or get_database_url()
+    kwargs = {}
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if ":memory:" not in url and url not in ("sqlite://", "sqlite:///"):
+        kwargs.update(
+            pool_size=_env_int("DB_POOL_SIZE", 10),
+            max_overflow=_env_int("DB_MAX_OVERFLOW", 20),
+            pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+            pool_pre_ping=_env_bool("DB_POOL_PRE_PING", "false" if url.startswith("sqlite") else "true"),
+        )
+    return create_engine(url, **kwargs)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection for concurrent event-day load.
+
+    WAL lets the dashboard keep reading while answers are written,
+    busy_timeout makes writers wait for the lock instead of failing with
+    "database is locked", and mmap/cache keep hot pages in memory.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={os.getenv('SQLITE_JOURNAL_MODE', 'WAL')}")
+        cursor.execute(f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+        cursor.execute(f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT_MS', 15000)}")
+        cursor.execute(f"PRAGMA mmap_size={_env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}")
+        # Negative cache_size is in KiB
+        cursor.execute(f"PRAGMA cache_size={-_env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+# One engine + session factory per process, shared by every router.
+# Creating an Engine per request rebuilt the pool and dialect on every call.
+engine = create_db_engine()
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# ── Async engine (AsyncSession) ──
+# The async handlers use this path so DB I/O never blocks the event loop.
+# The driver is derived from DATABASE_URL: SQLite → aiosqlite, Postgres → asyncpg.
+
+def get_async_database_url(url=None):
+    url = url or get_database_url()
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+def create_async_db_engine(url=None):
+    url = url or get_async_database_url()
+    kwargs = {}
+    if ":memory:" not in url and not url.endswith("sqlite+aiosqlite://"):
+        # aiosqlite defaults to NullPool; keep connections (and their pragmas) warm
+        kwargs["poolclass"] = AsyncAdaptedQueuePool
+        kwargs.update(
+            pool_size=_env_int("DB_POOL_SIZE", 10),
+            max_overflow=_env_int("DB_MAX_OVERFLOW", 20),
+            pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+            pool_pre_ping=_env_bool("DB_POOL_PRE_PING", "false" if url.startswith("sqlite") else "true"),
+        )
+    async_engine = create_async_engine(url, **kwargs)
+    if async_engine.dialect.name == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return async_engine
+
+
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# ── Optional single-writer gate ──
+# SQLite allows one writer at a time. With DB_SERIALIZE_WRITES=1, hot write
+# paths (quiz answers, WhatsApp bookings, drafts) queue up on this lock inside
+# the process instead of racing for the file lock; readers never take it, and
+# WAL keeps them unblocked while a write is in progress.
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def serialized_write():
+    """Hold the process-wide write lock when DB_SERIALIZE_WRITES is enabled.
+
+        with serialized_write():
+            session.add(answer)
+            session.commit()
+    """
+    if not _env_bool("DB_SERIALIZE_WRITES", "false"):
+        yield
+        return
+    with _write_lock:
+        yield
+
+
+@asynccontextmanager
+async def async_serialized_write():
+    """Async twin of serialized_write(); waits for the same lock off the event loop."""
+    if not _env_bool("DB_SERIALIZE_WRITES", "false"):
+        yield
+        return
+    acquiring = asyncio.ensure_future(asyncio.to_thread(_write_lock.acquire))
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # The thread goes on to take the lock regardless; give it back as soon as it does
+        acquiring.add_done_callback(lambda _: _write_lock.release())
+        raise
+    try:
+        yield
+    finally:
+        _write_lock.release()
+
+
+def insert_or_ignore(model, index_elements):
+    """INSERT that silently skips rows colliding with the unique index on index_elements.
+
+    PostgreSQL gets ON CONFLICT DO NOTHING. SQLite gets INSERT OR IGNORE as a
+    prefix on a plain insert(): SQLAlchemy 2.0's dialect insert() constructs
+    carry no cache key and are recompiled on every call, which is most of the
+    cost of a hot-path answer insert.
+    """
+    if async_engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    return insert(model).prefix_with("OR IGNORE", dialect="sqlite")
+
+
+# ═══════════════════════════════════════════
+# Ticket codes (services.ticket_codes)
+# ═══════════════════════════════════════════
+
+class TicketCodeSequence(Base):
+    """Single row: the next unreserved code sequence number, the permutation key and the QR signing secret"""
+    __tablename__ = "ticket_code_sequence"
+    
+    id = Column(Integer, primary_key=True)                 # always 1
+    key = Column(String(64), nullable=False)               # never changes once codes are issued
+    next_value = Column(BigInteger, nullable=False, default=0)
+    legacy_max_id = Column(Integer, nullable=False, default=0)  # tickets up to this id got random codes
+    qr_secret = Column(String(64), nullable=True)          # services.ticket_qr, unless TICKET_QR_SECRET is set
+
+
+TICKET_CODE_BLOCK = _env_int("TICKET_CODE_BLOCK", 100)
+
+ticket_codes = CodeAllocator()
+_ticket_codes_lock = threading.Lock()
+_ticket_codes_async_lock = asyncio.Lock()
+
+
+def _reserve_ticket_codes(connection, count: int):
+    """Reserve count sequence numbers for this process (run in its own transaction) and hand them to ticket_codes."""
+    table = TicketCodeSequence.__table__
+    connection.execute(update(table).where(table.c.id == 1).values(next_value=table.c.next_value + count))
+    row = connection.execute(select(table.c.next_value, table.c.key, table.c.legacy_max_id).where(table.c.id == 1)).one()
+    if row.next_value > CODE_SPACE:
+        raise RuntimeError(f"All {CODE_SPACE} ticket codes have been issued")
+    if not ticket_codes.ready:
+        legacy = connection.execute(select(Ticket.code).where(Ticket.id <= row.legacy_max_id)).scalars() if row.legacy_max_id else ()
+        ticket_codes.configure(row.key, frozenset(legacy))
+    ticket_codes.add_block(row.next_value - count, row.next_value)
+
+
+def allocate_ticket_codes(count: int = 1) -> list:
+    """count unique ticket codes; a new block is reserved only when this process's block runs out.
+
+    The reservation commits on its own connection, so call this before the
+    session has flushed writes of its own (SQLite would wait on itself).
+    """
+    with _ticket_codes_lock:
+        codes = ticket_codes.take(count) if ticket_codes.ready else []
+        while len(codes) < count:
+            with serialized_write():
+                with engine.begin() as conn:
+                    _reserve_ticket_codes(conn, max(TICKET_CODE_BLOCK, count - len(codes)))
+            codes += ticket_codes.take(count - len(codes))
+        return codes
+
+
+async def allocate_ticket_codes_async(count: int = 1) -> list:
+    """Async twin of allocate_ticket_codes()."""
+    async with _ticket_codes_async_lock:
+        codes = ticket_codes.take(count) if ticket_codes.ready else []
+        while len(codes) < count:
+            async with async_serialized_write():
+                async with async_engine.begin() as conn:
+                    await conn.run_sync(_reserve_ticket_codes, max(TICKET_CODE_BLOCK, count - len(codes)))
+            codes += ticket_codes.take(count - len(codes))
+        return codes
+
+
+# ═══════════════════════════════════════════
+# Dashboard counters and ticket history (routes/stats.py)
+# ═══════════════════════════════════════════
+
+class StatCounter(Base):
+    """Running total behind /api/stats/dashboard, updated in the same transaction as the rows it counts"""
+    __tablename__ = "stat_counters"
+    
+    key = Column(String(50), primary_key=True)             # tickets / status:<status> / type:<TYPE> / revenue / customers
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+REVENUE_STATUSES = ("approved", "activated")
+
+
+def _ticket_counts(status, ticket_type, price) -> dict:
+    """What one ticket adds to the counters; statuses and types compare case-insensitively, as the dashboard always did."""
+    counts = {"tickets": 1, f"type:{safe_value(ticket_type).upper()}": 1}
+    if status is not None:
+        status = safe_value(status).lower()
+        counts[f"status:{status}"] = 1
+        if status in REVENUE_STATUSES:
+            counts["revenue"] = price or 0
+    return counts
+
+
+def _add_counts(deltas: dict, counts: dict, sign: int):
+    for key, value in counts.items():
+        deltas[key] = deltas.get(key, 0) + sign * value
+
+
+_COUNTED_ATTRS = ("status", "ticket_type", "price")
+
+
+def _ticket_before(ticket, connection):
+    """(status, ticket_type, price) as last flushed; an attribute assigned without being loaded first is read back from the row."""
+    state = sa_inspect(ticket)
+    values = []
+    for name in _COUNTED_ATTRS:
+        history = state.attrs[name].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif not history.added:
+            values.append(getattr(ticket, name))
+        else:
+            row = connection.execute(
+                select(Ticket.status, Ticket.ticket_type, Ticket.price).where(Ticket.id == state.identity[0])
+            ).one()
+            return tuple(row)
+    return tuple(values)
+
+
+@event.listens_for(Session, "before_flush")
+def _count_flush(session, flush_context, instances):
+    """Apply what this flush adds, moves and removes to stat_counters, inside the flush's own transaction.
+
+    Every ticket and customer write goes through the ORM (sync and async
+    sessions alike), so the counters cannot miss a create, a status change
+    or a delete; a Core UPDATE/DELETE on tickets would bypass this and needs
+    rebuild_stat_counters() afterwards.
+    """
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, Ticket):
+            status = obj.status if obj.status is not None else TicketStatus.PENDING
+            _add_counts(deltas, _ticket_counts(status, obj.ticket_type, obj.price), 1)
+        elif isinstance(obj, Customer):
+            deltas["customers"] = deltas.get("customers", 0) + 1
+    for obj in session.dirty:
+        if isinstance(obj, Ticket) and session.is_modified(obj, include_collections=False):
+            state = sa_inspect(obj)
+            if not any(state.attrs[name].history.added for name in _COUNTED_ATTRS):
+                continue
+            _add_counts(deltas, _ticket_counts(*_ticket_before(obj, session.connection())), -1)
+            _add_counts(deltas, _ticket_counts(obj.status, obj.ticket_type, obj.price), 1)
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            _add_counts(deltas, _ticket_counts(*_ticket_before(obj, session.connection())), -1)
+        elif isinstance(obj, Customer):
+            deltas["customers"] = deltas.get("customers", 0) - 1
+    deltas = {key: value for key, value in deltas.items() if value}
+    if deltas:
+        _bump_counters(session.connection(), deltas)
+
+
+def _bump_counters(connection, deltas: dict):
+    table = StatCounter.__table__
+    for key in sorted(deltas):   # same lock order in every transaction
+        bump = update(table).where(table.c.key == key).values(value=table.c.value + deltas[key])
+        if connection.execute(bump).rowcount == 0:
+            connection.execute(insert_or_ignore(StatCounter, ["key"]).values(key=key, value=0))
+            connection.execute(bump)
+
+
+def count_stats(connection) -> dict:
+    """The counters recomputed from tickets and customers (one GROUP BY and one COUNT)."""
+    counts = {"tickets": 0, "revenue": 0}
+    rows = connection.execute(
+        select(Ticket.status, Ticket.ticket_type, func.count(Ticket.id), func.coalesce(func.sum(Ticket.price), 0))
+        .group_by(Ticket.status, Ticket.ticket_type)
+    ).all()
+    for status, ticket_type, count, price_sum in rows:
+        keys = _ticket_counts(status, ticket_type, 0)
+        for key in keys:
+            if key != "revenue":
+                counts[key] = counts.get(key, 0) + count
+        if "revenue" in keys:
+            counts["revenue"] += price_sum
+    counts["customers"] = connection.execute(select(func.count(Customer.id))).scalar() or 0
+    return counts
+
+
+def rebuild_stat_counters(connection) -> dict:
+    """Replace stat_counters with freshly counted values; run inside a transaction."""
+    connection.execute(delete(StatCounter.__table__))   # takes the write locks first, so the recount is not raced
+    counts = count_stats(connection)
+    connection.execute(insert(StatCounter.__table__), [{"key": key, "value": value} for key, value in counts.items()])
+    return counts
+
+
+class TicketEvent(Base):
+    """Append-only log of ticket transitions; outlives the ticket, so no foreign key"""
+    __tablename__ = "ticket_events"
+    __table_args__ = (
+        Index("ix_ticket_events_ticket", "ticket_id", "id"),
     )
-    return engine
+    
+    id = Column(Integer, primary_key=True, index=True)
+    ticket_id = Column(Integer, nullable=False)
+    event = Column(String(30), nullable=False)             # created / <new status> / hidden / unhidden / deleted
+    from_status = Column(String(30), nullable=True)
+    to_status = Column(String(30), nullable=True)
+    ticket_type = Column(String(20), nullable=True)
+    price = Column(Integer, nullable=True)
+    distributor_id = Column(Integer, nullable=True)
+    admin_id = Column(Integer, nullable=True)              # approved_by, on approved events
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class TicketRollup(Base):
+    """Hourly and daily totals of ticket_events per ticket type and distributor (read by /api/stats/timeseries)"""
+    __tablename__ = "ticket_rollups"
+    __table_args__ = (
+        UniqueConstraint("period", "bucket", "ticket_type", "distributor_id", name="uq_ticket_rollups_key"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String(5), nullable=False)             # hour / day
+    bucket = Column(DateTime, nullable=False)              # start of the hour/day, UTC
+    ticket_type = Column(String(20), nullable=False)       # upper-cased, as in stat_counters
+    distributor_id = Column(Integer, nullable=False, default=0)  # 0 = not sold by a distributor
+    bookings = Column(Integer, nullable=False, default=0)
+    approvals = Column(Integer, nullable=False, default=0)
+    activations = Column(Integer, nullable=False, default=0)
+    revenue = Column(BigInteger, nullable=False, default=0)  # net: price in on approval, out on rejection/deletion
+
+
+ROLLUP_PERIODS = ("hour", "day")
+ROLLUP_MEASURES = ("bookings", "approvals", "activations", "revenue")
+
+
+def rollup_bucket(period: str, at: datetime) -> datetime:
+    at = at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0) if period == "day" else at
+
+
+def _event_rollup(event, from_status, to_status, price) -> dict:
+    """What one event adds to its rollup rows."""
+    measures = {}
+    if event == "created":
+        measures["bookings"] = 1
+    if to_status != from_status:
+        if to_status == TicketStatus.APPROVED.value:
+            measures["approvals"] = 1
+        elif to_status == TicketStatus.ACTIVATED.value:
+            measures["activations"] = 1
+        earning, earned = to_status in REVENUE_STATUSES, from_status in REVENUE_STATUSES
+        if earning != earned and price:
+            measures["revenue"] = price if earning else -price
+    return measures
+
+
+def _status_or_none(status):
+    return safe_value(status).lower() if status is not None else None
+
+
+def _ticket_event(ticket, name, from_status, to_status) -> dict:
+    """A ticket_events row as of this flush; new tickets get their id in _write_ticket_events()."""
+    admin_id = ticket.approved_by if name == TicketStatus.APPROVED.value else None
+    return {
+        "ticket_id": ticket.id, "event": name, "from_status": from_status, "to_status": to_status,
+        "ticket_type": safe_value(ticket.ticket_type).upper(), "price": ticket.price,
+        "distributor_id": ticket.distributor_id, "admin_id": admin_id,
+    }
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_ticket_events(session, flush_context, instances):
+    """Note this flush's ticket transitions; _write_ticket_events() stores them once new tickets have ids."""
+    events = []
+    for obj in session.new:
+        if isinstance(obj, Ticket):
+            status = obj.status if obj.status is not None else TicketStatus.PENDING
+            events.append((obj, _ticket_event(obj, "created", None, _status_or_none(status))))
+    for obj in session.dirty:
+        if not isinstance(obj, Ticket):
+            continue
+        state = sa_inspect(obj)
+        if state.attrs.status.history.added:
+            before = _status_or_none(_ticket_before(obj, session.connection())[0])
+            after = _status_or_none(obj.status)
+            if before != after:
+                events.append((None, _ticket_event(obj, after, before, after)))
+        hidden = state.attrs.is_hidden.history
+        if hidden.added and not (hidden.deleted and bool(hidden.deleted[0]) == bool(hidden.added[0])):
+            status = _status_or_none(obj.status)
+            events.append((None, _ticket_event(obj, "hidden" if hidden.added[0] else "unhidden", status, status)))
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            status = _status_or_none(_ticket_before(obj, session.connection())[0])
+            events.append((None, _ticket_event(obj, "deleted", status, None)))
+    session.info["ticket_events"] = events
+
+
+@event.listens_for(Session, "after_flush")
+def _write_ticket_events(session, flush_context):
+    events = session.info.pop("ticket_events", None)
+    if not events:
+        return
+    now = datetime.utcnow()
+    rows = []
+    for new_ticket, row in events:
+        if new_ticket is not None:
+            row["ticket_id"] = new_ticket.id
+        row["created_at"] = now
+        rows.append(row)
+    connection = session.connection()
+    connection.execute(insert(TicketEvent.__table__), rows)
+    _bump_rollups(connection, _rollup_deltas(rows))
+
+
+def _rollup_deltas(events) -> dict:
+    """{(period, bucket, ticket_type, distributor_id): measures} for a batch of ticket_events rows."""
+    deltas = {}
+    for row in events:
+        measures = _event_rollup(row["event"], row["from_status"], row["to_status"], row["price"])
+        if not measures:
+            continue
+        for period in ROLLUP_PERIODS:
+            key = (period, rollup_bucket(period, row["created_at"]), row["ticket_type"], row["distributor_id"] or 0)
+            totals = deltas.setdefault(key, dict.fromkeys(ROLLUP_MEASURES, 0))
+            for name, value in measures.items():
+                totals[name] += value
+    return deltas
+
+
+def _bump_rollups(connection, deltas: dict):
+    table = TicketRollup.__table__
+    for key in sorted(deltas):
+        period, bucket, ticket_type, distributor_id = key
+        bump = update(table).where(
+            table.c.period == period, table.c.bucket == bucket,
+            table.c.ticket_type == ticket_type, table.c.distributor_id == distributor_id,
+        ).values({name: table.c[name] + value for name, value in deltas[key].items() if value})
+        if connection.execute(bump).rowcount == 0:
+            connection.execute(insert_or_ignore(TicketRollup, ["period", "bucket", "ticket_type", "distributor_id"]).values(
+                period=period, bucket=bucket, ticket_type=ticket_type, distributor_id=distributor_id,
+                **dict.fromkeys(ROLLUP_MEASURES, 0),
+            ))
+            connection.execute(bump)
+
+
+def rebuild_ticket_rollups(connection) -> int:
+    """Recompute ticket_rollups from ticket_events; run inside a transaction. Returns the number of rollup rows."""
+    table = TicketRollup.__table__
+    connection.execute(delete(table))
+    columns = TicketEvent.__table__.c
+    deltas = _rollup_deltas(row._mapping for row in connection.execute(select(
+        columns.event, columns.from_status, columns.to_status, columns.price,
+        columns.ticket_type, columns.distributor_id, columns.created_at,
+    )))
+    if deltas:
+        connection.execute(insert(table), [
+            dict(zip(("period", "bucket", "ticket_type", "distributor_id"), key), **measures)
+            for key, measures in deltas.items()
+        ])
+    return len(deltas)
+
+
+def backfill_ticket_events(connection) -> int:
+    """Seed ticket_events for tickets created before the log existed, from created_at / approved_at / updated_at.
+
+    The timestamps are the best the tickets record: approvals at approved_at,
+    activations at the last update. Returns the number of events written.
+    """
+    rows = []
+    tickets = connection.execute(select(
+        Ticket.id, Ticket.status, Ticket.ticket_type, Ticket.price, Ticket.distributor_id,
+        Ticket.approved_by, Ticket.created_at, Ticket.approved_at, Ticket.updated_at,
+    ))
+    for t in tickets:
+        status = _status_or_none(t.status)
+        common = {"ticket_id": t.id, "ticket_type": safe_value(t.ticket_type).upper(), "price": t.price,
+                  "distributor_id": t.distributor_id}
+        created_at = t.created_at or datetime.utcnow()
+        if status not in REVENUE_STATUSES:
+            rows.append(dict(common, event="created", from_status=None, to_status=status, admin_id=None, created_at=created_at))
+            continue
+        approved_at = t.approved_at or created_at
+        rows.append(dict(common, event="created", from_status=None, to_status="pending", admin_id=None, created_at=created_at))
+        rows.append(dict(common, event="approved", from_status="pending", to_status="approved", admin_id=t.approved_by,
+                         created_at=approved_at))
+        if status == TicketStatus.ACTIVATED.value:
+            rows.append(dict(common, event="activated", from_status="approved", to_status="activated", admin_id=None,
+                             created_at=max(t.updated_at or approved_at, approved_at)))
+    if rows:
+        connection.execute(insert(TicketEvent.__table__), rows)
+    return len(rows)
+
+
+# ═══════════════════════════════════════════
+# Gate check-in (POST /api/tickets/activate/batch)
+# ═══════════════════════════════════════════
+
+class GateScan(Base):
+    """A check-in scan synced from a gate's journal; the earliest scan of a ticket admitted it, later ones are duplicates"""
+    __tablename__ = "gate_scans"
+    __table_args__ = (
+        Index("ix_gate_scans_ticket_scanned", "ticket_id", "scanned_at", "id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    scan_id = Column(String(64), unique=True, nullable=False)   # chosen by the gate; a re-sent scan is ignored
+    gate_id = Column(String(50), nullable=False)
+    ticket_id = Column(Integer, ForeignKey("tickets.id"), nullable=False)
+    scanned_at = Column(DateTime, nullable=False)          # gate clock, UTC
+    received_at = Column(DateTime, default=datetime.utcnow)
 
 
 class CertificateLog(Base):
@@ -288,6 +882,67 @@ class ThankYouLog(Base):
     sent_at = Column(DateTime, default=datetime.utcnow)
 
 
+# ═══════════════════════════════════════════
+# Outbound WhatsApp queue (drained by routes/jobs.py)
+# ═══════════════════════════════════════════
+
+class OutboxStatus(str, enum.Enum):
+    QUEUED = "queued"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class OutboxJob(Base):
+    """One bulk send (campaign, quiz question, certificates...); progress is counted from its messages"""
+    __tablename__ = "outbox_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(30), nullable=False)              # engagement / quiz / certificates / thanks
+    description = Column(String(200), nullable=True)
+    idempotency_key = Column(String(100), unique=True, nullable=True)
+    total = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class OutboxMessage(Base):
+    """A single outbound message; survives restarts and is retried with backoff"""
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        Index("ix_outbox_messages_claim", "status", "instance", "priority", "next_attempt_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("outbox_jobs.id"), nullable=False, index=True)
+    idempotency_key = Column(String(150), unique=True, nullable=False)
+    kind = Column(String(30), nullable=False)              # handler name: text / image / link / certificate / thanks
+    phone = Column(String(20), nullable=False)
+    instance = Column(String(100), nullable=False, default="")  # Evolution instance (rate-limited separately)
+    priority = Column(Integer, default=0)                  # claimed highest first (services.outbox.PRIORITIES)
+    payload = Column(Text, nullable=True)                  # JSON
+    status = Column(String(20), default=OutboxStatus.QUEUED.value)  # queued / sending / sent / failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    
+    def get_payload(self) -> dict:
+        return json.loads(self.payload) if self.payload else {}
+
+
+class MediaAsset(Base):
+    """An image/document sent to many recipients, stored once in the blob store (routes/media.py)"""
+    __tablename__ = "media_assets"
+    
+    key = Column(String(64), primary_key=True)             # SHA-256 of the content (services.blob_store)
+    mime = Column(String(100), nullable=False)
+    size = Column(Integer, nullable=False)
+    filename = Column(String(200), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 # ═══════════════════════════════════════════
 # Logistics Coordinator Models (موظف لوجستيات التشغيل)
 # ═══════════════════════════════════════════
@@ -343,6 +998,7 @@ class VipGuest(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
     phone = Column(String(20), unique=True, nullable=False, index=True)
+    phone_normalized = Column(String(20), nullable=True, index=True)
     status = Column(String(20), default="invited")  # invited / will_attend / not_attending / inquiring / reacted / no_response
     previous_status = Column(String(20), nullable=True)
     changed_mind = Column(Boolean, default=False)
@@ -371,8 +1027,43 @@ class LogisticsSettings(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+
+# ── Normalized phone columns ──
+# Kept in step by attribute events, so every ORM write (constructor or
+# assignment) fills them; rows written any other way are backfilled by init_db.
+NORMALIZED_PHONES = (
+    (Customer, "phone", "phone_normalized"),
+    (Ticket, "guest_phone", "guest_phone_normalized"),
+    (VipGuest, "phone", "phone_normalized"),
+)
+
+
+def _keep_normalized(model, source, target):
+    @event.listens_for(getattr(model, source), "set")
+    def _normalize(obj, value, oldvalue, initiator):
+        setattr(obj, target, normalize_phone(value) if value else None)
+
+
+for _model, _source, _target in NORMALIZED_PHONES:
+    _keep_normalized(_model, _source, _target)
+
+
+def _backfill_normalized_phones(conn) -> int:
+    filled = 0
+    for model, source, target in NORMALIZED_PHONES:
+        table = model.__table__
+        rows = conn.execute(select(table.c.id, table.c[source]).where(
+            table.c[target].is_(None), table.c[source].isnot(None)
+        )).all()
+        if rows:
+            conn.execute(
+                update(table).where(table.c.id == bindparam("row_id")).values({target: bindparam("normalized")}),
+                [{"row_id": row_id, "normalized": normalize_phone(phone)} for row_id, phone in rows],
+            )
+            filled += len(rows)
+    return filled
+
 def init_db():
-    engine = create_db_engine()
     Base.metadata.create_all(bind=engine)
     
     # Auto-migration: Add missing columns to existing tables
@@ -403,6 +1094,53 @@ def init_db():
                 conn.execute(text("ALTER TABLE tickets ADD COLUMN guest_name TEXT"))
             if 'guest_phone' not in columns:
                 conn.execute(text("ALTER TABLE tickets ADD COLUMN guest_phone TEXT"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tickets_created_at_id ON tickets (created_at, id)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tickets_customer_id ON tickets (customer_id)"))
+            conn.commit()
+
+    # Leaderboard indexes on existing tables (create_all only covers new tables)
+    with engine.connect() as conn:
+        if 'answers' in inspector.get_table_names():
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_answers_ticket_points ON answers (ticket_id, points_earned, is_correct)"))
+            # The unique index is what makes repeat answers no-ops (insert_or_ignore), so it must exist:
+            # legacy duplicates are dropped first, keeping each guest's first answer (lowest id)
+            unique = [index['name'] for index in inspector.get_indexes('answers')] + \
+                     [constraint['name'] for constraint in inspector.get_unique_constraints('answers')]
+            if 'uq_answers_question_ticket' not in unique:
+                removed = conn.execute(text(
+                    "DELETE FROM answers WHERE id NOT IN (SELECT MIN(id) FROM answers GROUP BY question_id, ticket_id)"
+                )).rowcount
+                if removed:
+                    print(f"⚠️ Removed {removed} duplicate (question_id, ticket_id) answers, keeping the first of each")
+                conn.execute(text("CREATE UNIQUE INDEX uq_answers_question_ticket ON answers (question_id, ticket_id)"))
+        if 'quiz_group_members' in inspector.get_table_names():
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_quiz_group_members_group_ticket ON quiz_group_members (group_id, ticket_id)"))
+        conn.commit()
+
+    # Payment proof blob references (services.blob_store)
+    for table in ('tickets', 'ticket_drafts'):
+        if table in inspector.get_table_names():
+            columns = [col['name'] for col in inspector.get_columns(table)]
+            with engine.connect() as conn:
+                if 'payment_proof_key' not in columns:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN payment_proof_key VARCHAR(64)"))
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_payment_proof_key ON {table} (payment_proof_key)"))
+                if 'payment_proof_size' not in columns:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN payment_proof_size INTEGER"))
+                if 'payment_proof_mime' not in columns:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN payment_proof_mime VARCHAR(50)"))
+                conn.commit()
+
+    # Outbox scheduling columns (per-instance rate limit, job priority)
+    if 'outbox_messages' in inspector.get_table_names():
+        columns = [col['name'] for col in inspector.get_columns('outbox_messages')]
+        with engine.connect() as conn:
+            if 'instance' not in columns:
+                conn.execute(text("ALTER TABLE outbox_messages ADD COLUMN instance VARCHAR(100) NOT NULL DEFAULT ''"))
+            if 'priority' not in columns:
+                conn.execute(text("ALTER TABLE outbox_messages ADD COLUMN priority INTEGER DEFAULT 0"))
+            conn.execute(text("DROP INDEX IF EXISTS ix_outbox_messages_due"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_outbox_messages_claim ON outbox_messages (status, instance, priority, next_attempt_at)"))
             conn.commit()
 
     # Fix vip_guests table — add missing columns
@@ -435,10 +1173,111 @@ def init_db():
             VipSettings.__table__.create(engine)
             print("✅ vip_settings table recreated with correct schema")
 
+    # Normalized phone columns (services.phones): added, indexed and filled in for existing rows
+    for table, column in (('customers', 'phone_normalized'), ('tickets', 'guest_phone_normalized'), ('vip_guests', 'phone_normalized')):
+        if table in inspector.get_table_names():
+            columns = [col['name'] for col in inspector.get_columns(table)]
+            with engine.connect() as conn:
+                if column not in columns:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} VARCHAR(20)"))
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"))
+                conn.commit()
+    with engine.begin() as conn:
+        filled = _backfill_normalized_phones(conn)
+        if filled:
+            print(f"📞 Normalized {filled} stored phone numbers")
+
+    # Ticket code sequence: created once; tickets that exist by then keep their random codes
+    with engine.connect() as conn:
+        if 'qr_secret' not in [col['name'] for col in inspector.get_columns('ticket_code_sequence')]:
+            conn.execute(text("ALTER TABLE ticket_code_sequence ADD COLUMN qr_secret VARCHAR(64)"))
+            conn.commit()
+    with engine.begin() as conn:
+        if conn.execute(select(TicketCodeSequence.id)).first() is None:
+            conn.execute(insert_or_ignore(TicketCodeSequence, ["id"]).values(
+                id=1, key=secrets.token_hex(16), next_value=0,
+                legacy_max_id=conn.execute(select(func.max(Ticket.id))).scalar() or 0,
+            ))
+        # QR signing secret (services.ticket_qr): generated once, kept with the sequence
+        table = TicketCodeSequence.__table__
+        conn.execute(update(table).where(table.c.id == 1, table.c.qr_secret.is_(None)).values(qr_secret=secrets.token_hex(32)))
+        if not ticket_qr.ready:
+            ticket_qr.configure(conn.execute(select(table.c.qr_secret).where(table.c.id == 1)).scalar_one())
+
+    # Dashboard counters: recounted on every start, so edits made outside the app are picked up
+    with engine.begin() as conn:
+        rebuild_stat_counters(conn)
+
+    # Ticket history: seed the event log once for tickets that predate it, then their rollups
+    with engine.begin() as conn:
+        if conn.execute(select(TicketEvent.id).limit(1)).first() is None:
+            backfilled = backfill_ticket_events(conn)
+            if backfilled:
+                rebuild_ticket_rollups(conn)
+                print(f"📈 Backfilled {backfilled} ticket events and their hourly/daily rollups")
+
     return engine
 
 
 def get_session():
-    engine = create_db_engine()
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    """Return a new Session from the shared factory (caller closes it)."""
     return SessionLocal()
+
+
+@contextmanager
+def session_scope():
+    """Session context manager: commits on success, rolls back on error.
+
+        with session_scope() as session:
+            session.add(obj)
+    """
+    session = SessionLocal()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def get_db():
+    """FastAPI dependency yielding a session that is closed after the request.
+
+        @router.get("/")
+        def handler(session: Session = Depends(get_db)): ...
+    """
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def get_async_session():
+    """Return a new AsyncSession from the shared factory (caller awaits close())."""
+    return AsyncSessionLocal()
+
+
+@asynccontextmanager
+async def async_session_scope():
+    """Async session context manager: commits on success, rolls back on error."""
+    session = AsyncSessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+async def get_async_db():
+    """FastAPI dependency yielding an AsyncSession closed after the request."""
+    session = AsyncSessionLocal()
+    try:
+        yield session
+    finally:
+        await session.close()
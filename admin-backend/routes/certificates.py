@@ -1,35 +1,43 @@
 """
 Certificates & Thank You API Routes
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import select
 from typing import Optional, List
 from datetime import datetime
 import base64
+import json
 import logging
 import asyncio
-import random
+import zipfile
 
-from models import get_session, CertificateLog, ThankYouLog
-from services.certificate_generator import generate_certificate_pdf
+from models import (
+    get_session, get_async_session, async_serialized_write, CertificateLog, ThankYouLog,
+    OutboxMessage, OutboxStatus,
+)
+from services.certificate_generator import generate_certificate_pdf, warm_up as warm_up_certificates
+from services.render_pool import render_pool, RenderAhead, WORKERS as RENDER_WORKERS
 from services.whatsapp_service import WhatsAppService
+from routes.jobs import enqueue_job, register_handler
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 whatsapp = WhatsAppService()
 
-# ── Batch sending configuration (same as engagement) ──
-BATCH_SIZE = 25
-DELAY_MIN = 3.0
-DELAY_MAX = 8.0
-BATCH_PAUSE_MIN = 60.0
-BATCH_PAUSE_MAX = 90.0
-
+# Certificates queued for sending are rendered ahead of the send schedule in the process pool
+render_pool.add_warmup(warm_up_certificates)
+certificate_renders = RenderAhead(render_pool, generate_certificate_pdf)
 
 class SendCertificatesRequest(BaseModel):
     ticket_ids: List[int]
 
 
+class ExportCertificatesRequest(BaseModel):
+    ticket_ids: List[int] = []   # empty = everyone
+
+
 class SendThanksRequest(BaseModel):
     ticket_ids: List[int]
     message: str
@@ -38,21 +46,27 @@ class SendThanksRequest(BaseModel):
 @router.get("/participants")
 async def get_participants(sort_by: str = "points"):
     """Get all approved ticket holders with their quiz scores and ranking"""
-    session = get_session()
+    session = get_async_session()
     try:
         from models import Ticket, Customer, Answer
-        from sqlalchemy import func, Integer as SAInteger
+        from sqlalchemy import func, select, Integer as SAInteger
         
-        # Get all approved tickets
-        tickets = session.query(Ticket).filter(Ticket.status == 'approved').all()
+        # Get all approved tickets (only the columns the list shows)
+        tickets = (await session.execute(
+            select(
+                Ticket.id, Ticket.guest_name, Ticket.guest_phone, Ticket.ticket_type,
+                Customer.id.label("customer_id"), Customer.name.label("customer_name"),
+                Customer.phone.label("customer_phone"),
+            ).outerjoin(Customer, Ticket.customer_id == Customer.id).where(Ticket.status == 'approved')
+        )).all()
         
         # Get quiz scores per ticket
-        score_query = session.query(
+        score_query = (await session.execute(select(
             Answer.ticket_id,
             func.sum(Answer.points_earned).label("total_points"),
             func.count(Answer.id).label("total_answers"),
             func.sum(func.cast(Answer.is_correct, SAInteger)).label("correct_answers"),
-        ).group_by(Answer.ticket_id).all()
+        ).group_by(Answer.ticket_id))).all()
         
         score_map = {}
         for row in score_query:
@@ -64,12 +78,12 @@ async def get_participants(sort_by: str = "points"):
         
         participants = []
         for t in tickets:
-            customer = t.customer
+            has_customer = t.customer_id is not None
             scores = score_map.get(t.id, {"total_points": 0, "total_answers": 0, "correct_answers": 0})
             participants.append({
                 "ticket_id": t.id,
-                "guest_name": t.guest_name or (customer.name if customer else "—"),
-                "phone": customer.phone if customer else (t.guest_phone or "—"),
+                "guest_name": t.guest_name or (t.customer_name if has_customer else "—"),
+                "phone": t.customer_phone if has_customer else (t.guest_phone or "—"),
                 "ticket_type": t.ticket_type or "—",
                 "total_points": scores["total_points"],
                 "total_answers": scores["total_answers"],
@@ -102,7 +116,7 @@ async def get_participants(sort_by: str = "points"):
         logger.error(f"Error fetching participants: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 @router.get("/preview/{ticket_id}")
@@ -118,8 +132,9 @@ async def preview_certificate(ticket_id: int):
         if not participant:
             raise HTTPException(status_code=404, detail="المشارك غير موجود")
         
-        # Generate PDF
-        pdf_bytes = generate_certificate_pdf(
+        # Generate PDF (in the render pool, off the event loop)
+        pdf_bytes = await render_pool.run(
+            generate_certificate_pdf,
             guest_name=participant["guest_name"],
             total_points=participant["total_points"],
             rank=participant["rank"],
@@ -141,13 +156,94 @@ async def preview_certificate(ticket_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ── Outbox handlers: certificates are rendered ahead of their send, each send is logged once ──
+
+def _certificate_args(payload: dict) -> dict:
+    return {
+        "guest_name": payload["guest_name"],
+        "total_points": payload["total_points"],
+        "rank": payload["rank"],
+        "total_participants": payload["total_participants"],
+    }
+
+
+async def prefetch_certificates(job_id: Optional[int] = None):
+    """Start rendering queued certificates in send order (all jobs on startup, or one new job)."""
+    session = get_async_session()
+    try:
+        query = select(OutboxMessage.payload).where(
+            OutboxMessage.kind == "certificate",
+            OutboxMessage.status == OutboxStatus.QUEUED.value,
+        ).order_by(OutboxMessage.priority.desc(), OutboxMessage.id)
+        if job_id is not None:
+            query = query.where(OutboxMessage.job_id == job_id)
+        payloads = (await session.execute(query)).scalars().all()
+    finally:
+        await session.close()
+    if payloads:
+        certificate_renders.prefetch(_certificate_args(json.loads(p)) for p in payloads)
+
+
+async def _send_certificate(phone: str, payload: dict, instance: str):
+    pdf_bytes = await certificate_renders.take(_certificate_args(payload))
+    # Raw base64 (Evolution API needs plain base64, NOT data URI)
+    pdf_base64 = base64.b64encode(pdf_bytes).decode()
+    return await whatsapp.send_certificate(
+        phone=phone,
+        pdf_base64=pdf_base64,
+        guest_name=payload["guest_name"],
+        rank=payload["rank"],
+        instance=instance,
+    )
+
+
+async def _log_certificate(message, payload: dict, sent: bool, error: Optional[str]):
+    session = get_async_session()
+    try:
+        async with async_serialized_write():
+            session.add(CertificateLog(
+                ticket_id=payload["ticket_id"],
+                guest_name=payload["guest_name"],
+                phone=message.phone,
+                total_points=payload["total_points"],
+                rank=payload["rank"],
+                status="sent" if sent else "failed",
+                error_message=error
+            ))
+            await session.commit()
+    finally:
+        await session.close()
+
+
+async def _send_thanks_message(phone: str, payload: dict, instance: str):
+    return await whatsapp.send_message(phone=phone, message=payload["text"], instance=instance)
+
+
+async def _log_thanks(message, payload: dict, sent: bool, error: Optional[str]):
+    session = get_async_session()
+    try:
+        async with async_serialized_write():
+            session.add(ThankYouLog(
+                ticket_id=payload["ticket_id"],
+                guest_name=payload["guest_name"],
+                phone=message.phone,
+                message_text=payload["text"],
+                status="sent" if sent else "failed",
+                error_message=error
+            ))
+            await session.commit()
+    finally:
+        await session.close()
+
+
+register_handler("certificate", _send_certificate, on_finished=_log_certificate)
+register_handler("thanks", _send_thanks_message, on_finished=_log_thanks)
+
+
 @router.post("/send-certificates")
-async def send_certificates(req: SendCertificatesRequest):
-    """Generate and send certificate PDFs via WhatsApp for selected participants"""
-    session = get_session()
+async def send_certificates(req: SendCertificatesRequest, idempotency_key: Optional[str] = Header(None)):
+    """Queue certificate PDFs for selected participants; the outbox renders and sends them"""
     try:
-        from sqlalchemy import text
-        
         # Get participant data
         participants_resp = await get_participants(sort_by="points")
         all_participants = participants_resp["participants"]
@@ -159,111 +255,110 @@ async def send_certificates(req: SendCertificatesRequest):
         if not selected:
             raise HTTPException(status_code=400, detail="لم يتم العثور على مشاركين")
         
-        results = []
-        for p in selected:
-            try:
-                # Generate PDF
-                logger.info(f"Generating certificate PDF for {p['guest_name']}")
-                pdf_bytes = generate_certificate_pdf(
-                    guest_name=p["guest_name"],
-                    total_points=p["total_points"],
-                    rank=p["rank"],
-                    total_participants=total_count
-                )
-                logger.info(f"PDF generated successfully, size: {len(pdf_bytes)} bytes")
-                
-                # Convert to base64
-                # Convert to raw base64 (Evolution API needs plain base64, NOT data URI)
-                pdf_base64 = base64.b64encode(pdf_bytes).decode()
-                logger.info(f"Base64 encoded, total length: {len(pdf_base64)}")
-                
-                # Send via WhatsApp
-                wa_result = await whatsapp.send_certificate(
-                    phone=p["phone"],
-                    pdf_base64=pdf_base64,
-                    guest_name=p["guest_name"],
-                    rank=p["rank"]
-                )
-                
-                status = "sent" if wa_result else "failed"
-                error_msg = None if wa_result else "فشل إرسال الواتساب"
-                logger.info(f"Certificate send result for {p['guest_name']}: {status}")
-                
-                # Log to DB
-                log = CertificateLog(
-                    ticket_id=p["ticket_id"],
-                    guest_name=p["guest_name"],
-                    phone=p["phone"],
-                    total_points=p["total_points"],
-                    rank=p["rank"],
-                    status=status,
-                    error_message=error_msg
-                )
-                session.add(log)
-                
-                results.append({
-                    "ticket_id": p["ticket_id"],
-                    "guest_name": p["guest_name"],
-                    "status": status
-                })
-                
-            except Exception as e:
-                logger.error(f"Error processing certificate for {p['guest_name']}: {e}")
-                log = CertificateLog(
-                    ticket_id=p["ticket_id"],
-                    guest_name=p["guest_name"],
-                    phone=p["phone"],
-                    total_points=p["total_points"],
-                    rank=p["rank"],
-                    status="failed",
-                    error_message=str(e)
-                )
-                session.add(log)
-                results.append({
-                    "ticket_id": p["ticket_id"],
-                    "guest_name": p["guest_name"],
-                    "status": "failed",
-                    "error": str(e)
-                })
-            
-            # Anti-ban delay (skip after last message)
-            idx = selected.index(p)
-            if idx < len(selected) - 1:
-                if (idx + 1) % BATCH_SIZE == 0:
-                    pause = random.uniform(BATCH_PAUSE_MIN, BATCH_PAUSE_MAX)
-                    logger.info(f"⏸️ Certificate batch {(idx+1)//BATCH_SIZE} done. Pausing {pause:.0f}s...")
-                    await asyncio.sleep(pause)
-                else:
-                    delay = random.uniform(DELAY_MIN, DELAY_MAX)
-                    logger.info(f"⏳ Waiting {delay:.1f}s before next certificate...")
-                    await asyncio.sleep(delay)
-        
-        session.commit()
+        job_id = await enqueue_job("certificates", [{
+            "phone": p["phone"],
+            "key": f"{p['phone']}:{p['ticket_id']}",   # one per ticket, not per phone
+            "kind": "certificate",
+            "payload": {
+                "ticket_id": p["ticket_id"],
+                "guest_name": p["guest_name"],
+                "total_points": p["total_points"],
+                "rank": p["rank"],
+                "total_participants": total_count,
+            },
+        } for p in selected], description=f"{len(selected)} شهادة", idempotency_key=idempotency_key)
+        await prefetch_certificates(job_id)
         
-        sent_count = sum(1 for r in results if r["status"] == "sent")
         return {
             "success": True,
-            "message": f"تم إرسال {sent_count} شهادة من {len(results)}",
-            "results": results
+            "message": f"تم بدء إرسال {len(selected)} شهادة (مع تأخير لحماية الرقم)",
+            "queued": len(selected),
+            "job_id": job_id,
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        session.rollback()
         logger.error(f"Error sending certificates: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+class _ZipSink:
+    """Write-only buffer for zipfile; the export drains it after each certificate."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+async def _certificate_zip(selected: list, total_count: int):
+    """Yield ZIP bytes as certificates finish rendering (completion order, a pool-sized window in flight)."""
+    sink = _ZipSink()
+    queue = iter(selected)
+    pending = {}
+    failed = []
+
+    def submit():
+        for p in queue:
+            task = asyncio.ensure_future(render_pool.run(generate_certificate_pdf, **_certificate_args(
+                {**p, "total_participants": total_count})))
+            pending[task] = p
+            if len(pending) >= RENDER_WORKERS * 2:
+                return
+
+    try:
+        # PDFs are already compressed; storing them lets each entry go out as soon as it is rendered
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+            submit()
+            while pending:
+                done, _ = await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    p = pending.pop(task)
+                    try:
+                        archive.writestr(f"BeStarCertificate_{p['rank']:04d}_{p['ticket_id']}.pdf", task.result())
+                    except Exception as e:
+                        logger.error(f"Certificate export: ticket {p['ticket_id']} failed: {e}")
+                        failed.append(f"{p['ticket_id']}\t{p['guest_name']}\t{e}")
+                submit()
+                yield sink.drain()
+            if failed:
+                archive.writestr("errors.txt", "\n".join(failed))
+        yield sink.drain()
     finally:
-        session.close()
+        for task in pending:
+            task.cancel()
+
+
+@router.post("/export")
+async def export_certificates(req: ExportCertificatesRequest):
+    """Download certificates as one ZIP, streamed while the render pool works through them"""
+    participants_resp = await get_participants(sort_by="points")
+    all_participants = participants_resp["participants"]
+    selected = [p for p in all_participants if p["ticket_id"] in req.ticket_ids] if req.ticket_ids else all_participants
+    if not selected:
+        raise HTTPException(status_code=400, detail="لم يتم العثور على مشاركين")
+    return StreamingResponse(
+        _certificate_zip(selected, participants_resp["total_participants"]),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="BeStarCertificates.zip"'},
+    )
 
 
 @router.post("/send-thanks")
-async def send_thanks(req: SendThanksRequest):
-    """Send thank you messages via WhatsApp to selected participants"""
-    session = get_session()
+async def send_thanks(req: SendThanksRequest, idempotency_key: Optional[str] = Header(None)):
+    """Queue thank you messages for selected participants"""
     try:
-        from sqlalchemy import text
-        
         # Get participant data
         participants_resp = await get_participants(sort_by="points")
         all_participants = participants_resp["participants"]
@@ -273,86 +368,29 @@ async def send_thanks(req: SendThanksRequest):
         if not selected:
             raise HTTPException(status_code=400, detail="لم يتم العثور على مشاركين")
         
-        results = []
+        messages = []
         for p in selected:
-            try:
-                # Personalize message
-                personalized = req.message.replace("{name}", p["guest_name"] or "")
-                personalized = personalized.replace("{points}", str(p["total_points"]))
-                personalized = personalized.replace("{rank}", str(p.get("rank", "")))
-                
-                # Send via WhatsApp
-                wa_result = await whatsapp.send_message(
-                    phone=p["phone"],
-                    message=personalized
-                )
-                
-                status = "sent" if wa_result else "failed"
-                error_msg = None if wa_result else "فشل إرسال الواتساب"
-                
-                # Log to DB
-                log = ThankYouLog(
-                    ticket_id=p["ticket_id"],
-                    guest_name=p["guest_name"],
-                    phone=p["phone"],
-                    message_text=personalized,
-                    status=status,
-                    error_message=error_msg
-                )
-                session.add(log)
-                
-                results.append({
-                    "ticket_id": p["ticket_id"],
-                    "guest_name": p["guest_name"],
-                    "status": status
-                })
-                
-            except Exception as e:
-                logger.error(f"Error sending thanks to {p['guest_name']}: {e}")
-                log = ThankYouLog(
-                    ticket_id=p["ticket_id"],
-                    guest_name=p["guest_name"],
-                    phone=p["phone"],
-                    message_text=req.message,
-                    status="failed",
-                    error_message=str(e)
-                )
-                session.add(log)
-                results.append({
-                    "ticket_id": p["ticket_id"],
-                    "guest_name": p["guest_name"],
-                    "status": "failed"
-                })
-            
-            # Anti-ban delay (skip after last message)
-            idx = selected.index(p)
-            if idx < len(selected) - 1:
-                if (idx + 1) % BATCH_SIZE == 0:
-                    pause = random.uniform(BATCH_PAUSE_MIN, BATCH_PAUSE_MAX)
-                    logger.info(f"⏸️ Thanks batch {(idx+1)//BATCH_SIZE} done. Pausing {pause:.0f}s...")
-                    await asyncio.sleep(pause)
-                else:
-                    delay = random.uniform(DELAY_MIN, DELAY_MAX)
-                    logger.info(f"⏳ Waiting {delay:.1f}s before next thanks msg...")
-                    await asyncio.sleep(delay)
+            # Personalize message
+            personalized = req.message.replace("{name}", p["guest_name"] or "")
+            personalized = personalized.replace("{points}", str(p["total_points"]))
+            personalized = personalized.replace("{rank}", str(p.get("rank", "")))
+            messages.append({"phone": p["phone"], "key": f"{p['phone']}:{p['ticket_id']}", "kind": "thanks",
+                             "payload": {"ticket_id": p["ticket_id"], "guest_name": p["guest_name"], "text": personalized}})
         
-        session.commit()
+        job_id = await enqueue_job("thanks", messages, description=req.message[:80], idempotency_key=idempotency_key)
         
-        sent_count = sum(1 for r in results if r["status"] == "sent")
         return {
             "success": True,
-            "message": f"تم إرسال {sent_count} رسالة من {len(results)}",
-            "results": results
+            "message": f"تم بدء إرسال {len(messages)} رسالة (مع تأخير لحماية الرقم)",
+            "queued": len(messages),
+            "job_id": job_id,
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        session.rollback()
         logger.error(f"Error sending thanks: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 
 @router.get("/logs/certificates")
@@ -2,20 +2,20 @@
 Be Star - Live Engagement Agent API
 Manage real-time engagement with event attendees
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Header, UploadFile, File, Form
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import base64
 import logging
 import asyncio
-import random
 
-from models import get_session, Ticket, TicketStatus, Customer, safe_value
-from sqlalchemy import func
-
-# WhatsApp Service
-from services.whatsapp_service import WhatsAppService
-whatsapp_service = WhatsAppService()
+from models import get_async_session, Ticket, TicketStatus, Customer, safe_value
+from sqlalchemy import func, select
+from services.pagination import clamp_limit, keyset_page, next_cursor
+from services.leaderboard import quiz_leaderboard
+from services.quiz_cache import quiz_cache
+from routes.jobs import enqueue_job
+from routes.media import register_base64_media
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -40,101 +40,104 @@ class BulkActionRequest(BaseModel):
 
 # ============ Endpoints ============
 
+def _attendee_columns():
+    """Columns the attendee lists need; customer is outer-joined as in the old lazy load."""
+    return select(
+        Ticket.id, Ticket.code, Ticket.ticket_type, Ticket.status, Ticket.guest_name,
+        Ticket.guest_phone, Ticket.created_at, Customer.id.label("customer_id"),
+        Customer.name.label("customer_name"), Customer.phone.label("customer_phone"),
+        Customer.email.label("customer_email"),
+    ).outerjoin(Customer, Ticket.customer_id == Customer.id)
+
+
+def _attendee_row(t) -> dict:
+    has_customer = t.customer_id is not None
+    return {
+        "id": t.id,
+        "code": t.code,
+        "guest_name": t.guest_name or (t.customer_name if has_customer else "—"),
+        "phone": t.customer_phone if has_customer else (t.guest_phone or "—"),
+        "email": t.customer_email if has_customer else "—",
+        "ticket_type": safe_value(t.ticket_type),
+        "status": safe_value(t.status),
+    }
+
+
 @router.get("/attendees")
-async def get_attendees():
-    """Get all approved/activated ticket holders (not hidden)"""
-    session = get_session()
+async def get_attendees(limit: Optional[int] = None, cursor: Optional[str] = None):
+    """Get all approved/activated ticket holders (not hidden), newest first, keyset-paginated"""
+    limit = clamp_limit(limit)
+    session = get_async_session()
     try:
-        tickets = session.query(Ticket).filter(
+        query = _attendee_columns().where(
             func.lower(Ticket.status) == 'approved',
             Ticket.is_hidden == False
-        ).order_by(Ticket.created_at.desc()).all()
+        )
+        try:
+            query = keyset_page(query, Ticket.created_at, Ticket.id, cursor, limit)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="cursor غير صالح")
+        rows = (await session.execute(query)).all()
+        next_page = next_cursor(rows, limit)
 
         results = []
-        for t in tickets:
+        for t in rows:
             try:
-                customer = t.customer
-                ticket_type = safe_value(t.ticket_type)
-                status = safe_value(t.status)
-                
-                results.append({
-                    "id": t.id,
-                    "code": t.code,
-                    "guest_name": t.guest_name or (customer.name if customer else "—"),
-                    "phone": customer.phone if customer else (t.guest_phone or "—"),
-                    "email": customer.email if customer else "—",
-                    "ticket_type": ticket_type,
-                    "status": status,
-                    "created_at": t.created_at.isoformat() if t.created_at else None
-                })
+                row = _attendee_row(t)
+                row["created_at"] = t.created_at.isoformat() if t.created_at else None
+                results.append(row)
             except Exception:
                 continue
         
-        return {"attendees": results, "count": len(results)}
+        return {"attendees": results, "count": len(results), "next_cursor": next_page}
     finally:
-        session.close()
+        await session.close()
 
 
 @router.get("/hidden")
-async def get_hidden_attendees():
+async def get_hidden_attendees(limit: Optional[int] = None):
     """Get all hidden attendees"""
-    session = get_session()
+    session = get_async_session()
     try:
-        tickets = session.query(Ticket).filter(
-            Ticket.is_hidden == True
-        ).order_by(Ticket.updated_at.desc()).all()
+        rows = (await session.execute(
+            _attendee_columns().where(
+                Ticket.is_hidden == True
+            ).order_by(Ticket.updated_at.desc()).limit(clamp_limit(limit))
+        )).all()
 
         results = []
-        for t in tickets:
+        for t in rows:
             try:
-                customer = t.customer
-                ticket_type = safe_value(t.ticket_type)
-                status = safe_value(t.status)
-                
-                results.append({
-                    "id": t.id,
-                    "code": t.code,
-                    "guest_name": t.guest_name or (customer.name if customer else "—"),
-                    "phone": customer.phone if customer else (t.guest_phone or "—"),
-                    "email": customer.email if customer else "—",
-                    "ticket_type": ticket_type,
-                    "status": status
-                })
+                results.append(_attendee_row(t))
             except Exception:
                 continue
         
         return {"hidden": results, "count": len(results)}
     finally:
-        session.close()
-
-
-# ── Batch sending configuration ──
-BATCH_SIZE = 25           # messages per batch
-DELAY_MIN = 3.0           # min seconds between messages
-DELAY_MAX = 8.0           # max seconds between messages
-BATCH_PAUSE_MIN = 60.0    # min seconds between batches
-BATCH_PAUSE_MAX = 90.0    # max seconds between batches
+        await session.close()
 
 
-def _get_attendee_info(attendee_ids: List[int]) -> Dict[str, dict]:
+async def _get_attendee_info(attendee_ids: List[int]) -> Dict[str, dict]:
     """Look up guest_name and code for each attendee ticket, keyed by phone."""
     if not attendee_ids:
         return {}
-    session = get_session()
+    session = get_async_session()
     try:
-        tickets = session.query(Ticket).filter(Ticket.id.in_(attendee_ids)).all()
+        rows = (await session.execute(
+            _attendee_columns().where(Ticket.id.in_(attendee_ids))
+        )).all()
         info = {}
-        for t in tickets:
-            customer = t.customer
-            phone = customer.phone if customer else (t.guest_phone or "")
+        for t in rows:
+            has_customer = t.customer_id is not None
+            phone = t.customer_phone if has_customer else (t.guest_phone or "")
             if phone:
                 info[phone] = {
-                    "guest_name": t.guest_name or (customer.name if customer else ""),
+                    "guest_name": t.guest_name or (t.customer_name if has_customer else ""),
                     "code": t.code or "",
                 }
         return info
     finally:
-        session.close()
+        await session.close()
 
 
 def _build_message(request: BulkSendRequest, phone: str, attendee_info: Dict[str, dict]) -> str:
@@ -166,147 +169,130 @@ def _build_message(request: BulkSendRequest, phone: str, attendee_info: Dict[str
     return msg
 
 
-async def _send_bulk_messages(request: BulkSendRequest, attendee_info: Dict[str, dict]):
-    """
-    Send messages one-by-one with random delay.
-    Every BATCH_SIZE messages, pause for a longer break.
-    """
-    total = len(request.phones)
-    sent = 0
-    failed = 0
-
-    for i, phone in enumerate(request.phones):
-        try:
-            if request.type == "text":
-                msg = _build_message(request, phone, attendee_info)
-                await whatsapp_service.send_message(phone, msg)
-
-            elif request.type == "image":
-                caption = request.caption or ""
-                info = attendee_info.get(phone)
-                if info:
-                    name = info.get("guest_name", "")
-                    code = info.get("code", "")
-                    if name or code:
-                        extra = f"\n👤 {name}" if name else ""
-                        extra += f" | 🎫 {code}" if code else ""
-                        caption = (caption + extra) if caption else extra.strip()
-                await whatsapp_service.send_image(phone, request.content, caption)
-
-            elif request.type == "invitation":
-                msg = _build_message(request, phone, attendee_info)
-                await whatsapp_service.send_message(phone, msg)
-
-            elif request.type == "link":
-                await whatsapp_service.send_link(
-                    phone,
-                    request.url or request.content,
-                    request.title or "",
-                    request.description or ""
-                )
-
-            sent += 1
-            logger.info(f"✅ Sent {i+1}/{total} to {phone}")
-        except Exception as e:
-            failed += 1
-            logger.error(f"❌ Failed {i+1}/{total} to {phone}: {e}")
-
-        # Delay logic (skip after last message)
-        if i < total - 1:
-            # Check if we just finished a batch
-            if (i + 1) % BATCH_SIZE == 0:
-                pause = random.uniform(BATCH_PAUSE_MIN, BATCH_PAUSE_MAX)
-                logger.info(f"⏸️ Batch {(i+1)//BATCH_SIZE} complete. Pausing {pause:.0f}s...")
-                await asyncio.sleep(pause)
-            else:
-                delay = random.uniform(DELAY_MIN, DELAY_MAX)
-                logger.info(f"⏳ Waiting {delay:.1f}s...")
-                await asyncio.sleep(delay)
-
-    logger.info(f"📊 Bulk send finished: {sent} sent, {failed} failed out of {total}")
+def _outbox_messages(request: BulkSendRequest, attendee_info: Dict[str, dict], media: Optional[dict] = None) -> List[dict]:
+    """One outbox message per phone, personalized now so the worker only sends."""
+    messages = []
+    for phone in request.phones:
+        if request.type == "image":
+            caption = request.caption or ""
+            info = attendee_info.get(phone)
+            if info:
+                name = info.get("guest_name", "")
+                code = info.get("code", "")
+                if name or code:
+                    extra = f"\n👤 {name}" if name else ""
+                    extra += f" | 🎫 {code}" if code else ""
+                    caption = (caption + extra) if caption else extra.strip()
+            messages.append({"phone": phone, "kind": "image", "payload": {**media, "caption": caption}})
+
+        elif request.type == "link":
+            messages.append({"phone": phone, "kind": "link", "payload": {
+                "url": request.url or request.content,
+                "title": request.title or "",
+                "description": request.description or "",
+            }})
+
+        else:  # text / invitation
+            messages.append({"phone": phone, "kind": "text",
+                             "payload": {"text": _build_message(request, phone, attendee_info)}})
+    return messages
 
 
 @router.post("/send")
-async def bulk_send(request: BulkSendRequest, background_tasks: BackgroundTasks):
-    """Send message to selected phone numbers with anti-ban batch delays"""
+async def bulk_send(request: BulkSendRequest, idempotency_key: Optional[str] = Header(None)):
+    """Queue a message to selected phone numbers; the outbox sends them with anti-ban delays"""
 
     if not request.phones:
         raise HTTPException(status_code=400, detail="No phones selected")
 
     # Look up attendee info for personalization
-    attendee_info = _get_attendee_info(request.attendee_ids or [])
+    attendee_info = await _get_attendee_info(request.attendee_ids or [])
+
+    # The image is stored once; every message carries only its key (or the admin's URL)
+    media = None
+    if request.type == "image":
+        asset = await register_base64_media(request.content)
+        media = {"asset_key": asset[0], "mime": asset[1]} if asset else {"media": request.content}
 
-    # Queue the entire batch as ONE background task
-    background_tasks.add_task(_send_bulk_messages, request, attendee_info)
+    messages = await asyncio.to_thread(_outbox_messages, request, attendee_info, media)
+    job_id = await enqueue_job("engagement", messages, description=f"{request.type}: {request.title or request.content[:80]}",
+                               idempotency_key=idempotency_key)
 
     return {
         "success": True,
         "message": f"تم بدء إرسال الرسائل إلى {len(request.phones)} شخص (مع تأخير لحماية الرقم)",
         "queued": len(request.phones),
+        "job_id": job_id,
     }
 
 
 @router.post("/hide")
 async def hide_attendees(request: BulkActionRequest):
     """Hide selected attendees (soft-delete)"""
-    session = get_session()
+    session = get_async_session()
     try:
         updated = 0
-        for tid in request.ticket_ids:
-            ticket = session.query(Ticket).filter(Ticket.id == tid).first()
-            if ticket:
-                ticket.is_hidden = True
-                updated += 1
-        session.commit()
+        tickets = (await session.execute(
+            select(Ticket).where(Ticket.id.in_(request.ticket_ids))
+        )).scalars().all()
+        for ticket in tickets:
+            ticket.is_hidden = True
+            updated += 1
+        await session.commit()
         return {"success": True, "message": f"تم إخفاء {updated} حضور", "count": updated}
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 @router.post("/unhide")
 async def unhide_attendees(request: BulkActionRequest):
     """Restore hidden attendees"""
-    session = get_session()
+    session = get_async_session()
     try:
         updated = 0
-        for tid in request.ticket_ids:
-            ticket = session.query(Ticket).filter(Ticket.id == tid).first()
-            if ticket:
-                ticket.is_hidden = False
-                updated += 1
-        session.commit()
+        tickets = (await session.execute(
+            select(Ticket).where(Ticket.id.in_(request.ticket_ids))
+        )).scalars().all()
+        for ticket in tickets:
+            ticket.is_hidden = False
+            updated += 1
+        await session.commit()
         return {"success": True, "message": f"تم استعادة {updated} حضور", "count": updated}
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 @router.post("/delete")
 async def delete_attendees(request: BulkActionRequest):
     """Permanently delete rejected tickets"""
-    session = get_session()
+    session = get_async_session()
     try:
         deleted = 0
-        for tid in request.ticket_ids:
-            ticket = session.query(Ticket).filter(
-                Ticket.id == tid,
+        tickets = (await session.execute(
+            select(Ticket).where(
+                Ticket.id.in_(request.ticket_ids),
                 Ticket.status == TicketStatus.REJECTED
-            ).first()
-            if ticket:
-                session.delete(ticket)
-                deleted += 1
-        session.commit()
+            )
+        )).scalars().all()
+        for ticket in tickets:
+            await session.delete(ticket)
+            deleted += 1
+        await session.commit()
+        if deleted:
+            quiz_leaderboard.invalidate()
+            quiz_cache.invalidate_tickets()
         return {"success": True, "message": f"تم حذف {deleted} تذاكر مرفوضة نهائياً", "count": deleted}
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 @router.post("/upload-image")
@@ -0,0 +1,373 @@
+"""
+Outbound Message Jobs - API Router
+Bulk senders enqueue into the outbox (models.OutboxJob / OutboxMessage) and
+return a job id; the worker pool in services/outbox.py drains it.
+"""
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import uuid
+
+from fastapi import APIRouter, HTTPException
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import (
+    get_async_session, async_serialized_write, insert_or_ignore,
+    OutboxJob, OutboxMessage, OutboxStatus,
+)
+from routes.media import media_reference
+from services.blob_store import blob_store
+from services.outbox import OutboxWorkerPool, MAX_ATTEMPTS, PRIORITIES, backoff_delay
+from services.whatsapp_service import WhatsAppService
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+whatsapp_service = WhatsAppService()
+
+# Messages without an explicit instance go through the main WhatsAppService number
+DEFAULT_INSTANCE = whatsapp_service.instance_name or "default"
+# Numbers a quiz question is spread across (EVOLUTION_INSTANCE_NAMES)
+FANOUT_INSTANCES = [name for name in whatsapp_service.instance_names if name] or [DEFAULT_INSTANCE]
+
+
+# ═══════════════════════════════════════════
+#  Handlers (one per message kind)
+# ═══════════════════════════════════════════
+
+# send(phone, payload, instance) -> truthy on success; on_finished(message, payload, sent, error) runs once per message
+_handlers: Dict[str, Callable[[str, dict, str], Awaitable[object]]] = {}
+_finishers: Dict[str, Callable] = {}
+
+
+def register_handler(kind: str, send: Callable[[str, dict, str], Awaitable[object]], on_finished: Optional[Callable] = None):
+    _handlers[kind] = send
+    if on_finished:
+        _finishers[kind] = on_finished
+
+
+async def _send_text(phone: str, payload: dict, instance: str):
+    return await whatsapp_service.send_message(phone, payload["text"], instance=instance)
+
+
+async def _send_image(phone: str, payload: dict, instance: str):
+    # Bulk images are stored once (routes/media.py); rows carry the key, sends a URL to it
+    if "asset_key" in payload:
+        media = await media_reference(payload["asset_key"])
+    elif "media_key" in payload:   # queued before media assets: the raw string in the blob store
+        media = (await asyncio.to_thread(blob_store.get, payload["media_key"])).decode()
+    else:
+        media = payload["media"]
+    return await whatsapp_service.send_image(phone, media, payload.get("caption", ""),
+                                             mimetype=payload.get("mime", "image/jpeg"), instance=instance)
+
+
+async def _send_link(phone: str, payload: dict, instance: str):
+    return await whatsapp_service.send_link(phone, payload["url"], payload.get("title", ""), payload.get("description", ""),
+                                            instance=instance)
+
+
+register_handler("text", _send_text)
+register_handler("image", _send_image)
+register_handler("link", _send_link)
+
+
+# ═══════════════════════════════════════════
+#  Enqueue
+# ═══════════════════════════════════════════
+
+async def _job_for_key(session, idempotency_key: Optional[str]) -> Optional[int]:
+    if not idempotency_key:
+        return None
+    return (await session.execute(
+        select(OutboxJob.id).where(OutboxJob.idempotency_key == idempotency_key)
+    )).scalar()
+
+
+async def enqueue_job(kind: str, messages: List[dict], description: str = "",
+                      idempotency_key: Optional[str] = None, priority: Optional[int] = None) -> int:
+    """
+    Queue messages ({"phone", "kind", "payload"}, optionally "instance" and
+    "key") as one job and return its id. Messages go out at the job kind's priority
+    (services.outbox.PRIORITIES) unless `priority` is given.
+    A repeated idempotency_key returns the existing job instead of queueing twice;
+    a phone listed twice for the same handler is sent once, unless the
+    messages carry different "key"s (several tickets for one customer).
+    """
+    if priority is None:
+        priority = PRIORITIES.get(kind, 0)
+    session = get_async_session()
+    try:
+        job_key = idempotency_key or uuid.uuid4().hex
+        async with async_serialized_write():
+            # Looked up under the write lock, so two requests with one key cannot both insert
+            existing = await _job_for_key(session, idempotency_key)
+            if existing:
+                return existing
+            try:
+                job = OutboxJob(kind=kind, description=description[:200], idempotency_key=idempotency_key,
+                                total=0)
+                session.add(job)
+                await session.flush()
+                rows = [{
+                    "job_id": job.id,
+                    "idempotency_key": f"{job_key}:{m['kind']}:{m.get('key') or m['phone']}",
+                    "kind": m["kind"],
+                    "phone": m["phone"],
+                    "instance": m.get("instance") or DEFAULT_INSTANCE,
+                    "priority": priority,
+                    "payload": json.dumps(m.get("payload") or {}, ensure_ascii=False),
+                    "status": OutboxStatus.QUEUED.value,
+                    "attempts": 0,
+                    "next_attempt_at": datetime.utcnow(),
+                    "created_at": datetime.utcnow(),
+                } for m in messages]
+                if rows:
+                    await session.execute(insert_or_ignore(OutboxMessage, ["idempotency_key"]), rows)
+                job.total = (await session.execute(
+                    select(func.count(OutboxMessage.id)).where(OutboxMessage.job_id == job.id)
+                )).scalar()
+                if not job.total:
+                    job.finished_at = datetime.utcnow()
+                await session.commit()
+            except IntegrityError:
+                # Another process queued the same key between the lookup and the insert
+                await session.rollback()
+                existing = await _job_for_key(session, idempotency_key)
+                if not existing:
+                    raise
+                return existing
+            job_id = job.id
+    finally:
+        await session.close()
+    outbox.wake()
+    logger.info(f"📬 Job {job_id} ({kind}) queued {len(messages)} messages")
+    return job_id
+
+
+# ═══════════════════════════════════════════
+#  Worker side
+# ═══════════════════════════════════════════
+
+async def _due_instances() -> List[str]:
+    """Instances with a due message, the one holding the most urgent message first."""
+    session = get_async_session()
+    try:
+        top = func.max(OutboxMessage.priority)
+        rows = (await session.execute(
+            select(OutboxMessage.instance, top).where(
+                OutboxMessage.status == OutboxStatus.QUEUED.value,
+                OutboxMessage.next_attempt_at <= datetime.utcnow(),
+            ).group_by(OutboxMessage.instance).order_by(top.desc())
+        )).all()
+        return [r[0] for r in rows]
+    finally:
+        await session.close()
+
+
+async def _claim_next(instance: str) -> Optional[OutboxMessage]:
+    """Mark the instance's most urgent due message as sending and return it (None when nothing is due)."""
+    session = get_async_session()
+    try:
+        for _ in range(3):
+            message = (await session.execute(
+                select(OutboxMessage).where(
+                    OutboxMessage.status == OutboxStatus.QUEUED.value,
+                    OutboxMessage.instance == instance,
+                    OutboxMessage.next_attempt_at <= datetime.utcnow(),
+                ).order_by(OutboxMessage.priority.desc(), OutboxMessage.id).limit(1)
+            )).scalars().first()
+            if message is None:
+                return None
+            session.expunge(message)
+            # Guarded on status so another process draining the same table cannot claim it twice
+            async with async_serialized_write():
+                claimed = (await session.execute(
+                    update(OutboxMessage).where(
+                        OutboxMessage.id == message.id,
+                        OutboxMessage.status == OutboxStatus.QUEUED.value,
+                    ).values(status=OutboxStatus.SENDING.value, attempts=OutboxMessage.attempts + 1)
+                )).rowcount
+                await session.commit()
+            if claimed:
+                message.status = OutboxStatus.SENDING.value
+                message.attempts = (message.attempts or 0) + 1
+                return message
+        return None
+    finally:
+        await session.close()
+
+
+async def _deliver(message: OutboxMessage):
+    payload = message.get_payload()
+    send = _handlers.get(message.kind)
+    error = None
+    try:
+        if send is None:
+            raise ValueError(f"no handler for message kind {message.kind!r}")
+        ok = await send(message.phone, payload, message.instance)
+        if not ok:
+            error = "فشل إرسال الواتساب"
+    except Exception as e:
+        ok = False
+        error = str(e) or e.__class__.__name__
+
+    retry = not ok and send is not None and message.attempts < MAX_ATTEMPTS
+    values = {"last_error": error}
+    if ok:
+        message.sent_at = datetime.utcnow()
+        values.update(status=OutboxStatus.SENT.value, sent_at=message.sent_at)
+        logger.info(f"✅ Outbox {message.id} ({message.kind}) sent to {message.phone}")
+    elif retry:
+        delay = backoff_delay(message.attempts)
+        values.update(status=OutboxStatus.QUEUED.value, next_attempt_at=datetime.utcnow() + timedelta(seconds=delay))
+        logger.warning(f"🔁 Outbox {message.id} to {message.phone} failed ({error}); retry {message.attempts + 1} in {delay:.0f}s")
+    else:
+        values.update(status=OutboxStatus.FAILED.value)
+        logger.error(f"❌ Outbox {message.id} to {message.phone} failed after {message.attempts} attempts: {error}")
+
+    session = get_async_session()
+    try:
+        async with async_serialized_write():
+            await session.execute(update(OutboxMessage).where(OutboxMessage.id == message.id).values(**values))
+            if not retry:
+                remaining = (await session.execute(select(func.count(OutboxMessage.id)).where(
+                    OutboxMessage.job_id == message.job_id,
+                    OutboxMessage.status.in_([OutboxStatus.QUEUED.value, OutboxStatus.SENDING.value]),
+                    OutboxMessage.id != message.id,
+                ))).scalar()
+                if not remaining:
+                    await session.execute(update(OutboxJob).where(OutboxJob.id == message.job_id)
+                                          .values(finished_at=datetime.utcnow()))
+            await session.commit()
+    finally:
+        await session.close()
+
+    if not retry and message.kind in _finishers:
+        try:
+            await _finishers[message.kind](message, payload, ok, error)
+        except Exception as e:
+            logger.error(f"Outbox {message.id}: on_finished hook failed: {e}")
+
+
+outbox = OutboxWorkerPool(_due_instances, _claim_next, _deliver)
+
+
+async def start_outbox():
+    """Requeue messages a previous process left mid-send, then start the workers."""
+    session = get_async_session()
+    try:
+        async with async_serialized_write():
+            result = await session.execute(
+                update(OutboxMessage).where(OutboxMessage.status == OutboxStatus.SENDING.value)
+                .values(status=OutboxStatus.QUEUED.value)
+            )
+            await session.commit()
+        if result.rowcount:
+            logger.info(f"📬 Requeued {result.rowcount} outbox messages interrupted by a restart")
+    finally:
+        await session.close()
+    outbox.start()
+
+
+async def stop_outbox():
+    await outbox.stop()
+
+
+# ═══════════════════════════════════════════
+#  Progress
+# ═══════════════════════════════════════════
+
+async def _job_progress(session, job: OutboxJob) -> dict:
+    counts = dict((await session.execute(
+        select(OutboxMessage.status, func.count(OutboxMessage.id))
+        .where(OutboxMessage.job_id == job.id).group_by(OutboxMessage.status)
+    )).all())
+    done = counts.get(OutboxStatus.SENT.value, 0) + counts.get(OutboxStatus.FAILED.value, 0)
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "description": job.description,
+        "total": job.total,
+        "queued": counts.get(OutboxStatus.QUEUED.value, 0),
+        "sending": counts.get(OutboxStatus.SENDING.value, 0),
+        "sent": counts.get(OutboxStatus.SENT.value, 0),
+        "failed": counts.get(OutboxStatus.FAILED.value, 0),
+        "progress": round(100.0 * done / job.total, 1) if job.total else 100.0,
+        "status": "completed" if job.finished_at else "running",
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+@router.get("")
+async def list_jobs(limit: int = 20):
+    session = get_async_session()
+    try:
+        jobs = (await session.execute(
+            select(OutboxJob).order_by(OutboxJob.id.desc()).limit(min(max(limit, 1), 100))
+        )).scalars().all()
+        return {"jobs": [await _job_progress(session, job) for job in jobs]}
+    finally:
+        await session.close()
+
+
+@router.get("/stats")
+async def get_send_stats():
+    """Live queue depth per instance and priority, plus each instance's send rate against the envelope."""
+    session = get_async_session()
+    try:
+        rows = (await session.execute(
+            select(OutboxMessage.instance, OutboxMessage.priority, OutboxMessage.status, func.count(OutboxMessage.id))
+            .where(OutboxMessage.status.in_([OutboxStatus.QUEUED.value, OutboxStatus.SENDING.value]))
+            .group_by(OutboxMessage.instance, OutboxMessage.priority, OutboxMessage.status)
+        )).all()
+    finally:
+        await session.close()
+
+    stats = outbox.scheduler.stats()
+    instances = stats["instances"]
+    for instance, *_ in rows:
+        instances.setdefault(instance, {})
+    for entry in instances.values():
+        entry.update(queued=0, sending=0, queued_by_priority={})
+    for instance, priority, status, count in rows:
+        entry = instances[instance]
+        entry[status] += count
+        if status == OutboxStatus.QUEUED.value:
+            entry["queued_by_priority"][str(priority)] = count
+    stats["queue_depth"] = sum(e.get("queued", 0) + e.get("sending", 0) for e in instances.values())
+    stats["sent_last_minute"] = sum(e.get("sent_last_minute", 0) for e in instances.values())
+    stats["workers"] = outbox.workers
+    stats["running"] = outbox.running
+    return stats
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: int):
+    session = get_async_session()
+    try:
+        job = await session.get(OutboxJob, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+        return await _job_progress(session, job)
+    finally:
+        await session.close()
+
+
+@router.get("/{job_id}/failures")
+async def get_job_failures(job_id: int):
+    session = get_async_session()
+    try:
+        rows = (await session.execute(
+            select(OutboxMessage.id, OutboxMessage.phone, OutboxMessage.attempts, OutboxMessage.last_error)
+            .where(OutboxMessage.job_id == job_id, OutboxMessage.status == OutboxStatus.FAILED.value)
+            .order_by(OutboxMessage.id)
+        )).all()
+        return {"failures": [
+            {"id": r.id, "phone": r.phone, "attempts": r.attempts, "error": r.last_error} for r in rows
+        ]}
+    finally:
+        await session.close()
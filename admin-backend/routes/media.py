@@ -0,0 +1,96 @@
+"""
+Shared WhatsApp Media - API Router
+An image sent to a whole campaign is stored once in the blob store under its
+SHA-256 and every outbox message carries only that key. At send time the key
+becomes a public URL Evolution API downloads from (MEDIA_BASE_URL, the
+address Evolution can reach this backend on), or, without one, the base64
+string encoded once per asset instead of once per recipient.
+"""
+from functools import lru_cache
+from typing import Optional, Tuple
+import asyncio
+import base64
+import os
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from models import get_async_session, async_serialized_write, insert_or_ignore, MediaAsset
+from services.blob_store import blob_store, decode_base64_media, sniff_mime
+
+router = APIRouter()
+
+MEDIA_URL = "/api/media/{key}"
+# What sniff_mime recognises; rows stored before sniffing may claim anything else
+SERVED_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "application/pdf"}
+
+
+def media_base_url() -> str:
+    return os.getenv("MEDIA_BASE_URL", "").rstrip("/")
+
+
+async def register_media(data: bytes, filename: Optional[str] = None) -> str:
+    """
+    Store an asset once (by content hash) and return its key. The mime type
+    is sniffed from the bytes, never taken from the client: get_media serves
+    it publicly, so only images and PDFs get a type a browser will render.
+    """
+    key = await asyncio.to_thread(blob_store.put, data)
+    session = get_async_session()
+    try:
+        async with async_serialized_write():
+            await session.execute(insert_or_ignore(MediaAsset, ["key"]).values(
+                key=key, mime=sniff_mime(data), size=len(data), filename=filename,
+            ))
+            await session.commit()
+    finally:
+        await session.close()
+    return key
+
+
+async def register_base64_media(content: str, filename: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """register_media for a data: URI / bare base64 string -> (key, mime); None when it is not base64 (e.g. a URL)."""
+    decoded = await asyncio.to_thread(decode_base64_media, content)
+    if not decoded:
+        return None
+    data = decoded[0]
+    return await register_media(data, filename), sniff_mime(data)
+
+
+@lru_cache(maxsize=8)
+def _inline_media(key: str) -> str:
+    return base64.b64encode(blob_store.get(key)).decode()
+
+
+async def media_reference(key: str) -> str:
+    """What goes in Evolution's "media" field: the public URL, or base64 when none is configured."""
+    base_url = media_base_url()
+    if base_url:
+        return base_url + MEDIA_URL.format(key=key)
+    return await asyncio.to_thread(_inline_media, key)
+
+
+@router.get("/{key}")
+async def get_media(key: str, request: Request):
+    """
+    Public (Evolution API fetches it without a token). The SHA-256 key is
+    unguessable and immutable, so it doubles as the ETag.
+    """
+    if not blob_store.is_valid_key(key):
+        raise HTTPException(status_code=404, detail="الملف غير موجود")
+    session = get_async_session()
+    try:
+        asset = await session.get(MediaAsset, key)
+    finally:
+        await session.close()
+    if not asset or not blob_store.exists(key):
+        raise HTTPException(status_code=404, detail="الملف غير موجود")
+
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable",
+               "X-Content-Type-Options": "nosniff"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Length"] = str(asset.size)
+    mime = asset.mime if asset.mime in SERVED_TYPES else "application/octet-stream"
+    return StreamingResponse(blob_store.iter_range(key), media_type=mime, headers=headers)
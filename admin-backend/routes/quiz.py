@@ -4,20 +4,26 @@ Handles questions, groups, answers, and leaderboard
 """
 from datetime import datetime, timedelta
 from typing import Optional, List
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from sqlalchemy import func, Integer
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, select, update, delete, or_, bindparam, Integer
+import asyncio
 import json
 import logging
 
 from models import (
-    get_session, Ticket, TicketType, TicketStatus, Customer, safe_value,
+    get_session, get_async_session, async_serialized_write, insert_or_ignore, Ticket, TicketType, TicketStatus, Customer, safe_value,
     QuizGroup, QuizGroupMember, Question, QuestionOption, Answer,
-    QuestionType, QuestionStatus
+    QuestionType, QuestionStatus, QuizDelivery, OutboxJob, OutboxMessage, OutboxStatus
 )
+from services.scoring import evaluate_answer, grade_answers
+from services.leaderboard import quiz_leaderboard, RANKINGS
+from services.phones import normalize_phone
+from services.quiz_cache import quiz_cache, TicketRef
 from services.whatsapp_service import WhatsAppService
-from services.scoring import evaluate_answer
+from routes.jobs import enqueue_job, register_handler, FANOUT_INSTANCES
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/quiz", tags=["quiz"])
@@ -171,8 +177,9 @@ def list_questions():
         questions = session.query(Question).order_by(Question.created_at.desc()).all()
         result = []
         for q in questions:
-            # Auto-expire if time passed
-            if q.status == QuestionStatus.ACTIVE and q.expires_at and datetime.utcnow() > q.expires_at:
+            # Auto-expire if time passed and every recipient has it (deliveries push expires_at out)
+            if q.status == QuestionStatus.ACTIVE and q.expires_at and datetime.utcnow() > q.expires_at \
+                    and not session.execute(_fanout_pending(q)).scalar():
                 q.status = QuestionStatus.EXPIRED
                 session.commit()
             
@@ -248,75 +255,130 @@ def create_question(data: QuestionCreate):
 
 
 @router.delete("/questions/{question_id}")
-def delete_question(question_id: int):
-    session = get_session()
+async def delete_question(question_id: int):
+    # Async so the leaderboard is invalidated on the event loop, where answers and the SSE stream use it
+    session = get_async_session()
     try:
-        q = session.query(Question).filter(Question.id == question_id).first()
+        q = await session.get(Question, question_id)
         if not q:
             raise HTTPException(status_code=404, detail="السؤال غير موجود")
-        session.delete(q)
-        session.commit()
+        await session.delete(q)
+        async with async_serialized_write():
+            await session.commit()
+        quiz_leaderboard.invalidate()  # its answers are gone with it
+        quiz_cache.drop_question(question_id)
         return {"success": True, "message": "تم حذف السؤال"}
     except HTTPException:
         raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 # ═══════════════════════════════════════════
 #  Send Question via WhatsApp
 # ═══════════════════════════════════════════
 
-def _get_target_phones(session, target_groups: list) -> list:
+async def _get_target_phones(session, target_groups: list) -> list:
     """Get phone numbers of targeted participants"""
     phones = set()
     
     for target in target_groups:
         if target == "all":
             # All approved tickets
-            tickets = session.query(Ticket).filter(
-                func.lower(Ticket.status).in_(['approved', 'activated']),
-                Ticket.is_hidden == False
-            ).all()
-            for t in tickets:
-                if t.customer and t.customer.phone:
-                    phones.add(t.customer.phone)
+            rows = await session.execute(
+                select(Customer.phone).join(Ticket, Ticket.customer_id == Customer.id).where(
+                    func.lower(Ticket.status).in_(['approved', 'activated']),
+                    Ticket.is_hidden == False
+                )
+            )
+            phones.update(phone for (phone,) in rows if phone)
         
         elif target in ("VIP", "Student"):
             # By ticket type
             ticket_type = TicketType.VIP if target == "VIP" else TicketType.STUDENT
-            tickets = session.query(Ticket).filter(
-                Ticket.ticket_type == ticket_type,
-                func.lower(Ticket.status).in_(['approved', 'activated']),
-                Ticket.is_hidden == False
-            ).all()
-            for t in tickets:
-                if t.customer and t.customer.phone:
-                    phones.add(t.customer.phone)
+            rows = await session.execute(
+                select(Customer.phone).join(Ticket, Ticket.customer_id == Customer.id).where(
+                    Ticket.ticket_type == ticket_type,
+                    func.lower(Ticket.status).in_(['approved', 'activated']),
+                    Ticket.is_hidden == False
+                )
+            )
+            phones.update(phone for (phone,) in rows if phone)
         
         elif target.startswith("group:"):
             # Custom group
             try:
                 group_id = int(target.split(":")[1])
-                members = session.query(QuizGroupMember).filter(QuizGroupMember.group_id == group_id).all()
-                for m in members:
-                    ticket = session.query(Ticket).filter(Ticket.id == m.ticket_id).first()
-                    if ticket and ticket.customer and ticket.customer.phone:
-                        phones.add(ticket.customer.phone)
+                rows = await session.execute(
+                    select(Customer.phone)
+                    .join(Ticket, Ticket.customer_id == Customer.id)
+                    .join(QuizGroupMember, QuizGroupMember.ticket_id == Ticket.id)
+                    .where(QuizGroupMember.group_id == group_id)
+                )
+                phones.update(phone for (phone,) in rows if phone)
             except (ValueError, IndexError):
                 pass
     
     return list(phones)
 
 
+async def _send_quiz_question(phone: str, payload: dict, instance: str):
+    return await whatsapp_service.send_message(phone, payload["text"], instance=instance)
+
+
+async def _record_delivery(message, payload: dict, sent: bool, error: Optional[str]):
+    """Start this recipient's answer window at delivery and push the question's expiry out to match."""
+    if not sent:
+        return
+    question_id = payload["question_id"]
+    phone = normalize_phone(message.phone)
+    expires_at = message.sent_at + timedelta(seconds=payload["time_limit_seconds"])
+    session = get_async_session()
+    try:
+        async with async_serialized_write():
+            await session.execute(insert_or_ignore(QuizDelivery, ["question_id", "phone"]).values(
+                question_id=question_id, phone=phone, instance=message.instance,
+                delivered_at=message.sent_at, expires_at=expires_at,
+            ))
+            await session.execute(
+                update(Question).where(
+                    Question.id == question_id,
+                    or_(Question.expires_at == None, Question.expires_at < expires_at),
+                ).values(expires_at=expires_at)
+            )
+            await session.commit()
+    finally:
+        await session.close()
+    quiz_cache.set_deadline(question_id, phone, expires_at)
+
+
+register_handler("quiz_question", _send_quiz_question, on_finished=_record_delivery)
+
+
+def _quiz_job_key(question) -> str:
+    """Idempotency key of the outbox job for one send of a question."""
+    return f"quiz:{question.id}:{question.sent_at.isoformat()}"
+
+
+def _fanout_pending(question):
+    """Count of this send's messages not yet out. Until it is 0, expires_at can still move
+    (_record_delivery), so the question must not be auto-expired."""
+    return select(func.count(OutboxMessage.id)).join(OutboxJob, OutboxJob.id == OutboxMessage.job_id).where(
+        OutboxJob.idempotency_key == _quiz_job_key(question),
+        OutboxMessage.status.in_([OutboxStatus.QUEUED.value, OutboxStatus.SENDING.value]),
+    )
+
+
 @router.post("/questions/{question_id}/send")
-async def send_question(question_id: int, background_tasks: BackgroundTasks):
-    session = get_session()
+async def send_question(question_id: int):
+    session = get_async_session()
     try:
-        q = session.query(Question).filter(Question.id == question_id).first()
+        q = (await session.execute(
+            select(Question).options(selectinload(Question.options)).where(Question.id == question_id)
+        )).scalars().first()
         if not q:
             raise HTTPException(status_code=404, detail="السؤال غير موجود")
         
@@ -337,61 +399,46 @@ async def send_question(question_id: int, background_tasks: BackgroundTasks):
         msg += f"\n⏱️ عندك {q.time_limit_seconds} ثانية للإجابة"
         
         # Get target phones
-        phones = _get_target_phones(session, q.get_target_groups())
+        phones = await _get_target_phones(session, q.get_target_groups())
         if not phones:
             raise HTTPException(status_code=400, detail="لا يوجد مشاركين مستهدفين")
         
-        # Update question status
+        # Update question status. expires_at starts at sent_at + limit and moves out as
+        # deliveries land: each recipient gets the full limit from when it reached them.
         q.status = QuestionStatus.ACTIVE
         q.sent_at = datetime.utcnow()
         q.expires_at = datetime.utcnow() + timedelta(seconds=q.time_limit_seconds)
-        session.commit()
+        await session.execute(delete(QuizDelivery).where(QuizDelivery.question_id == q.id))
+        await session.commit()
+        
+        # Warm the answer hot path before the first replies arrive
+        quiz_cache.put_question(q, options=q.options, active=True)
+        quiz_cache.load_deadlines(q.id, ())
+        await _load_phone_index(session)
         
-        # Send to all targeted phones with batch delays
-        background_tasks.add_task(_send_quiz_bulk, phones, msg)
+        # Spread across the fan-out numbers; each one is paced by its own token bucket
+        payload = {"text": msg, "question_id": q.id, "time_limit_seconds": q.time_limit_seconds}
+        job_id = await enqueue_job(
+            "quiz",
+            [{"phone": phone, "kind": "quiz_question", "payload": payload,
+              "instance": FANOUT_INSTANCES[i % len(FANOUT_INSTANCES)]} for i, phone in enumerate(phones)],
+            description=f"سؤال {q.id}: {q.text[:80]}", idempotency_key=_quiz_job_key(q),
+        )
         
         return {
             "success": True,
-            "message": f"تم بدء إرسال السؤال لـ {len(phones)} مشارك (مع تأخير لحماية الرقم)",
+            "message": f"تم بدء إرسال السؤال لـ {len(phones)} مشارك من {len(FANOUT_INSTANCES)} رقم (مع تأخير لحماية الأرقام)",
             "sent_count": len(phones),
             "expires_at": q.expires_at.isoformat(),
+            "job_id": job_id,
         }
     except HTTPException:
         raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
-
-
-async def _send_quiz_bulk(phones: list, msg: str):
-    """Send quiz question to all phones with anti-ban delays."""
-    import asyncio
-    import random
-    BATCH_SIZE = 25
-    DELAY_MIN, DELAY_MAX = 3.0, 8.0
-    BATCH_PAUSE_MIN, BATCH_PAUSE_MAX = 60.0, 90.0
-
-    total = len(phones)
-    for i, phone in enumerate(phones):
-        try:
-            await whatsapp_service.send_message(phone, msg)
-            logger.info(f"✅ Quiz sent {i+1}/{total} to {phone}")
-        except Exception as e:
-            logger.error(f"❌ Quiz failed {i+1}/{total} to {phone}: {e}")
-
-        if i < total - 1:
-            if (i + 1) % BATCH_SIZE == 0:
-                pause = random.uniform(BATCH_PAUSE_MIN, BATCH_PAUSE_MAX)
-                logger.info(f"⏸️ Quiz batch {(i+1)//BATCH_SIZE} done. Pausing {pause:.0f}s...")
-                await asyncio.sleep(pause)
-            else:
-                delay = random.uniform(DELAY_MIN, DELAY_MAX)
-                logger.info(f"⏳ Waiting {delay:.1f}s...")
-                await asyncio.sleep(delay)
-
-    logger.info(f"📊 Quiz send finished: {total} phones processed")
+        await session.close()
 
 
 @router.post("/questions/{question_id}/expire")
@@ -403,6 +450,7 @@ def expire_question(question_id: int):
             raise HTTPException(status_code=404, detail="السؤال غير موجود")
         q.status = QuestionStatus.EXPIRED
         session.commit()
+        quiz_cache.drop_question(question_id)
         return {"success": True, "message": "تم إنهاء السؤال"}
     except HTTPException:
         raise
@@ -417,104 +465,276 @@ def expire_question(question_id: int):
 #  Answer Submission (from n8n)
 # ═══════════════════════════════════════════
 
-@router.post("/answer")
-def submit_answer(data: AnswerSubmit):
-    session = get_session()
-    try:
-        # Find the question
-        question = session.query(Question).filter(Question.id == data.question_id).first()
-        if not question:
-            return {"success": False, "message": "السؤال غير موجود"}
-        
-        # Find participant by phone
-        phone = data.phone
-        if phone.startswith("0") and len(phone) == 11:
-            phone = "20" + phone[1:]
-        elif not phone.startswith("20") and len(phone) == 10:
-            phone = "20" + phone
-        
-        customer = session.query(Customer).filter(Customer.phone == phone).first()
-        if not customer:
-            return {"success": False, "message": "المشارك غير موجود"}
-        
-        ticket = session.query(Ticket).filter(
+MAX_ANSWER_BATCH = 500
+
+
+async def _load_phone_index(session):
+    """Build the phone → active ticket index in one query (first ticket per phone, like the old lookup)."""
+    generation = quiz_cache.phones_generation
+    rows = await session.execute(
+        select(Customer.phone_normalized, Ticket.id, Ticket.guest_name, Ticket.ticket_type)
+        .join(Ticket, Ticket.customer_id == Customer.id)
+        .where(Ticket.status.in_([TicketStatus.APPROVED, TicketStatus.ACTIVATED]))
+        .order_by(Ticket.id)
+    )
+    quiz_cache.load_phones(((phone, tid, name, safe_value(tt)) for phone, tid, name, tt in rows), generation)
+
+
+async def _resolve_participant(session, phone: str):
+    """Return (TicketRef, None) or (None, error message) for a normalized phone."""
+    if not quiz_cache.phones_loaded:
+        await _load_phone_index(session)
+    ref = quiz_cache.resolve(phone)
+    if ref:
+        return ref, None
+
+    # Not in the index: fall back to the database for the exact error (or a ticket approved since)
+    customer = (await session.execute(
+        select(Customer).where(Customer.phone_normalized == phone).order_by(Customer.id).limit(1)
+    )).scalars().first()
+    if not customer:
+        return None, "المشارك غير موجود"
+    ticket = (await session.execute(
+        select(Ticket).where(
             Ticket.customer_id == customer.id,
             Ticket.status.in_([TicketStatus.APPROVED, TicketStatus.ACTIVATED])
-        ).first()
-        if not ticket:
-            return {"success": False, "message": "لا توجد تذكرة فعالة لهذا المشارك"}
-        
-        # Check if already answered
-        existing = session.query(Answer).filter(
-            Answer.question_id == question.id,
-            Answer.ticket_id == ticket.id
-        ).first()
-        if existing:
-            return {"success": False, "message": "تم الإجابة مسبقاً"}
-        
-        # Check if expired
-        is_late = False
-        if question.expires_at and datetime.utcnow() > question.expires_at:
-            is_late = True
-            if not question.accept_late:
-                return {"success": False, "message": "انتهى وقت الإجابة ⏰"}
-        
-        # Evaluate answer
-        q_type = safe_value(question.question_type)
-        logger.info(f"[QUIZ DEBUG] question_id={question.id}, question_type='{q_type}', "
-                     f"correct_answer='{question.correct_answer}' (repr={repr(question.correct_answer)}), "
-                     f"answer_text='{data.answer_text}' (repr={repr(data.answer_text)})")
-        
-        result = evaluate_answer(
+        )
+    )).scalars().first()
+    if not ticket:
+        return None, "لا توجد تذكرة فعالة لهذا المشارك"
+    ref = TicketRef(ticket.id, ticket.guest_name, safe_value(ticket.ticket_type))
+    quiz_cache.remember(phone, ref)
+    return ref, None
+
+
+async def _get_question_snapshot(session, question_id: int):
+    """Cached snapshot while the question is live, else one read that warms the cache."""
+    question = quiz_cache.get_question(question_id)
+    if not question:
+        row = await session.get(Question, question_id)
+        if not row:
+            return None
+        question = quiz_cache.put_question(row)
+        deliveries = await session.execute(
+            select(QuizDelivery.phone, QuizDelivery.expires_at).where(QuizDelivery.question_id == question_id)
+        )
+        quiz_cache.load_deadlines(question_id, deliveries.all())
+    return question
+
+
+async def _check_submission(session, data: AnswerSubmit):
+    """
+    Resolve the question and participant and apply the lateness rule, without scoring.
+    Returns (pending answer dict, None) or (None, error message).
+    """
+    question = await _get_question_snapshot(session, data.question_id)
+    if not question:
+        return None, "السؤال غير موجود"
+    
+    phone = normalize_phone(data.phone)
+    ticket, error = await _resolve_participant(session, phone)
+    if not ticket:
+        return None, error
+    
+    # Check if expired: from when the question reached this phone, else the question's first deadline
+    is_late = False
+    expires_at = quiz_cache.deadline(question.id, phone) or question.expires_at
+    if expires_at and datetime.utcnow() > expires_at:
+        is_late = True
+        if not question.accept_late:
+            return None, "انتهى وقت الإجابة ⏰"
+    
+    return {
+        "question": question,
+        "ticket": ticket,
+        "sender_name": data.sender_name,
+        "phone": phone,
+        "answer_text": data.answer_text,
+        "is_late": is_late,
+    }, None
+
+
+def _score_submission(pending: dict, result: dict):
+    """Attach the scoring result and the Answer row values to a pending answer."""
+    question = pending["question"]
+    logger.debug(f"[QUIZ] question_id={question.id} type={question.question_type} "
+                 f"answer={pending['answer_text']!r} result={result}")
+    
+    points = question.points if result["is_correct"] and not pending["is_late"] else 0
+    pending["result"] = result
+    pending["values"] = {
+        "question_id": question.id,
+        "ticket_id": pending["ticket"].ticket_id,
+        "phone": pending["phone"],
+        "answer_text": pending["answer_text"],
+        "is_correct": result["is_correct"],
+        "similarity_score": result["similarity_score"],
+        "points_earned": points,
+        "is_late": pending["is_late"],
+    }
+
+
+def _answer_response(pending: dict) -> dict:
+    result, values = pending["result"], pending["values"]
+    points = values["points_earned"]
+    if result["is_correct"]:
+        resp_msg = f"✅ إجابة صحيحة! +{points} نقطة"
+    else:
+        resp_msg = f"❌ إجابة خاطئة. الإجابة الصحيحة: {pending['question'].correct_answer}"
+    
+    if values["is_late"]:
+        resp_msg += "\n⏰ (بعد الوقت - لم تحتسب)"
+    
+    return {
+        "success": True,
+        "is_correct": result["is_correct"],
+        "similarity_score": result["similarity_score"],
+        "points_earned": points,
+        "response_message": resp_msg,
+    }
+
+
+async def _save_guest_names(session, pending_answers: list):
+    """Save sender names to tickets whose guest_name is still empty (one executemany)."""
+    names = {}
+    for pending in pending_answers:
+        ticket = pending["ticket"]
+        if pending["sender_name"] and not ticket.guest_name and ticket.ticket_id not in names:
+            names[ticket.ticket_id] = pending["sender_name"]
+    if not names:
+        return
+    tickets = Ticket.__table__
+    await session.execute(
+        update(tickets).where(
+            tickets.c.id == bindparam("tid"),
+            or_(tickets.c.guest_name == None, tickets.c.guest_name == "")
+        ).values(guest_name=bindparam("name")),
+        [{"tid": tid, "name": name} for tid, name in names.items()],
+    )
+    for pending in pending_answers:
+        ticket = pending["ticket"]
+        if ticket.ticket_id in names:
+            ticket.guest_name = names[ticket.ticket_id]
+
+
+def _record_on_leaderboard(answer_id: int, pending: dict):
+    ticket, values = pending["ticket"], pending["values"]
+    quiz_leaderboard.record_answer(
+        answer_id, ticket.ticket_id, values["points_earned"], values["is_correct"],
+        guest_name=ticket.guest_name, phone=values["phone"], ticket_type=ticket.ticket_type,
+    )
+
+
+@router.post("/answer")
+async def submit_answer(data: AnswerSubmit):
+    session = get_async_session()
+    try:
+        pending, error = await _check_submission(session, data)
+        if not pending:
+            return {"success": False, "message": error}
+        question = pending["question"]
+        _score_submission(pending, evaluate_answer(
             answer_text=data.answer_text,
             correct_answer=question.correct_answer,
-            question_type=q_type,
-        )
-        logger.info(f"[QUIZ DEBUG] evaluation result: {result}")
+            question_type=question.question_type,
+            normalized_options=question.normalized_options,
+        ))
         
-        points = question.points if result["is_correct"] and not is_late else 0
+        # Save answer; the (question_id, ticket_id) unique index rejects a second answer.
+        # The whole write transaction sits inside the gate so writers queue instead of spinning on SQLite's lock.
+        async with async_serialized_write():
+            answer_id = (await session.execute(
+                insert_or_ignore(Answer, ["question_id", "ticket_id"]).values(**pending["values"]).returning(Answer.id)
+            )).scalar()
+            if answer_id is None:
+                await session.rollback()
+                return {"success": False, "message": "تم الإجابة مسبقاً"}
+            
+            await _save_guest_names(session, [pending])
+            await session.commit()
+        _record_on_leaderboard(answer_id, pending)
         
-        # Save answer
-        answer = Answer(
-            question_id=question.id,
-            ticket_id=ticket.id,
-            phone=phone,
-            answer_text=data.answer_text,
-            is_correct=result["is_correct"],
-            similarity_score=result["similarity_score"],
-            points_earned=points,
-            is_late=is_late,
-        )
-        session.add(answer)
+        return _answer_response(pending)
+    except Exception as e:
+        await session.rollback()
+        logger.error(f"Error submitting answer: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await session.close()
+
+
+@router.post("/answers/batch")
+async def submit_answers_batch(data: List[AnswerSubmit]):
+    """
+    Score and store a burst of answers in one request and one transaction.
+    Answers are graded per question in one pass (services.scoring.grade_answers).
+    Returns one result per item, in request order, shaped like /answer's response.
+    """
+    if len(data) > MAX_ANSWER_BATCH:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_ANSWER_BATCH} answers)")
+    
+    session = get_async_session()
+    try:
+        results: List[Optional[dict]] = [None] * len(data)
+        by_question = {}  # question_id -> batch indexes, graded together
+        for i, item in enumerate(data):
+            pending, error = await _check_submission(session, item)
+            if not pending:
+                results[i] = {"success": False, "message": error}
+                continue
+            results[i] = pending
+            by_question.setdefault(pending["question"].id, []).append(i)
         
-        # Save sender name to ticket if guest_name is empty
-        if data.sender_name and not ticket.guest_name:
-            ticket.guest_name = data.sender_name
+        for indexes in by_question.values():
+            question = results[indexes[0]]["question"]
+            graded = grade_answers(
+                [results[i]["answer_text"] for i in indexes],
+                correct_answer=question.correct_answer,
+                question_type=question.question_type,
+                normalized_options=question.normalized_options,
+            )
+            for i, result in zip(indexes, graded):
+                _score_submission(results[i], result)
         
-        session.commit()
+        to_insert = {}  # (question_id, ticket_id) -> batch index; a repeat within the batch is a duplicate
+        for i, pending in enumerate(results):
+            if "values" not in pending:
+                continue
+            key = (pending["values"]["question_id"], pending["values"]["ticket_id"])
+            if key in to_insert:
+                results[i] = {"success": False, "message": "تم الإجابة مسبقاً"}
+                continue
+            to_insert[key] = i
         
-        # Response message
-        if result["is_correct"]:
-            resp_msg = f"✅ إجابة صحيحة! +{points} نقطة"
-        else:
-            resp_msg = f"❌ إجابة خاطئة. الإجابة الصحيحة: {question.correct_answer}"
+        inserted = {}
+        if to_insert:
+            async with async_serialized_write():
+                # Rows the unique index ignores (answered before this batch) come back without an id
+                rows = await session.execute(
+                    insert_or_ignore(Answer, ["question_id", "ticket_id"])
+                    .returning(Answer.id, Answer.question_id, Answer.ticket_id),
+                    [results[i]["values"] for i in to_insert.values()],
+                )
+                inserted = {(r.question_id, r.ticket_id): r.id for r in rows}
+                await _save_guest_names(session, [results[to_insert[key]] for key in inserted])
+                await session.commit()
         
-        if is_late:
-            resp_msg += "\n⏰ (بعد الوقت - لم تحتسب)"
+        for key, i in to_insert.items():
+            pending = results[i]
+            answer_id = inserted.get(key)
+            if answer_id is None:
+                results[i] = {"success": False, "message": "تم الإجابة مسبقاً"}
+                continue
+            _record_on_leaderboard(answer_id, pending)
+            results[i] = _answer_response(pending)
         
-        return {
-            "success": True,
-            "is_correct": result["is_correct"],
-            "similarity_score": result["similarity_score"],
-            "points_earned": points,
-            "response_message": resp_msg,
-        }
+        return {"results": results}
     except Exception as e:
-        session.rollback()
-        logger.error(f"Error submitting answer: {e}")
+        await session.rollback()
+        logger.error(f"Error submitting answer batch: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 # ═══════════════════════════════════════════
@@ -522,105 +742,253 @@ def submit_answer(data: AnswerSubmit):
 # ═══════════════════════════════════════════
 
 @router.get("/active-question")
-def get_active_question():
-    """Returns the currently active question (if any) - used by n8n"""
-    session = get_session()
+async def get_active_question(phone: Optional[str] = None):
+    """Returns the currently active question (if any) - used by n8n; pass phone for that recipient's deadline"""
+    session = get_async_session()
     try:
-        # Auto-expire old questions
-        expired = session.query(Question).filter(
-            Question.status == QuestionStatus.ACTIVE,
-            Question.expires_at < datetime.utcnow()
-        ).all()
-        for q in expired:
-            q.status = QuestionStatus.EXPIRED
+        # Auto-expire old questions, once the fan-out has reached everyone (a delivery moves expires_at out)
+        expired = []
+        for q in (await session.execute(
+            select(Question).where(
+                Question.status == QuestionStatus.ACTIVE,
+                Question.expires_at < datetime.utcnow()
+            )
+        )).scalars().all():
+            if not (await session.execute(_fanout_pending(q))).scalar():
+                q.status = QuestionStatus.EXPIRED
+                expired.append(q)
         if expired:
-            session.commit()
+            await session.commit()
         
         # Get current active question
-        active = session.query(Question).filter(
-            Question.status == QuestionStatus.ACTIVE
-        ).order_by(Question.sent_at.desc()).first()
+        active = (await session.execute(
+            select(Question).where(
+                Question.status == QuestionStatus.ACTIVE
+            ).order_by(Question.sent_at.desc())
+        )).scalars().first()
         
         if not active:
             return {"has_active": False}
         
-        return {
+        result = {
             "has_active": True,
             "question_id": active.id,
             "question_type": safe_value(active.question_type),
             "expires_at": active.expires_at.isoformat() if active.expires_at else None,
         }
+        if phone:
+            await _get_question_snapshot(session, active.id)
+            deadline = quiz_cache.deadline(active.id, normalize_phone(phone))
+            result["expires_at_for_phone"] = deadline.isoformat() if deadline else None
+        return result
     finally:
-        session.close()
+        await session.close()
 
 
 # ═══════════════════════════════════════════
 #  Leaderboard & Results
 # ═══════════════════════════════════════════
 
+LEADERBOARD_RANKINGS = {
+    "row": func.row_number,        # 1, 2, 3, 4 — ties broken by ticket id
+    "competition": func.rank,      # 1, 1, 3, 4
+    "dense": func.dense_rank,      # 1, 1, 2, 3
+}
+
+
+def _leaderboard_query(group: Optional[str], ranking: str, limit: Optional[int], offset: int,
+                       upto_answer_id: Optional[int] = None):
+    """
+    Build the whole leaderboard as one statement: per-ticket totals joined to
+    tickets/customers, group filter in WHERE, rank as a window function over the
+    filtered rows (so ranks stay correct when limit/offset cut a top-N page).
+    Returns None when the group filter is malformed (no one can match it).
+    """
+    totals = select(
+        Answer.ticket_id.label("ticket_id"),
+        func.coalesce(func.sum(Answer.points_earned), 0).label("total_points"),
+        func.count(Answer.id).label("total_answers"),
+        func.coalesce(func.sum(func.cast(Answer.is_correct, Integer)), 0).label("correct_answers"),
+    )
+    if upto_answer_id is not None:
+        totals = totals.where(Answer.id <= upto_answer_id)
+    totals = totals.group_by(Answer.ticket_id).subquery()
+
+    rank_order = [totals.c.total_points.desc()]
+    if ranking == "row":
+        rank_order.append(Ticket.id)
+
+    query = select(
+        Ticket.id.label("ticket_id"), Ticket.guest_name, Ticket.ticket_type,
+        Customer.phone.label("phone"),
+        totals.c.total_points, totals.c.total_answers, totals.c.correct_answers,
+        LEADERBOARD_RANKINGS[ranking]().over(order_by=rank_order).label("rank"),
+        func.count().over().label("total_participants"),
+    ).join(Ticket, Ticket.id == totals.c.ticket_id).outerjoin(Customer, Customer.id == Ticket.customer_id)
+
+    if group and group != "all":
+        if group in ("VIP", "Student"):
+            query = query.where(Ticket.ticket_type == group)
+        elif group.startswith("group:"):
+            try:
+                gid = int(group.split(":")[1])
+            except (ValueError, IndexError):
+                return None
+            query = query.where(Ticket.id.in_(
+                select(QuizGroupMember.ticket_id).where(QuizGroupMember.group_id == gid)
+            ))
+
+    query = query.order_by(totals.c.total_points.desc(), Ticket.id)
+    if limit:
+        query = query.limit(limit)
+    if offset:
+        query = query.offset(offset)
+    return query
+
+
+# Filters the in-memory board can answer; group:N still goes to SQL
+MEMORY_GROUPS = {None: None, "all": None, "VIP": "VIP", "Student": "Student"}
+STREAM_MIN_INTERVAL = 0.5   # coalesce answer bursts into one delta per interval
+STREAM_HEARTBEAT = 15.0
+_leaderboard_lock = asyncio.Lock()
+
+
+async def refresh_leaderboard():
+    """Rebuild the in-memory leaderboard from the answers table (startup / after invalidation)."""
+    async with _leaderboard_lock:
+        if quiz_leaderboard.loaded:
+            return
+        quiz_leaderboard.begin_rebuild()
+        session = get_async_session()
+        try:
+            # Cut the totals off at upto_id so answers committed meanwhile are replayed, not double counted
+            upto_id = (await session.execute(select(func.max(Answer.id)))).scalar() or 0
+            rows = (await session.execute(_leaderboard_query(None, "row", None, 0, upto_answer_id=upto_id))).all()
+            quiz_leaderboard.finish_rebuild(rows, upto_id)
+        except Exception:
+            quiz_leaderboard.finish_rebuild([], 0)
+            quiz_leaderboard.invalidate()
+            raise
+        finally:
+            await session.close()
+
+
+def _check_ranking(ranking: str):
+    if ranking not in RANKINGS:
+        raise HTTPException(status_code=400, detail=f"ranking must be one of: {', '.join(RANKINGS)}")
+
+
 @router.get("/leaderboard")
-def get_leaderboard(group: Optional[str] = None):
+async def get_leaderboard(
+    group: Optional[str] = None,
+    ranking: str = "row",
+    limit: Optional[int] = None,
+    offset: int = 0,
+):
     """
     Get leaderboard. Optional group filter:
     - None or "all" → all participants  
     - "VIP" / "Student" → by ticket type
     - "group:5" → custom group
+    ranking: "row" (1,2,3), "competition" (1,1,3) or "dense" (1,1,2).
+    limit/offset page through the ranked list for top-N views.
+    Served from the in-memory board except for custom groups.
     """
-    session = get_session()
+    _check_ranking(ranking)
+    offset = max(offset, 0)
+
+    if group in MEMORY_GROUPS:
+        if not quiz_leaderboard.loaded:
+            await refresh_leaderboard()
+        ticket_type = MEMORY_GROUPS[group]
+        return {
+            "leaderboard": quiz_leaderboard.top(limit, offset, ticket_type=ticket_type, ranking=ranking),
+            "total_participants": quiz_leaderboard.count(ticket_type),
+        }
+
+    query = _leaderboard_query(group, ranking, limit, offset)
+    if query is None:
+        return {"leaderboard": [], "total_participants": 0}
+
+    session = get_async_session()
     try:
-        # Base query: sum points per ticket
-        query = session.query(
-            Answer.ticket_id,
-            func.sum(Answer.points_earned).label("total_points"),
-            func.count(Answer.id).label("total_answers"),
-            func.sum(func.cast(Answer.is_correct, Integer)).label("correct_answers"),
-        ).group_by(Answer.ticket_id)
-        
-        results = query.all()
-        
-        leaderboard = []
-        for row in results:
-            ticket = session.query(Ticket).filter(Ticket.id == row.ticket_id).first()
-            if not ticket:
-                continue
-            
-            # Apply group filter
-            if group and group != "all":
-                if group in ("VIP", "Student"):
-                    if safe_value(ticket.ticket_type) != group:
-                        continue
-                elif group.startswith("group:"):
-                    try:
-                        gid = int(group.split(":")[1])
-                        is_member = session.query(QuizGroupMember).filter(
-                            QuizGroupMember.group_id == gid,
-                            QuizGroupMember.ticket_id == ticket.id
-                        ).first()
-                        if not is_member:
-                            continue
-                    except (ValueError, IndexError):
-                        continue
-            
-            leaderboard.append({
-                "ticket_id": ticket.id,
-                "guest_name": ticket.guest_name or (ticket.customer.phone if ticket.customer else "—"),
-                "phone": ticket.customer.phone if ticket.customer else "—",
-                "ticket_type": safe_value(ticket.ticket_type),
-                "total_points": int(row.total_points or 0),
-                "total_answers": int(row.total_answers or 0),
-                "correct_answers": int(row.correct_answers or 0),
-            })
+        rows = (await session.execute(query)).all()
+        leaderboard = [{
+            "ticket_id": row.ticket_id,
+            "guest_name": row.guest_name or (row.phone or "—"),
+            "phone": row.phone or "—",
+            "ticket_type": safe_value(row.ticket_type),
+            "total_points": int(row.total_points),
+            "total_answers": int(row.total_answers),
+            "correct_answers": int(row.correct_answers),
+            "rank": row.rank,
+        } for row in rows]
         
-        # Sort by points descending
-        leaderboard.sort(key=lambda x: x["total_points"], reverse=True)
-        
-        # Add rank
-        for i, entry in enumerate(leaderboard):
-            entry["rank"] = i + 1
-        
-        return {"leaderboard": leaderboard}
+        return {
+            "leaderboard": leaderboard,
+            "total_participants": rows[0].total_participants if rows else 0,
+        }
     finally:
-        session.close()
+        await session.close()
+
+
+@router.get("/leaderboard/ticket/{ticket_id}")
+async def get_leaderboard_rank(ticket_id: int, group: Optional[str] = None, ranking: str = "row"):
+    """Rank and totals for one participant (in-memory board)."""
+    _check_ranking(ranking)
+    if group not in MEMORY_GROUPS:
+        raise HTTPException(status_code=400, detail="group must be all, VIP or Student")
+    if not quiz_leaderboard.loaded:
+        await refresh_leaderboard()
+    entry = quiz_leaderboard.rank_of(ticket_id, ticket_type=MEMORY_GROUPS[group], ranking=ranking)
+    if not entry:
+        raise HTTPException(status_code=404, detail="المشارك غير موجود في الترتيب")
+    return entry
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/leaderboard/stream")
+async def stream_leaderboard(request: Request, top: int = 20, group: Optional[str] = None, ranking: str = "row"):
+    """
+    Server-Sent Events feed of the top-N for projector/admin screens.
+    Sends one `snapshot` event, then `delta` events carrying only the entries
+    whose rank or totals changed plus the ticket ids that left the top-N.
+    """
+    _check_ranking(ranking)
+    if group not in MEMORY_GROUPS:
+        raise HTTPException(status_code=400, detail="group must be all, VIP or Student")
+    ticket_type = MEMORY_GROUPS[group]
+    top = max(1, min(top, 500))
+
+    async def events():
+        sent, sent_total = None, None
+        version = -1
+        while not await request.is_disconnected():
+            if not await quiz_leaderboard.wait_for_change(version, STREAM_HEARTBEAT):
+                yield ": ping\n\n"
+                continue
+            version = quiz_leaderboard.version
+            if not quiz_leaderboard.loaded:
+                await refresh_leaderboard()
+                version = quiz_leaderboard.version
+
+            current = {e["ticket_id"]: e for e in quiz_leaderboard.top(top, ticket_type=ticket_type, ranking=ranking)}
+            total = quiz_leaderboard.count(ticket_type)
+            if sent is None:
+                yield _sse("snapshot", {"leaderboard": list(current.values()), "total_participants": total})
+            else:
+                changed = [e for tid, e in current.items() if sent.get(tid) != e]
+                removed = [tid for tid in sent if tid not in current]
+                if changed or removed or total != sent_total:
+                    yield _sse("delta", {"changed": changed, "removed": removed, "total_participants": total})
+            sent, sent_total = current, total
+            await asyncio.sleep(STREAM_MIN_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @router.get("/answers/{question_id}")
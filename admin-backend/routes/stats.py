@@ -1,88 +1,150 @@
 """
 Statistics API Routes
 """
-from fastapi import APIRouter
-from sqlalchemy import func
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
-from models import get_session, Ticket, Customer, TicketType, TicketStatus, safe_value
+from fastapi import APIRouter, HTTPException
+from sqlalchemy import func, select
+
+from models import (
+    get_async_session, async_engine, async_serialized_write, count_stats, rebuild_stat_counters,
+    rollup_bucket, ROLLUP_MEASURES, StatCounter, Ticket, TicketRollup, Customer, TicketStatus, safe_value,
+)
+from services.pagination import clamp_limit
 
 router = APIRouter()
 
 
 @router.get("/dashboard")
 async def get_dashboard_stats():
-    """Get dashboard statistics"""
-    session = get_session()
+    """Get dashboard statistics (read from stat_counters, kept current by every ticket/customer write)"""
+    session = get_async_session()
     try:
-        # Total tickets
-        total_tickets = session.query(func.count(Ticket.id)).scalar() or 0
-        
-        # By status
-        pending = session.query(func.count(Ticket.id)).filter(
-            func.lower(Ticket.status) == 'pending'
-        ).scalar() or 0
-        
-        payment_submitted = session.query(func.count(Ticket.id)).filter(
-            func.lower(Ticket.status) == 'payment_submitted'
-        ).scalar() or 0
-        
-        approved = session.query(func.count(Ticket.id)).filter(
-            func.lower(Ticket.status) == 'approved'
-        ).scalar() or 0
-        
-        rejected = session.query(func.count(Ticket.id)).filter(
-            func.lower(Ticket.status) == 'rejected'
-        ).scalar() or 0
-        
-        activated = session.query(func.count(Ticket.id)).filter(
-            func.lower(Ticket.status) == 'activated'
-        ).scalar() or 0
-        
-        # By type
-        vip_count = session.query(func.count(Ticket.id)).filter(
-            func.upper(Ticket.ticket_type) == 'VIP'
-        ).scalar() or 0
-        
-        student_count = session.query(func.count(Ticket.id)).filter(
-            func.upper(Ticket.ticket_type) == 'STUDENT'
-        ).scalar() or 0
-        
-        # Revenue
-        total_revenue = session.query(func.sum(Ticket.price)).filter(
-            func.lower(Ticket.status).in_(['approved', 'activated'])
-        ).scalar() or 0
-        
-        # Customers count
-        total_customers = session.query(func.count(Customer.id)).scalar() or 0
-        
+        counters = dict((await session.execute(select(StatCounter.key, StatCounter.value))).all())
         return {
-            "total_tickets": total_tickets,
-            "by_status": {
-                "pending": pending,
-                "payment_submitted": payment_submitted,
-                "approved": approved,
-                "rejected": rejected,
-                "activated": activated
-            },
+            "total_tickets": counters.get("tickets", 0),
+            "by_status": {status.value: counters.get(f"status:{status.value}", 0) for status in TicketStatus},
             "by_type": {
-                "vip": vip_count,
-                "student": student_count
+                "vip": counters.get("type:VIP", 0),
+                "student": counters.get("type:STUDENT", 0)
             },
-            "total_revenue": total_revenue,
-            "total_customers": total_customers
+            "total_revenue": counters.get("revenue", 0),
+            "total_customers": counters.get("customers", 0)
         }
     finally:
-        session.close()
+        await session.close()
+
+
+@router.get("/dashboard/check")
+async def check_dashboard_stats(rebuild: bool = False):
+    """Recount tickets and customers and compare with the dashboard counters; rebuild=true replaces them when they drifted"""
+    async with async_engine.connect() as conn:
+        stored = dict((await conn.execute(select(StatCounter.key, StatCounter.value))).all())
+        actual = await conn.run_sync(count_stats)
+    drift = {
+        key: {"stored": stored.get(key, 0), "actual": actual.get(key, 0)}
+        for key in sorted(set(stored) | set(actual))
+        if stored.get(key, 0) != actual.get(key, 0)
+    }
+    rebuilt = False
+    if drift and rebuild:
+        async with async_serialized_write():
+            async with async_engine.begin() as conn:
+                await conn.run_sync(rebuild_stat_counters)
+        rebuilt = True
+    return {"consistent": not drift, "drift": drift, "rebuilt": rebuilt}
+
+
+# Default and longest windows for /timeseries, per period
+TIMESERIES_WINDOWS = {
+    "hour": (timedelta(hours=48), timedelta(days=31)),
+    "day": (timedelta(days=30), timedelta(days=731)),
+}
+TIMESERIES_GROUPS = {"ticket_type": TicketRollup.ticket_type, "distributor": TicketRollup.distributor_id}
+
+
+def _utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+@router.get("/timeseries")
+async def get_timeseries(
+    period: str = "hour",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    ticket_type: Optional[str] = None,
+    distributor_id: Optional[int] = None,
+    group_by: Optional[str] = None,
+):
+    """Bookings, approvals, activations and net revenue per hour/day, from ticket_rollups only.
+
+    distributor_id=0 selects tickets not sold by a distributor; group_by is
+    ticket_type or distributor. Empty buckets are returned as zeros.
+    """
+    if period not in TIMESERIES_WINDOWS:
+        raise HTTPException(status_code=400, detail="period يجب أن تكون hour أو day")
+    if group_by is not None and group_by not in TIMESERIES_GROUPS:
+        raise HTTPException(status_code=400, detail="group_by يجب أن تكون ticket_type أو distributor")
+    default_window, max_window = TIMESERIES_WINDOWS[period]
+    until = _utc_naive(until) or datetime.utcnow()
+    since = max(_utc_naive(since) or until - default_window, until - max_window)
+    first, last = rollup_bucket(period, since), rollup_bucket(period, until)
+
+    group = TIMESERIES_GROUPS.get(group_by)
+    columns = [TicketRollup.bucket] + ([group] if group is not None else [])
+    query = select(*columns, *(func.sum(getattr(TicketRollup, name)) for name in ROLLUP_MEASURES)).where(
+        TicketRollup.period == period, TicketRollup.bucket >= first, TicketRollup.bucket <= last,
+    ).group_by(*columns)
+    if ticket_type:
+        query = query.where(TicketRollup.ticket_type == ticket_type.upper())
+    if distributor_id is not None:
+        query = query.where(TicketRollup.distributor_id == distributor_id)
+
+    session = get_async_session()
+    try:
+        rows = (await session.execute(query)).all()
+    finally:
+        await session.close()
+
+    totals = {}
+    for row in rows:
+        key = row[1] if group is not None else None
+        totals.setdefault(key, {})[row[0]] = dict(zip(ROLLUP_MEASURES, (value or 0 for value in row[-len(ROLLUP_MEASURES):])))
+    step = timedelta(days=1) if period == "day" else timedelta(hours=1)
+    buckets = []
+    bucket = first
+    while bucket <= last:
+        buckets.append(bucket)
+        bucket += step
+    zero = dict.fromkeys(ROLLUP_MEASURES, 0)
+
+    def points(series):
+        return [{"bucket": b.isoformat(), **series.get(b, zero)} for b in buckets]
+
+    result = {"period": period, "since": first.isoformat(), "until": last.isoformat()}
+    if group is None:
+        result["points"] = points(totals.get(None, {}))
+    else:
+        result["groups"] = [{group_by: key, "points": points(series)} for key, series in sorted(totals.items())]
+    return result
 
 
 @router.get("/recent-tickets")
 async def get_recent_tickets(limit: int = 10):
     """Get recent tickets"""
-    session = get_session()
+    session = get_async_session()
     try:
-        tickets = session.query(Ticket).join(Customer).order_by(
-            Ticket.created_at.desc()
-        ).limit(limit).all()
+        tickets = (await session.execute(
+            select(
+                Ticket.id, Ticket.code, Ticket.ticket_type, Ticket.status, Ticket.price,
+                Ticket.created_at, Customer.name.label("customer_name"),
+            ).join(Customer, Ticket.customer_id == Customer.id).order_by(
+                Ticket.created_at.desc(), Ticket.id.desc()
+            ).limit(clamp_limit(limit))
+        )).all()
         
         results = []
         for t in tickets:
@@ -93,7 +155,7 @@ async def get_recent_tickets(limit: int = 10):
                 results.append({
                     "id": t.id,
                     "code": t.code,
-                    "customer_name": t.customer.name,
+                    "customer_name": t.customer_name,
                     "ticket_type": ticket_type,
                     "status": status,
                     "price": t.price,
@@ -103,4 +165,4 @@ async def get_recent_tickets(limit: int = 10):
                 continue
         return results
     finally:
-        session.close()
+        await session.close()
@@ -1,16 +1,29 @@
 """
 Tickets API Routes
 """
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, BackgroundTasks, Request, Header
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timezone
+import asyncio
 import base64
+import json
 import os
 
-from models import get_session, Customer, Ticket, TicketType, TicketStatus, TicketDraft, safe_value
-from sqlalchemy import func
+from models import get_async_session, async_serialized_write, insert_or_ignore, allocate_ticket_codes_async, Customer, Ticket, TicketType, TicketStatus, TicketDraft, GateScan, OutboxMessage, OutboxStatus, safe_value
+from sqlalchemy import func, select, or_
+from sqlalchemy.orm import selectinload, undefer
 from routes.auth import verify_token
+from services.blob_store import blob_store, parse_data_uri, sniff_mime
+from services.pagination import clamp_limit, keyset_page, next_cursor
+from services.phones import normalize_phone
+from services.quiz_cache import quiz_cache
+from services.pdf_generator import generate_ticket_pdf, warm_up as warm_up_ticket_pdf, LAYOUT_VERSION
+from services.render_cache import RenderCache
+from services.render_pool import render_pool, render_key, RenderAhead
+from services.ticket_qr import ticket_qr, VERSION as QR_VERSION
+from routes.jobs import enqueue_job, register_handler
 
 # Allowed file types for payment proof uploads
 ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/png", "image/gif", "image/webp", "application/pdf"]
@@ -78,30 +91,73 @@ whatsapp_service = WhatsAppService()
 
 from services import email_service
 
+PAYMENT_PROOF_URL = "/api/tickets/payment-proofs/{key}"
+PAYMENT_PROOF_FIELDS = ("payment_proof", "payment_proof_key", "payment_proof_size", "payment_proof_mime")
+
+
+async def _payment_proof_fields(value: Optional[str]) -> dict:
+    """Move an inline data: URI into the blob store; keep anything else (proof info text) as-is.
+
+    The stored mime comes from the bytes, never from the client's data: URI,
+    since the blob is served publicly under it.
+    """
+    parsed = parse_data_uri(value)
+    if not parsed:
+        return {"payment_proof": value, "payment_proof_key": None, "payment_proof_size": None, "payment_proof_mime": None}
+    data, _ = parsed
+    key = await asyncio.to_thread(blob_store.put, data)
+    return {"payment_proof": None, "payment_proof_key": key, "payment_proof_size": len(data), "payment_proof_mime": sniff_mime(data)}
+
+
+def _apply_payment_proof(target, fields: dict):
+    for name, value in fields.items():
+        setattr(target, name, value)
+
+
+def _copy_payment_proof(source) -> dict:
+    return {name: getattr(source, name) for name in PAYMENT_PROOF_FIELDS}
+
+
+def payment_proof_url(ticket) -> Optional[str]:
+    """What the admin UI should show for a proof: the blob URL, or the legacy inline value."""
+    if ticket.payment_proof_key:
+        return PAYMENT_PROOF_URL.format(key=ticket.payment_proof_key)
+    return ticket.payment_proof
+
+
+async def _notify(phone: str, text: str, description: str):
+    """Queue a guest notification in the outbox, so it shares the per-number send rate with every other message."""
+    await enqueue_job("tickets", [{"phone": phone, "kind": "text", "payload": {"text": text}}], description=description)
+
+
+async def _find_customer(session, phone: str):
+    """Customer for a normalized phone: one indexed equality on phone_normalized (oldest if there are duplicates)."""
+    return (await session.execute(
+        select(Customer).where(Customer.phone_normalized == phone).order_by(Customer.id).limit(1)
+    )).scalars().first()
+
+
+async def _get_ticket(session, ticket_id: int):
+    """Load a ticket with its customer eagerly (lazy loads are not allowed on AsyncSession)."""
+    result = await session.execute(
+        select(Ticket).options(selectinload(Ticket.customer)).where(Ticket.id == ticket_id)
+    )
+    return result.scalars().first()
+
 
 @router.post("/whatsapp-booking", response_model=dict)
-async def whatsapp_booking(booking: WhatsAppBooking, background_tasks: BackgroundTasks):
+async def whatsapp_booking(booking: WhatsAppBooking):
     """
     Unified Endpoint:
     1. If 'tickets' array is provided -> Creates one ticket per item (new per-ticket flow).
     2. If user sends Image -> Updates 'PENDING' tickets (Payment Proof).
     3. If user sends Text (w/ Ticket Type) -> Creates NEW ticket (legacy single-ticket flow).
     """
-    session = get_session()
+    session = get_async_session()
     try:
-        # 1. Robust Phone Normalization & Search
-        raw_phone = booking.phone.replace("+", "").replace(" ", "").strip()
-        possible_phones = {raw_phone}
-        if raw_phone.startswith("0"): possible_phones.add("2" + raw_phone)
-        if raw_phone.startswith("20"): possible_phones.add("0" + raw_phone[2:])
-        possible_phones.add("2" + raw_phone if not raw_phone.startswith("2") else raw_phone)
-
-        # Normalize phone for DB storage
-        final_phone = raw_phone
-        if final_phone.startswith("0") and len(final_phone) == 11:
-            final_phone = "20" + final_phone[1:]
-
-        customer = session.query(Customer).filter(Customer.phone.in_(possible_phones)).first()
+        # 1. Phone normalization & search (services.phones)
+        final_phone = normalize_phone(booking.phone)
+        customer = await _find_customer(session, final_phone)
 
         # ===== NEW: Handle tickets array (per-ticket flow) =====
         if booking.tickets and len(booking.tickets) > 0:
@@ -114,46 +170,53 @@ async def whatsapp_booking(booking: WhatsAppBooking, background_tasks: Backgroun
                     email=first_ticket.email
                 )
                 session.add(customer)
-                session.commit()
-                session.refresh(customer)
+                async with async_serialized_write():
+                    await session.commit()
+                await session.refresh(customer)
 
             vip_price = int(os.getenv("VIP_PRICE", 500))
             student_price = int(os.getenv("STUDENT_PRICE", 100))
 
+            # The shared screenshot is stored once; every ticket references the same blob
+            shared_proof = None
+            if booking.payment_proof_base64:
+                if not booking.payment_proof_base64.startswith("data:image"):
+                    shared_proof = await _payment_proof_fields(f"data:image/jpeg;base64,{booking.payment_proof_base64}")
+                else:
+                    shared_proof = await _payment_proof_fields(booking.payment_proof_base64)
+
             created_tickets = []
-            for ticket_item in booking.tickets:
+            codes = await allocate_ticket_codes_async(len(booking.tickets))
+            for ticket_item, code in zip(booking.tickets, codes):
                 # Map ticket type
                 ticket_type_str = ticket_item.ticket_type.strip().upper()
                 ticket_type = TicketType.VIP if ticket_type_str in ("VIP", "في اي بي") else TicketType.STUDENT
                 price = vip_price if ticket_type == TicketType.VIP else student_price
 
                 # Process payment proof image
-                proof_data = None
-                if booking.payment_proof_base64:
-                    if not booking.payment_proof_base64.startswith("data:image"):
-                        proof_data = f"data:image/jpeg;base64,{booking.payment_proof_base64}"
-                    else:
-                        proof_data = booking.payment_proof_base64
-                elif ticket_item.payment_proof_info:
-                    proof_data = ticket_item.payment_proof_info
+                if shared_proof:
+                    proof_fields = shared_proof
+                else:
+                    proof_fields = await _payment_proof_fields(ticket_item.payment_proof_info or None)
 
                 # All 4 fields are required, so status is PAYMENT_SUBMITTED
                 ticket = Ticket(
-                    code=Ticket.generate_unique_code(session),
+                    code=code,
                     ticket_type=ticket_type,
                     price=price,
                     customer_id=customer.id,
                     guest_name=ticket_item.name,
                     payment_method="Vodafone Cash",
-                    payment_proof=proof_data,
-                    status=TicketStatus.PAYMENT_SUBMITTED
+                    status=TicketStatus.PAYMENT_SUBMITTED,
+                    **proof_fields
                 )
                 session.add(ticket)
                 created_tickets.append(ticket)
 
-            session.commit()
+            async with async_serialized_write():
+                await session.commit()
             for t in created_tickets:
-                session.refresh(t)
+                await session.refresh(t)
 
             total_price = sum(t.price for t in created_tickets)
             return {
@@ -173,10 +236,12 @@ async def whatsapp_booking(booking: WhatsAppBooking, background_tasks: Backgroun
 
         # ===== LEGACY: Handle Payment Proof Update (If image provided + customer exists) =====
         if booking.payment_proof_base64 and customer:
-            pending_tickets = session.query(Ticket).filter(
-                Ticket.customer_id == customer.id,
-                Ticket.status == TicketStatus.PENDING
-            ).order_by(Ticket.created_at.asc()).all()
+            pending_tickets = (await session.execute(
+                select(Ticket).where(
+                    Ticket.customer_id == customer.id,
+                    Ticket.status == TicketStatus.PENDING
+                ).order_by(Ticket.created_at.asc())
+            )).scalars().all()
 
             if pending_tickets:
                 # Process image
@@ -184,14 +249,16 @@ async def whatsapp_booking(booking: WhatsAppBooking, background_tasks: Backgroun
                     payment_proof = f"data:image/jpeg;base64,{booking.payment_proof_base64}"
                 else:
                     payment_proof = booking.payment_proof_base64
+                proof_fields = await _payment_proof_fields(payment_proof)
 
                 for t in pending_tickets:
-                    t.payment_proof = payment_proof
+                    _apply_payment_proof(t, proof_fields)
                     t.status = TicketStatus.PAYMENT_SUBMITTED
-                session.commit()
+                async with async_serialized_write():
+                    await session.commit()
 
                 msg = f"تم استلام إثبات الدفع لـ {len(pending_tickets)} تذاكر.\nجاري المراجعة... ⏳"
-                background_tasks.add_task(whatsapp_service.send_message, customer.phone, msg)
+                await _notify(customer.phone, msg, "استلام إثبات الدفع")
                 
                 return {
                     "success": True,
@@ -201,10 +268,12 @@ async def whatsapp_booking(booking: WhatsAppBooking, background_tasks: Backgroun
             
             if not booking.ticket_type:
                  if customer:
-                     recent_submitted = session.query(Ticket).filter(
-                         Ticket.customer_id == customer.id,
-                         Ticket.status == TicketStatus.PAYMENT_SUBMITTED
-                     ).order_by(Ticket.updated_at.desc()).first()
+                     recent_submitted = (await session.execute(
+                         select(Ticket).where(
+                             Ticket.customer_id == customer.id,
+                             Ticket.status == TicketStatus.PAYMENT_SUBMITTED
+                         ).order_by(Ticket.updated_at.desc())
+                     )).scalars().first()
                      
                      if recent_submitted:
                          return {
@@ -214,7 +283,9 @@ async def whatsapp_booking(booking: WhatsAppBooking, background_tasks: Backgroun
                              "status": safe_value(recent_submitted.status)
                          }
 
-                     all_tickets = session.query(Ticket).filter(Ticket.customer_id == customer.id).all()
+                     all_tickets = (await session.execute(
+                         select(Ticket).where(Ticket.customer_id == customer.id)
+                     )).scalars().all()
                      tickets_status = [f"{t.code}:{safe_value(t.status)}" for t in all_tickets]
                      detail_msg = f"العميل موجود ({customer.phone})، لكن لا توجد تذاكر PENDING. التذاكر الموجودة: {tickets_status}"
                  else:
@@ -229,8 +300,9 @@ async def whatsapp_booking(booking: WhatsAppBooking, background_tasks: Backgroun
         if not customer:
             customer = Customer(name=booking.name or "Guest", phone=final_phone, email=booking.email)
             session.add(customer)
-            session.commit()
-            session.refresh(customer)
+            async with async_serialized_write():
+                await session.commit()
+            await session.refresh(customer)
         elif booking.name: 
              pass 
 
@@ -249,20 +321,22 @@ async def whatsapp_booking(booking: WhatsAppBooking, background_tasks: Backgroun
              else:
                 payment_proof = booking.payment_proof_base64
              status = TicketStatus.PAYMENT_SUBMITTED
+        proof_fields = await _payment_proof_fields(payment_proof)
 
         ticket = Ticket(
-            code=Ticket.generate_unique_code(session),
+            code=await Ticket.generate_unique_code_async(session),
             ticket_type=ticket_type,
             price=price,
             customer_id=customer.id,
             guest_name=booking.name or customer.name,
             payment_method="Vodafone Cash",
-            payment_proof=payment_proof,
-            status=status
+            status=status,
+            **proof_fields
         )
         session.add(ticket)
-        session.commit()
-        session.refresh(ticket)
+        async with async_serialized_write():
+            await session.commit()
+        await session.refresh(ticket)
 
         return {
             "success": True,
@@ -273,28 +347,28 @@ async def whatsapp_booking(booking: WhatsAppBooking, background_tasks: Backgroun
         }
 
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 @router.post("/", response_model=dict)
-async def create_ticket(ticket_data: TicketCreate, background_tasks: BackgroundTasks):
+async def create_ticket(ticket_data: TicketCreate):
     """Create a new ticket reservation"""
-    session = get_session()
+    session = get_async_session()
     try:
         # Check if customer exists
-        customer = session.query(Customer).filter(Customer.phone == ticket_data.phone).first()
+        customer = await _find_customer(session, normalize_phone(ticket_data.phone))
         
         if not customer:
             customer = Customer(
                 name=ticket_data.name,
-                phone=ticket_data.phone,
+                phone=normalize_phone(ticket_data.phone),
                 email=ticket_data.email
             )
             session.add(customer)
-            session.commit()
-            session.refresh(customer)
+            await session.commit()
+            await session.refresh(customer)
         
         # Get price based on ticket type
         vip_price = int(os.getenv("VIP_PRICE", 500))
@@ -302,7 +376,7 @@ async def create_ticket(ticket_data: TicketCreate, background_tasks: BackgroundT
         price = vip_price if ticket_data.ticket_type == TicketType.VIP else student_price
         
         # Generate unique code
-        code = Ticket.generate_unique_code(session)
+        code = await Ticket.generate_unique_code_async(session)
         
         # Create ticket
         ticket = Ticket(
@@ -315,12 +389,12 @@ async def create_ticket(ticket_data: TicketCreate, background_tasks: BackgroundT
             status=TicketStatus.PENDING
         )
         session.add(ticket)
-        session.commit()
-        session.refresh(ticket)
+        await session.commit()
+        await session.refresh(ticket)
 
         # Send Pending Message via WhatsApp
         msg = f"مرحباً {ticket.guest_name or customer.name} 👋\nتم تسجيل طلب تذكرتك بنجاح!\nنوع التذكرة: {safe_value(ticket.ticket_type)}\nالسعر: {price} جنيه\n\nيرجى إتمام الدفع لتأكيد الحجز."
-        background_tasks.add_task(whatsapp_service.send_message, customer.phone, msg)
+        await _notify(customer.phone, msg, f"طلب تذكرة {ticket.code}")
         
         return {
             "success": True,
@@ -330,27 +404,36 @@ async def create_ticket(ticket_data: TicketCreate, background_tasks: BackgroundT
             "message": f"تم استلام طلب تذكرة {safe_value(ticket_data.ticket_type)} بنجاح. يرجى إتمام الدفع."
         }
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 @router.get("/check/{phone}")
 async def check_customer_tickets(phone: str):
     """Check if a phone number has existing tickets"""
-    session = get_session()
+    session = get_async_session()
     try:
-        customer = session.query(Customer).filter(Customer.phone == phone).first()
-        
-        if not customer:
-            return {
-                "has_tickets": False,
-                "tickets": [],
-                "message": "لم يتم العثور على حجوزات سابقة لهذا الرقم"
-            }
+        phone = normalize_phone(phone)
+        customer = await _find_customer(session, phone)
         
-        tickets = session.query(Ticket).filter(Ticket.customer_id == customer.id).all()
+        if customer:
+            tickets = (await session.execute(
+                select(Ticket).where(Ticket.customer_id == customer.id)
+            )).scalars().all()
+        else:
+            # A guest whose ticket someone else booked, checking with their own number
+            tickets = (await session.execute(
+                select(Ticket).options(selectinload(Ticket.customer)).where(Ticket.guest_phone_normalized == phone)
+            )).scalars().all()
+            if not tickets:
+                return {
+                    "has_tickets": False,
+                    "tickets": [],
+                    "message": "لم يتم العثور على حجوزات سابقة لهذا الرقم"
+                }
+            customer = tickets[0].customer
         
         return {
             "has_tickets": len(tickets) > 0,
@@ -368,48 +451,67 @@ async def check_customer_tickets(phone: str):
             "message": f"تم العثور على {len(tickets)} تذكرة لهذا الرقم"
         }
     finally:
-        session.close()
+        await session.close()
 
 
 @router.get("/", response_model=List[dict])
-async def get_all_tickets(status: Optional[str] = None, token_data: dict = Depends(verify_token)):
-    """Get all tickets with optional status filter"""
-    session = get_session()
+async def get_all_tickets(
+    response: Response,
+    status: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    token_data: dict = Depends(verify_token),
+):
+    """
+    Get all tickets with optional status filter, newest first.
+    Keyset-paginated: at most LIST_MAX_PAGE_SIZE rows per call, even without `limit`;
+    pass the X-Next-Cursor response header back as `cursor` for the rest.
+    Proofs are listed as their blob URL only; legacy inline proofs (not yet moved by
+    scripts/migrate_payment_proofs.py) are never read here, only flagged by
+    has_payment_proof; GET /{ticket_id} returns them.
+    """
+    limit = clamp_limit(limit)
+    session = get_async_session()
     try:
-        query = session.query(Ticket).join(Customer)
+        query = select(
+            Ticket.id, Ticket.code, Ticket.ticket_type, Ticket.status, Ticket.price,
+            Ticket.guest_name, Ticket.payment_method, Ticket.payment_proof_key,
+            or_(Ticket.payment_proof_key.isnot(None), Ticket.payment_proof.isnot(None)).label("has_payment_proof"),
+            Ticket.created_at, Customer.name.label("customer_name"),
+            Customer.phone.label("customer_phone"), Customer.email.label("customer_email"),
+        ).join(Customer, Ticket.customer_id == Customer.id)
         
         if status:
-            query = query.filter(func.lower(Ticket.status) == status.lower())
+            query = query.where(func.lower(Ticket.status) == status.lower())
+        
+        try:
+            query = keyset_page(query, Ticket.created_at, Ticket.id, cursor, limit)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="cursor غير صالح")
         
-        tickets = query.order_by(Ticket.created_at.desc()).all()
+        rows = (await session.execute(query)).all()
+        cursor = next_cursor(rows, limit)
+        if cursor:
+            response.headers["X-Next-Cursor"] = cursor
         
         results = []
-        for t in tickets:
+        for t in rows:
             try:
                 ticket_type = safe_value(t.ticket_type)
                 status = safe_value(t.status)
                 
-                # Check for huge payment proof to prevent crash
-                proof = t.payment_proof
-                if proof and len(proof) > 100000: # Limit list view proof size to 100KB
-                    # We keep it as is, or maybe truncate? 
-                    # Truncating breaks image. Setting to None hides it.
-                    # For now let's allow it but warn if it's causing issues.
-                    # Actually, let's play safe. If it's > 2MB, we drop it from list.
-                    if len(proof) > 2000000:
-                        proof = None
-                
                 results.append({
                     "id": t.id,
                     "code": t.code,
                     "ticket_type": ticket_type,
                     "status": status,
                     "price": t.price,
-                    "customer_name": t.guest_name if t.guest_name else (t.customer.name if t.customer else "Unknown"),
-                    "customer_phone": t.customer.phone if t.customer else "Unknown",
-                    "customer_email": t.customer.email if t.customer else None,
+                    "customer_name": t.guest_name if t.guest_name else (t.customer_name or "Unknown"),
+                    "customer_phone": t.customer_phone or "Unknown",
+                    "customer_email": t.customer_email,
                     "payment_method": t.payment_method,
-                    "payment_proof": proof,
+                    "payment_proof": PAYMENT_PROOF_URL.format(key=t.payment_proof_key) if t.payment_proof_key else None,
+                    "has_payment_proof": bool(t.has_payment_proof),
                     "created_at": t.created_at.isoformat()
                 })
             except Exception as e:
@@ -418,11 +520,11 @@ async def get_all_tickets(status: Optional[str] = None, token_data: dict = Depen
                 
         return results
     finally:
-        session.close()
+        await session.close()
 
 
 @router.post("/{ticket_id}/payment-proof")
-async def upload_payment_proof(ticket_id: int, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_payment_proof(ticket_id: int, file: UploadFile = File(...)):
     """Upload payment proof image"""
     # Validate file type
     if file.content_type not in ALLOWED_IMAGE_TYPES:
@@ -439,119 +541,316 @@ async def upload_payment_proof(ticket_id: int, background_tasks: BackgroundTasks
             detail=f"حجم الملف كبير جداً ({len(content) // (1024*1024)}MB). الحد الأقصى: 10MB"
         )
     
-    session = get_session()
+    session = get_async_session()
     try:
-        ticket = session.query(Ticket).filter(Ticket.id == ticket_id).first()
+        ticket = await _get_ticket(session, ticket_id)
         
         if not ticket:
             raise HTTPException(status_code=404, detail="التذكرة غير موجودة")
         
-        # Encode validated file
-        encoded = base64.b64encode(content).decode('utf-8')
-        
-        # Always ensure proper prefix for uploaded files
-        ticket.payment_proof = f"data:{file.content_type};base64,{encoded}"
+        # Store validated file in the blob store, keep only the reference
+        _apply_payment_proof(ticket, {
+            "payment_proof": None,
+            "payment_proof_key": await asyncio.to_thread(blob_store.put, content),
+            "payment_proof_size": len(content),
+            "payment_proof_mime": sniff_mime(content),
+        })
         ticket.status = TicketStatus.PAYMENT_SUBMITTED
-        session.commit()
+        await session.commit()
 
         # Send Payment Received Message
         msg = f"تم استلام إثبات الدفع لتذكرتك (كود: {ticket.code}).\nسيتم مراجعته وتأكيد الحجز قريباً. ⏳"
-        background_tasks.add_task(whatsapp_service.send_message, ticket.customer.phone, msg)
+        await _notify(ticket.customer.phone, msg, f"إثبات دفع {ticket.code}")
         
         return {
             "success": True,
             "message": "تم رفع إثبات الدفع بنجاح، في انتظار المراجعة"
         }
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 # Endpoint 'upload_proof_for_pending' removed - logic unified in 'whatsapp_booking'
 
 
-from fastapi import BackgroundTasks
-from services.pdf_generator import generate_ticket_pdf
+def _parse_range(range_header: str, size: int):
+    """Parse a single 'bytes=start-end' range. Returns (start, end) or None if unsatisfiable."""
+    try:
+        unit, _, spec = range_header.partition("=")
+        if unit.strip().lower() != "bytes" or "," in spec:
+            return None
+        start_s, _, end_s = spec.strip().partition("-")
+        if start_s == "":
+            length = int(end_s)
+            if length <= 0:
+                return None
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        end = min(end, size - 1)
+        if start > end or start >= size:
+            return None
+        return start, end
+    except ValueError:
+        return None
+
+
+@router.get("/payment-proofs/{key}")
+async def get_payment_proof_blob(key: str, request: Request):
+    """
+    Stream a stored payment proof by its content hash.
+    The SHA-256 key is unguessable and immutable, so it doubles as the ETag
+    and lets <img> tags in the admin UI load proofs without a bearer token.
+    """
+    if not blob_store.is_valid_key(key) or not blob_store.exists(key):
+        raise HTTPException(status_code=404, detail="الملف غير موجود")
+
+    session = get_async_session()
+    try:
+        mime = (await session.execute(
+            select(Ticket.payment_proof_mime).where(Ticket.payment_proof_key == key).limit(1)
+        )).scalar()
+        if mime is None:
+            mime = (await session.execute(
+                select(TicketDraft.payment_proof_mime).where(TicketDraft.payment_proof_key == key).limit(1)
+            )).scalar()
+    finally:
+        await session.close()
+
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    # Only the proof types are served as themselves (rows stored before the mime was sniffed may hold anything);
+    # everything else downloads as opaque bytes so a crafted upload can never render as a page on this origin
+    size = blob_store.size(key)
+    media_type = mime if mime in ALLOWED_IMAGE_TYPES else "application/octet-stream"
+    extension = media_type.rsplit("/", 1)[-1] if media_type in ALLOWED_IMAGE_TYPES else "bin"
+    disposition = "inline" if media_type in ALLOWED_IMAGE_TYPES else "attachment"
+    headers.update({"X-Content-Type-Options": "nosniff",
+                    "Content-Disposition": f'{disposition}; filename="payment-proof-{key[:12]}.{extension}"'})
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+        return StreamingResponse(blob_store.iter_range(key, start, end), status_code=206,
+                                 media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(blob_store.iter_range(key), media_type=media_type, headers=headers)
+
+
+# ── Approval: the ticket PDF renders in the worker pool and goes out through the outbox ──
+
+TICKET_CAPTION = "مبروك! 🌟 تم تأكيد تذكرتك لحضور إيفنت Be Star.\nالكود: {code}"
+
+render_pool.add_warmup(warm_up_ticket_pdf)
+ticket_renders = RenderAhead(render_pool, generate_ticket_pdf)
+ticket_pdf_cache = RenderCache("tickets")
+
+
+class BulkApproval(BaseModel):
+    ticket_ids: List[int]
+
+
+def _ticket_pdf_args(ticket) -> dict:
+    # Use guest name for ticket generation
+    return {
+        "ticket_code": ticket.code,
+        "ticket_type": safe_value(ticket.ticket_type),
+        "customer_name": ticket.guest_name if ticket.guest_name else ticket.customer.name,
+        "price": ticket.price,
+        "qr_payload": ticket_qr.sign(ticket.id, ticket.code, safe_value(ticket.ticket_type)),
+    }
+
+
+def _ticket_pdf_key(pdf_args: dict) -> str:
+    """Everything the PDF depends on: the ticket fields, the event env vars it prints, the generator itself."""
+    return render_key({**pdf_args, "event_date": os.getenv("EVENT_DATE", "11 Feb 2026"),
+                       "event_time": os.getenv("EVENT_TIME", "7:00 PM"), "layout": LAYOUT_VERSION})
+
+
+async def _ticket_pdf(pdf_args: dict) -> bytes:
+    """Cached render, else the one prefetched at approval (or a fresh one) from the pool."""
+    return await ticket_pdf_cache.get_or_render(_ticket_pdf_key(pdf_args), lambda: ticket_renders.take(pdf_args))
+
+
+async def _send_ticket_pdf(phone: str, payload: dict, instance: str):
+    pdf_bytes = await _ticket_pdf(payload["pdf"])
+    pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+    return await whatsapp_service.send_pdf_ticket(phone, pdf_base64, TICKET_CAPTION.format(code=payload["pdf"]["ticket_code"]),
+                                                  instance=instance)
+
+
+register_handler("ticket_pdf", _send_ticket_pdf)
+
+
+async def _email_ticket(to_email: str, pdf_args: dict):
+    pdf_bytes = await _ticket_pdf(pdf_args)
+    await email_service.send_ticket_email(
+        to_email=to_email,
+        customer_name=pdf_args["customer_name"],
+        ticket_code=pdf_args["ticket_code"],
+        ticket_type=pdf_args["ticket_type"],
+        pdf_bytes=pdf_bytes
+    )
+
+
+async def _prefetch_tickets(job_id: int):
+    """
+    Start rendering a job's still-queued PDFs in send order. A prefetched
+    render is only released by take(), so read the queue rather than the
+    request: a repeated idempotency key must not prefetch PDFs already sent.
+    """
+    session = get_async_session()
+    try:
+        payloads = (await session.execute(
+            select(OutboxMessage.payload).where(
+                OutboxMessage.job_id == job_id,
+                OutboxMessage.kind == "ticket_pdf",
+                OutboxMessage.status == OutboxStatus.QUEUED.value,
+            ).order_by(OutboxMessage.priority.desc(), OutboxMessage.id)
+        )).scalars().all()
+    finally:
+        await session.close()
+    # Skip the ones the cache will answer
+    pdf_args = [json.loads(p)["pdf"] for p in payloads]
+    ticket_renders.prefetch(args for args in pdf_args if not ticket_pdf_cache.contains(_ticket_pdf_key(args)))
+
+
+async def _dispatch_approved(tickets: list, background_tasks: BackgroundTasks,
+                             idempotency_key: Optional[str] = None) -> int:
+    """Queue the WhatsApp PDF of each approved ticket (rendered ahead in the pool) and email it where there is an address."""
+    deliveries = [(ticket, _ticket_pdf_args(ticket)) for ticket in tickets]
+    job_id = await enqueue_job("tickets", [{
+        "phone": ticket.customer.phone,
+        "key": f"{ticket.customer.phone}:{ticket.id}",   # one customer can own several tickets
+        "kind": "ticket_pdf",
+        "payload": {"ticket_id": ticket.id, "pdf": pdf_args},
+    } for ticket, pdf_args in deliveries], description=f"{len(deliveries)} تذكرة", idempotency_key=idempotency_key)
+    await _prefetch_tickets(job_id)
+
+    for ticket, pdf_args in deliveries:
+        if ticket.customer.email:
+            background_tasks.add_task(_email_ticket, ticket.customer.email, pdf_args)
+    return job_id
+
+
+@router.post("/bulk-approve")
+async def bulk_approve_tickets(req: BulkApproval, background_tasks: BackgroundTasks, admin_id: int = 1,
+                               idempotency_key: Optional[str] = Header(None), token_data: dict = Depends(verify_token)):
+    """Approve many tickets at once; their PDFs render in parallel and are sent through one outbox job"""
+    session = get_async_session()
+    try:
+        tickets = (await session.execute(
+            select(Ticket).options(selectinload(Ticket.customer)).where(Ticket.id.in_(req.ticket_ids))
+        )).scalars().all()
+        found = {ticket.id for ticket in tickets}
+        skipped = [{"ticket_id": ticket_id, "reason": "not_found"} for ticket_id in req.ticket_ids if ticket_id not in found]
+
+        approved = []
+        now = datetime.utcnow()
+        for ticket in tickets:
+            status = safe_value(ticket.status).lower()
+            if status in ("approved", "activated"):
+                skipped.append({"ticket_id": ticket.id, "reason": status})
+                continue
+            ticket.status = TicketStatus.APPROVED
+            ticket.approved_by = admin_id
+            ticket.approved_at = now
+            approved.append(ticket)
+
+        if not approved:
+            return {"success": True, "approved": 0, "skipped": skipped, "job_id": None,
+                    "message": "لا توجد تذاكر جديدة للاعتماد"}
+
+        async with async_serialized_write():
+            await session.commit()
+        quiz_cache.invalidate_tickets()
+
+        job_id = await _dispatch_approved(approved, background_tasks, idempotency_key)
+        return {
+            "success": True,
+            "approved": len(approved),
+            "skipped": skipped,
+            "job_id": job_id,
+            "message": f"تم اعتماد {len(approved)} تذكرة وجاري إرسالها"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        await session.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await session.close()
+
 
 @router.post("/{ticket_id}/approve")
 async def approve_ticket(ticket_id: int, approval: TicketApproval, background_tasks: BackgroundTasks, admin_id: int = 1, token_data: dict = Depends(verify_token)):
     """Approve or reject a ticket"""
-    session = get_session()
+    session = get_async_session()
     try:
-        ticket = session.query(Ticket).filter(Ticket.id == ticket_id).first()
+        ticket = await _get_ticket(session, ticket_id)
         
         if not ticket:
             raise HTTPException(status_code=404, detail="التذكرة غير موجودة")
-        
-        # Use guest name for ticket generation
-        ticket_name = ticket.guest_name if ticket.guest_name else ticket.customer.name
 
         if approval.approved:
             ticket.status = TicketStatus.APPROVED
             ticket.approved_by = admin_id
             ticket.approved_at = datetime.utcnow()
             message = "تم اعتماد التذكرة بنجاح"
-            
-            # Generate PDF with guest name
-            pdf_bytes = generate_ticket_pdf(
-                ticket_code=ticket.code,
-                ticket_type=safe_value(ticket.ticket_type),
-                customer_name=ticket_name,
-                price=ticket.price
-            )
-            # Encode base64
-            pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
-            
-            # Send PDF via WhatsApp
-            background_tasks.add_task(
-                whatsapp_service.send_pdf_ticket, 
-                ticket.customer.phone, 
-                pdf_base64,
-                f"مبروك! 🌟 تم تأكيد تذكرتك لحضور إيفنت Be Star.\nالكود: {ticket.code}"
-            )
-            
-            # Send PDF via Email if available
-            if ticket.customer.email:
-                background_tasks.add_task(
-                    email_service.send_ticket_email,
-                    to_email=ticket.customer.email,
-                    customer_name=ticket_name,
-                    ticket_code=ticket.code,
-                    ticket_type=safe_value(ticket.ticket_type),
-                    pdf_bytes=pdf_bytes
-                )
-            
         else:
             ticket.status = TicketStatus.REJECTED
             ticket.rejection_reason = approval.rejection_reason
             message = "تم رفض التذكرة"
-            
+        
+        await session.commit()
+        quiz_cache.invalidate_tickets()
+
+        if not approval.approved:
             # Send Rejection Message
             msg = f"عذراً، تم رفض طلب التذكرة (كود: {ticket.code}).\nالسبب: {approval.rejection_reason}"
-            background_tasks.add_task(whatsapp_service.send_message, ticket.customer.phone, msg)
-        
-        session.commit()
+            await _notify(ticket.customer.phone, msg, f"رفض تذكرة {ticket.code}")
+
+        # PDF via WhatsApp (outbox) and email; rendering happens off the request
+        job_id = await _dispatch_approved([ticket], background_tasks) if approval.approved else None
         
         return {
             "success": True,
             "status": safe_value(ticket.status),
-            "message": message
+            "message": message,
+            "job_id": job_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 @router.post("/activate")
 async def activate_ticket(activation: TicketActivation, token_data: dict = Depends(verify_token)):
     """Activate an offline ticket by code"""
-    session = get_session()
+    session = get_async_session()
     try:
-        ticket = session.query(Ticket).filter(Ticket.code == activation.code).first()
+        ticket = (await session.execute(
+            select(Ticket).options(selectinload(Ticket.customer)).where(Ticket.code == activation.code)
+        )).scalars().first()
         
         if not ticket:
             raise HTTPException(status_code=404, detail="كود التذكرة غير صحيح")
@@ -563,8 +862,9 @@ async def activate_ticket(activation: TicketActivation, token_data: dict = Depen
                 "activated_phone": ticket.customer.phone
             }
         
-        # Check if already linked to another phone
-        if ticket.customer.phone and ticket.customer.phone != activation.phone:
+        # Check if already linked to another phone (compared in canonical form, services.phones)
+        phone = normalize_phone(activation.phone)
+        if ticket.customer.phone and ticket.customer.phone_normalized != phone:
             return {
                 "success": False,
                 "message": "هذه التذكرة مرتبطة برقم هاتف آخر"
@@ -572,14 +872,15 @@ async def activate_ticket(activation: TicketActivation, token_data: dict = Depen
         
         # Update customer info and activate
         ticket.customer.name = activation.name
-        ticket.customer.phone = activation.phone
+        ticket.customer.phone = phone
         ticket.customer.email = activation.email
         # Also update guest name
         ticket.guest_name = activation.name
         
         ticket.status = TicketStatus.ACTIVATED
         
-        session.commit()
+        await session.commit()
+        quiz_cache.invalidate_tickets()
         
         return {
             "success": True,
@@ -587,18 +888,147 @@ async def activate_ticket(activation: TicketActivation, token_data: dict = Depen
             "message": "تم تفعيل التذكرة بنجاح! نراك في الإيفنت 🎉"
         }
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
+
+
+# ── Gate check-in: gates verify the signed QR offline (services.ticket_qr) and sync their scan journal here ──
+
+GATE_BATCH_MAX = 1000
+ADMITTED_STATUSES = ("approved", "activated")
+
+
+class GateScanItem(BaseModel):
+    scan_id: str        # unique per scan, chosen by the gate
+    payload: str        # the QR text as scanned
+    scanned_at: datetime
+
+
+class GateScanBatch(BaseModel):
+    gate_id: str
+    scans: List[GateScanItem]
+
+
+def _utc(at: datetime) -> datetime:
+    return at.astimezone(timezone.utc).replace(tzinfo=None) if at.tzinfo else at
+
+
+@router.get("/gate/config")
+async def gate_config(token_data: dict = Depends(verify_token)):
+    """What a gate needs to check tickets while offline: the event id and the QR signing key"""
+    return {"version": QR_VERSION, "event_id": ticket_qr.event_id, "secret": ticket_qr.secret, "batch_max": GATE_BATCH_MAX}
+
+
+@router.post("/activate/batch")
+async def activate_batch(batch: GateScanBatch, token_data: dict = Depends(verify_token)):
+    """Sync scans from a gate's journal; approved tickets that were admitted become activated
+
+    Signatures are checked again here. A ticket's earliest scan by gate clock,
+    from any gate, admits it; every other scan of it is a duplicate and comes
+    back with the admitting gate and time, even when the earlier scan syncs
+    later. Re-sending a scan (same scan_id) is harmless and returns its
+    current result; a scan_id already stored for another ticket is a conflict.
+    """
+    if len(batch.scans) > GATE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"الحد الأقصى {GATE_BATCH_MAX} مسحة في الطلب الواحد")
+
+    results, claims = {}, {}
+    for scan in batch.scans:
+        claim = ticket_qr.verify(scan.payload)
+        if claim is None:
+            results[scan.scan_id] = {"result": "invalid"}
+        else:
+            claims[scan.scan_id] = claim
+
+    session = get_async_session()
+    try:
+        async with async_serialized_write():
+            tickets = {ticket.id: ticket for ticket in (await session.execute(
+                select(Ticket).where(Ticket.id.in_({claim.ticket_id for claim in claims.values()}))
+            )).scalars()}
+            rows = []
+            for scan in batch.scans:
+                claim = claims.get(scan.scan_id)
+                if claim is None:
+                    continue
+                ticket = tickets.get(claim.ticket_id)
+                if ticket is None or ticket.code != claim.code:
+                    results[scan.scan_id] = {"result": "not_found", "ticket_id": claim.ticket_id}
+                    continue
+                status = safe_value(ticket.status).lower()
+                if status not in ADMITTED_STATUSES:
+                    results[scan.scan_id] = {"result": "not_approved", "ticket_id": ticket.id, "status": status}
+                    continue
+                rows.append({"scan_id": scan.scan_id, "gate_id": batch.gate_id, "ticket_id": ticket.id,
+                             "scanned_at": _utc(scan.scanned_at), "received_at": datetime.utcnow()})
+            stored = {}
+            if rows:
+                await session.execute(insert_or_ignore(GateScan, ["scan_id"]), rows)
+                # What each scan_id is stored as: a scan_id already used for another ticket was ignored above
+                stored = dict((await session.execute(
+                    select(GateScan.scan_id, GateScan.ticket_id).where(GateScan.scan_id.in_({row["scan_id"] for row in rows}))
+                )).all())
+            for row in rows:
+                if stored.get(row["scan_id"]) != row["ticket_id"]:
+                    results[row["scan_id"]] = {"result": "conflict", "ticket_id": row["ticket_id"],
+                                               "stored_ticket_id": stored.get(row["scan_id"])}
+            rows = [row for row in rows if stored.get(row["scan_id"]) == row["ticket_id"]]
+
+            # First scan of every ticket in this batch, over everything synced so far
+            first = {}
+            for row in await session.execute(
+                select(GateScan.ticket_id, GateScan.scan_id, GateScan.gate_id, GateScan.scanned_at)
+                .where(GateScan.ticket_id.in_({row["ticket_id"] for row in rows}))
+                .order_by(GateScan.ticket_id, GateScan.scanned_at, GateScan.id)
+            ):
+                first.setdefault(row.ticket_id, row)
+
+            activated = 0
+            for ticket_id in first:
+                if safe_value(tickets[ticket_id].status).lower() == "approved":
+                    tickets[ticket_id].status = TicketStatus.ACTIVATED
+                    activated += 1
+            await session.commit()
+        if activated:
+            quiz_cache.invalidate_tickets()
+
+        for row in rows:
+            admitted = first[row["ticket_id"]]
+            if admitted.scan_id == row["scan_id"]:
+                results[row["scan_id"]] = {"result": "admitted", "ticket_id": row["ticket_id"]}
+            else:
+                results[row["scan_id"]] = {"result": "duplicate", "ticket_id": row["ticket_id"], "first_scan": {
+                    "scan_id": admitted.scan_id, "gate_id": admitted.gate_id, "scanned_at": admitted.scanned_at.isoformat(),
+                }}
+        counts = {}
+        for result in results.values():
+            counts[result["result"]] = counts.get(result["result"], 0) + 1
+        return {
+            "success": True,
+            "gate_id": batch.gate_id,
+            "activated": activated,
+            "counts": counts,
+            "results": [{"scan_id": scan.scan_id, **results[scan.scan_id]} for scan in batch.scans],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        await session.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await session.close()
 
 
 @router.get("/{ticket_id}")
 async def get_ticket(ticket_id: int, token_data: dict = Depends(verify_token)):
     """Get ticket details by ID"""
-    session = get_session()
+    session = get_async_session()
     try:
-        ticket = session.query(Ticket).filter(Ticket.id == ticket_id).first()
+        ticket = (await session.execute(
+            select(Ticket).options(selectinload(Ticket.customer), undefer(Ticket.payment_proof)).where(Ticket.id == ticket_id)
+        )).scalars().first()
         
         if not ticket:
             raise HTTPException(status_code=404, detail="التذكرة غير موجودة")
@@ -615,21 +1045,19 @@ async def get_ticket(ticket_id: int, token_data: dict = Depends(verify_token)):
                 "email": ticket.customer.email
             },
             "payment_method": ticket.payment_method,
+            "payment_proof": payment_proof_url(ticket),
             "created_at": ticket.created_at.isoformat()
         }
     finally:
-        session.close()
+        await session.close()
 
 
 @router.get("/{ticket_id}/pdf")
-async def download_ticket_pdf(ticket_id: int, token_data: dict = Depends(verify_token)):
-    """Download ticket as PDF"""
-    from fastapi.responses import Response
-    from services.pdf_generator import generate_ticket_pdf
-    
-    session = get_session()
+async def download_ticket_pdf(ticket_id: int, request: Request, token_data: dict = Depends(verify_token)):
+    """Download ticket as PDF (cached per rendering inputs; the cache key is the ETag)"""
+    session = get_async_session()
     try:
-        ticket = session.query(Ticket).filter(Ticket.id == ticket_id).first()
+        ticket = await _get_ticket(session, ticket_id)
         
         if not ticket:
             raise HTTPException(status_code=404, detail="التذكرة غير موجودة")
@@ -639,24 +1067,25 @@ async def download_ticket_pdf(ticket_id: int, token_data: dict = Depends(verify_
         if current_status.lower() not in ['approved', 'activated']:
             raise HTTPException(status_code=400, detail="التذكرة غير معتمدة بعد")
         
-        pdf_bytes = generate_ticket_pdf(
-            ticket_code=ticket.code,
-            ticket_type=safe_value(ticket.ticket_type),
-            customer_name=ticket.guest_name if ticket.guest_name else ticket.customer.name,
-            price=ticket.price
-        )
+        pdf_args = _ticket_pdf_args(ticket)
+        etag = f'"{_ticket_pdf_key(pdf_args)}"'
+        # Revalidate every time: a renamed ticket gets a new ETag
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        
+        pdf_bytes = await _ticket_pdf(pdf_args)
         
         filename = f"ticket_{ticket.code}.pdf"
+        headers["Content-Disposition"] = f"attachment; filename={filename}"
         
         return Response(
             content=pdf_bytes,
             media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
+            headers=headers
         )
     finally:
-        session.close()
+        await session.close()
 
 
 class DraftUpdate(BaseModel):
@@ -671,7 +1100,7 @@ async def save_draft(update: DraftUpdate, background_tasks: BackgroundTasks):
     Save specific field to ticket draft.
     If all fields (name, type, email, payment, phone) are present, create the ticket automatically.
     """
-    session = get_session()
+    session = get_async_session()
     try:
         # Normalize fields
         field_map = {
@@ -692,11 +1121,13 @@ async def save_draft(update: DraftUpdate, background_tasks: BackgroundTasks):
                  raise HTTPException(status_code=400, detail=f"Invalid field: {update.field}")
 
         # Find or create draft
-        draft = session.query(TicketDraft).filter(
-            TicketDraft.user_phone == update.user_phone,
-            TicketDraft.ticket_index == update.ticket_index,
-            TicketDraft.is_completed == False
-        ).first()
+        draft = (await session.execute(
+            select(TicketDraft).where(
+                TicketDraft.user_phone == update.user_phone,
+                TicketDraft.ticket_index == update.ticket_index,
+                TicketDraft.is_completed == False
+            )
+        )).scalars().first()
 
         if not draft:
             draft = TicketDraft(
@@ -706,15 +1137,21 @@ async def save_draft(update: DraftUpdate, background_tasks: BackgroundTasks):
             session.add(draft)
         
         # Update value
-        setattr(draft, db_field, update.value)
-        session.commit()
-        session.refresh(draft)
+        if db_field == "payment_proof":
+            _apply_payment_proof(draft, await _payment_proof_fields(update.value))
+        else:
+            setattr(draft, db_field, update.value)
+        async with async_serialized_write():
+            await session.commit()
+        await session.refresh(draft)
 
         # Check completeness
         required_fields = ["guest_name", "ticket_type", "email", "payment_proof", "guest_phone"]
         missing = []
         for f in required_fields:
             val = getattr(draft, f)
+            if f == "payment_proof" and draft.payment_proof_key:
+                continue
             if not val or str(val).strip() == "":
                 missing.append(f)
         
@@ -722,18 +1159,8 @@ async def save_draft(update: DraftUpdate, background_tasks: BackgroundTasks):
             # Create Ticket!
             
             # 1. Ensure Customer exists (Booker)
-            raw_phone = update.user_phone
-            # Basic normalization for lookup
-            possible_phones = {raw_phone}
-            if raw_phone.startswith("20"): possible_phones.add(raw_phone[2:])
-            
-            # Normalize for creation/lookup
-            normalized_phone = raw_phone
-            if normalized_phone.startswith("0") and len(normalized_phone) == 11:
-                normalized_phone = "20" + normalized_phone[1:]
-            
-            # Use IN query to match probable variations if needed, but rely on normalized_phone for creation
-            customer = session.query(Customer).filter(Customer.phone == normalized_phone).first()
+            normalized_phone = normalize_phone(update.user_phone)
+            customer = await _find_customer(session, normalized_phone)
             if not customer:
                 # Create customer if not exists
                 customer = Customer(
@@ -742,8 +1169,9 @@ async def save_draft(update: DraftUpdate, background_tasks: BackgroundTasks):
                     email=draft.email
                 )
                 session.add(customer)
-                session.commit()
-                session.refresh(customer)
+                async with async_serialized_write():
+                    await session.commit()
+                await session.refresh(customer)
 
             # 2. Prices
             vip_price = int(os.getenv("VIP_PRICE", 500))
@@ -755,21 +1183,22 @@ async def save_draft(update: DraftUpdate, background_tasks: BackgroundTasks):
             price = vip_price if tt_enum == TicketType.VIP else student_price
 
             ticket = Ticket(
-                code=Ticket.generate_unique_code(session),
+                code=await Ticket.generate_unique_code_async(session),
                 ticket_type=tt_enum,
                 price=price,
                 customer_id=customer.id,
                 guest_name=draft.guest_name,
                 guest_phone=draft.guest_phone,
                 payment_method="Vodafone Cash",
-                payment_proof=draft.payment_proof,
-                status=TicketStatus.PAYMENT_SUBMITTED
+                status=TicketStatus.PAYMENT_SUBMITTED,
+                **_copy_payment_proof(draft)
             )
             session.add(ticket)
             
             # Mark draft completed
             draft.is_completed = True
-            session.commit()
+            async with async_serialized_write():
+                await session.commit()
             
             return {
                 "status": "completed",
@@ -798,10 +1227,10 @@ async def save_draft(update: DraftUpdate, background_tasks: BackgroundTasks):
             }
 
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
 
 
 # ── New: Complete booking from AI Switch path ─────────────────────
@@ -830,33 +1259,31 @@ async def create_booking(req: CreateBookingRequest):
     Create booking from the deterministic AI Switch path.
     Accepts full booking_data JSON and creates tickets.
     """
-    session = get_session()
+    session = get_async_session()
     try:
         bd = req.booking_data
 
         # Normalize phone
-        raw_phone = req.user_phone
-        normalized_phone = raw_phone
-        if normalized_phone.startswith("0") and len(normalized_phone) == 11:
-            normalized_phone = "20" + normalized_phone[1:]
+        normalized_phone = normalize_phone(req.user_phone)
 
         # Check for image in request OR draft
         final_image = req.image_base64 or ""
+        proof_fields = await _payment_proof_fields(final_image)
         
         # If no image in current request, try to find it in the latest incomplete draft for this user
         if not final_image:
-            draft = session.query(TicketDraft).filter(
-                TicketDraft.user_phone == req.user_phone,
-                TicketDraft.is_completed == False,
-                TicketDraft.payment_proof != None
-            ).order_by(TicketDraft.id.desc()).first()
-            if draft and draft.payment_proof:
-                final_image = draft.payment_proof
+            draft = (await session.execute(
+                select(TicketDraft).where(
+                    TicketDraft.user_phone == req.user_phone,
+                    TicketDraft.is_completed == False,
+                    or_(TicketDraft.payment_proof != None, TicketDraft.payment_proof_key != None)
+                ).order_by(TicketDraft.id.desc())
+            )).scalars().first()
+            if draft and (draft.payment_proof or draft.payment_proof_key):
+                proof_fields = _copy_payment_proof(draft)
 
         # Ensure Customer exists
-        customer = session.query(Customer).filter(
-            Customer.phone == normalized_phone
-        ).first()
+        customer = await _find_customer(session, normalized_phone)
         if not customer:
             customer = Customer(
                 name=bd.name,
@@ -864,8 +1291,9 @@ async def create_booking(req: CreateBookingRequest):
                 email=bd.email or ""
             )
             session.add(customer)
-            session.commit()
-            session.refresh(customer)
+            async with async_serialized_write():
+                await session.commit()
+            await session.refresh(customer)
 
         # Prices
         vip_price = int(os.getenv("VIP_PRICE", 500))
@@ -875,25 +1303,27 @@ async def create_booking(req: CreateBookingRequest):
         ticket_list = bd.tickets or [TicketInfo(name=bd.name, type=bd.ticket_type)]
 
         created_tickets = []
-        for t_info in ticket_list:
+        codes = await allocate_ticket_codes_async(len(ticket_list))
+        for t_info, code in zip(ticket_list, codes):
             tt_str = t_info.type.strip().upper()
             tt_enum = TicketType.VIP if "VIP" in tt_str else TicketType.STUDENT
             price = vip_price if tt_enum == TicketType.VIP else student_price
 
             ticket = Ticket(
-                code=Ticket.generate_unique_code(session),
+                code=code,
                 ticket_type=tt_enum,
                 price=price,
                 customer_id=customer.id,
                 guest_name=t_info.name,
                 guest_phone=bd.phone or req.user_phone,
                 payment_method="Vodafone Cash",
-                payment_proof=final_image,  # Use resolved image
-                status=TicketStatus.PAYMENT_SUBMITTED
+                status=TicketStatus.PAYMENT_SUBMITTED,
+                **proof_fields  # Use resolved image
             )
             session.add(ticket)
-            session.commit()
-            session.refresh(ticket)
+            async with async_serialized_write():
+                await session.commit()
+            await session.refresh(ticket)
             created_tickets.append({
                 "code": ticket.code,
                 "name": ticket.guest_name,
@@ -902,13 +1332,16 @@ async def create_booking(req: CreateBookingRequest):
             })
         
         # Mark used draft as completed if it exists
-        draft = session.query(TicketDraft).filter(
-            TicketDraft.user_phone == req.user_phone,
-            TicketDraft.is_completed == False
-        ).order_by(TicketDraft.id.desc()).first()
+        draft = (await session.execute(
+            select(TicketDraft).where(
+                TicketDraft.user_phone == req.user_phone,
+                TicketDraft.is_completed == False
+            ).order_by(TicketDraft.id.desc())
+        )).scalars().first()
         if draft:
             draft.is_completed = True
-            session.commit()
+            async with async_serialized_write():
+                await session.commit()
 
         return {
             "status": "completed",
@@ -917,7 +1350,7 @@ async def create_booking(req: CreateBookingRequest):
         }
 
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        session.close()
+        await session.close()
@@ -7,12 +7,15 @@ from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
-import httpx
 import os
 import uuid
 import shutil
 
 from models import get_session, VipGuest, VipSettings
+from routes.jobs import enqueue_job, register_handler
+from routes.media import register_media, media_reference
+from services.http_client import http_client
+from services.phones import normalize_phone
 
 router = APIRouter()
 
@@ -67,66 +70,90 @@ def set_vip_setting(session, key: str, value: str):
         session.add(VipSettings(key=key, value=value))
 
 
-async def send_whatsapp_message(phone: str, text: str, image_filename: str = None):
+def vip_instance() -> str:
+    """رقم الواتساب (Evolution instance) اللي بيبعت دعوات كبار الزوار"""
+    return os.getenv("EVOLUTION_INSTANCE", "Mahmoud Magdy")
+
+
+# (path, mtime) → media asset key, so the invitation image is read and hashed once, not per guest
+_invitation_assets = {}
+
+
+async def _invitation_asset(filepath: str) -> str:
+    cache_key = (filepath, os.path.getmtime(filepath))
+    if cache_key not in _invitation_assets:
+        with open(filepath, "rb") as img_file:
+            data = img_file.read()
+        _invitation_assets.clear()
+        _invitation_assets[cache_key] = await register_media(data, os.path.basename(filepath))
+    return _invitation_assets[cache_key]
+
+
+async def send_whatsapp_message(phone: str, text: str, image_filename: str = None, instance: str = None) -> bool:
     """إرسال رسالة واتساب عبر Evolution API"""
     evo_url = os.getenv("EVOLUTION_API_URL", "http://38.242.139.159:8080")
     evo_key = os.getenv("EVOLUTION_API_KEY", "")
-    instance = os.getenv("EVOLUTION_INSTANCE", "Mahmoud Magdy")
+    instance = instance or vip_instance()
 
-    # تنسيق الرقم
-    jid = phone.lstrip("0+")
-    if not jid.startswith("20"):
-        jid = "20" + jid
+    # تنسيق الرقم (services.phones)
+    jid = normalize_phone(phone)
 
     headers = {"apikey": evo_key, "Content-Type": "application/json"}
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        if image_filename:
-            # قراءة الصورة المرفوعة كـ base64
-            import base64
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            upload_dir = os.path.join(base_dir, "data", "vip_uploads")
-            filepath = os.path.join(upload_dir, image_filename)
-            if os.path.exists(filepath):
-                with open(filepath, "rb") as img_file:
-                    b64 = base64.b64encode(img_file.read()).decode("utf-8")
-                ext = image_filename.rsplit(".", 1)[-1].lower()
-                if ext in ("jpg", "jpeg"):
-                    mime = "image/jpeg"
-                elif ext == "png":
-                    mime = "image/png"
-                else:
-                    mime = f"image/{ext}"
-
-                resp = await client.post(
-                    f"{evo_url}/message/sendMedia/{instance}",
-                    headers=headers,
-                    json={
-                        "number": jid,
-                        "mediatype": "image",
-                        "mimetype": mime,
-                        "caption": text,
-                        "media": b64,
-                        "fileName": f"invitation.{ext}",
-                    }
-                )
-                print(f"📤 sendMedia response: {resp.status_code} - {resp.text[:200]}")
+    if image_filename:
+        # الصورة بتتخزن مرة واحدة وكل دعوة بتبعت رابط ليها (أو نفس الـ base64 من غير إعادة قراءة)
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        upload_dir = os.path.join(base_dir, "data", "vip_uploads")
+        filepath = os.path.join(upload_dir, image_filename)
+        if os.path.exists(filepath):
+            ext = image_filename.rsplit(".", 1)[-1].lower()
+            if ext in ("jpg", "jpeg"):
+                mime = "image/jpeg"
+            elif ext == "png":
+                mime = "image/png"
             else:
-                print(f"⚠️ Image file not found: {filepath}")
-                resp = await client.post(
-                    f"{evo_url}/message/sendText/{instance}",
-                    headers=headers,
-                    json={"number": jid, "text": text}
-                )
-                print(f"📤 sendText response: {resp.status_code}")
+                mime = f"image/{ext}"
+            media = await media_reference(await _invitation_asset(filepath))
+
+            resp = await http_client.post(
+                f"{evo_url}/message/sendMedia/{instance}",
+                "media",
+                headers=headers,
+                json={
+                    "number": jid,
+                    "mediatype": "image",
+                    "mimetype": mime,
+                    "caption": text,
+                    "media": media,
+                    "fileName": f"invitation.{ext}",
+                }
+            )
+            print(f"📤 sendMedia response: {resp.status_code} - {resp.text[:200]}")
         else:
-            # إرسال نص فقط
-            resp = await client.post(
+            print(f"⚠️ Image file not found: {filepath}")
+            resp = await http_client.post(
                 f"{evo_url}/message/sendText/{instance}",
                 headers=headers,
                 json={"number": jid, "text": text}
             )
             print(f"📤 sendText response: {resp.status_code}")
+    else:
+        # إرسال نص فقط
+        resp = await http_client.post(
+            f"{evo_url}/message/sendText/{instance}",
+            headers=headers,
+            json={"number": jid, "text": text}
+        )
+        print(f"📤 sendText response: {resp.status_code}")
+    return resp.is_success
+
+
+async def _send_vip_invitation(phone: str, payload: dict, instance: str):
+    return await send_whatsapp_message(phone, payload["text"], image_filename=payload.get("image"), instance=instance)
+
+
+# Invitations go through the outbox so they share the instance's rate limit with every other send
+register_handler("vip_invitation", _send_vip_invitation)
 
 
 
@@ -155,7 +182,7 @@ async def add_vip_guest(data: VipGuestCreate):
     session = get_session()
     try:
         # تحقق من عدم التكرار
-        existing = session.query(VipGuest).filter(VipGuest.phone == data.phone).first()
+        existing = session.query(VipGuest).filter(VipGuest.phone_normalized == normalize_phone(data.phone)).first()
         if existing:
             raise HTTPException(status_code=400, detail="هذا الرقم مضاف بالفعل")
 
@@ -170,7 +197,8 @@ async def add_vip_guest(data: VipGuestCreate):
         session.refresh(guest)
         print(f"✅ VIP guest saved: id={guest.id}")
 
-        # إرسال الدعوة تلقائياً
+        # إرسال الدعوة تلقائياً (عن طريق طابور الرسائل)
+        job_id = None
         try:
             invitation_text = get_vip_setting(session, "invitation_text") or ""
             invitation_link = get_vip_setting(session, "invitation_link") or ""
@@ -182,21 +210,22 @@ async def add_vip_guest(data: VipGuestCreate):
                 if invitation_link:
                     full_text += f"\n\n🔗 {invitation_link}"
                 try:
-                    await send_whatsapp_message(
-                        data.phone,
-                        full_text,
-                        image_filename=invitation_image if invitation_image else None
+                    job_id = await enqueue_job(
+                        "vip",
+                        [{"phone": data.phone, "kind": "vip_invitation", "instance": vip_instance(),
+                          "payload": {"text": full_text, "image": invitation_image or None}}],
+                        description=f"دعوة VIP: {data.name}", idempotency_key=f"vip:{guest.id}",
                     )
-                    print(f"✅ WhatsApp invitation sent to {data.phone}")
+                    print(f"✅ WhatsApp invitation queued for {data.phone} (job {job_id})")
                 except Exception as e:
-                    print(f"⚠️ VIP invitation send failed: {e}")
+                    print(f"⚠️ VIP invitation queue failed: {e}")
             else:
                 print("⚠️ No invitation text configured, skipping WhatsApp send")
         except Exception as e:
             print(f"⚠️ Settings/send error (non-fatal): {e}")
             traceback.print_exc()
 
-        return {"message": "تمت الإضافة بنجاح", "guest": vip_to_dict(guest)}
+        return {"message": "تمت الإضافة بنجاح", "guest": vip_to_dict(guest), "job_id": job_id}
     except HTTPException:
         raise
     except Exception as e:
@@ -351,7 +380,7 @@ async def check_is_vip(phone: str):
     """فحص هل الرقم VIP — يستخدمها n8n"""
     session = get_session()
     try:
-        guest = session.query(VipGuest).filter(VipGuest.phone == phone).first()
+        guest = session.query(VipGuest).filter(VipGuest.phone_normalized == normalize_phone(phone)).first()
         if guest:
             return {
                 "is_vip": True,
@@ -370,7 +399,7 @@ async def webhook_update_status(data: VipStatusUpdate, phone: Optional[str] = No
 
     session = get_session()
     try:
-        guest = session.query(VipGuest).filter(VipGuest.phone == phone).first()
+        guest = session.query(VipGuest).filter(VipGuest.phone_normalized == normalize_phone(phone)).first()
         if not guest:
             raise HTTPException(status_code=404, detail="VIP غير موجود")
 
@@ -0,0 +1,127 @@
+"""
+Benchmark: /api/quiz/answers/batch vs one /api/quiz/answer request per answer.
+
+Seeds a fresh SQLite file with N approved tickets and two active questions,
+starts the API in-process with uvicorn, then submits every participant's
+answer to question 1 one request at a time (with --concurrency in flight,
+like n8n under burst) and to question 2 in batches of --batch-size.
+
+Usage (from admin-backend/):
+    python scripts/bench_answer_batch.py [--answers 1500] [--batch-size 100] [--concurrency 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile, seed
+
+
+def add_question():
+    from datetime import datetime, timedelta
+    import models
+    from models import Question, QuestionType, QuestionStatus
+
+    with models.session_scope() as session:
+        question = Question(
+            text="Batch", question_type=QuestionType.COMPLETION, correct_answer="القاهرة||مصر",
+            status=QuestionStatus.ACTIVE, sent_at=datetime.utcnow(),
+            expires_at=datetime.utcnow() + timedelta(hours=1),
+        )
+        session.add(question)
+        session.flush()
+        return question.id
+
+
+def answer_payload(i, question_id):
+    return {"phone": f"2010{i:08d}", "question_id": question_id,
+            "answer_text": "القاهره" if i % 2 else "الاسكندرية", "sender_name": f"Guest {i}"}
+
+
+async def run_single(client, question_id, answers, concurrency):
+    in_flight = asyncio.Semaphore(concurrency)
+    latencies, ok = [], 0
+
+    async def one(i):
+        nonlocal ok
+        async with in_flight:
+            start = time.perf_counter()
+            resp = await client.post("/api/quiz/answer", json=answer_payload(i, question_id))
+            latencies.append(time.perf_counter() - start)
+        ok += resp.status_code == 200 and resp.json().get("success", False)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(answers)))
+    return time.perf_counter() - start, latencies, ok
+
+
+async def run_batch(client, question_id, answers, batch_size):
+    latencies, ok = [], 0
+    start = time.perf_counter()
+    for first in range(0, answers, batch_size):
+        payload = [answer_payload(i, question_id) for i in range(first, min(first + batch_size, answers))]
+        t0 = time.perf_counter()
+        resp = await client.post("/api/quiz/answers/batch", json=payload)
+        latencies.append(time.perf_counter() - t0)
+        resp.raise_for_status()
+        ok += sum(1 for r in resp.json()["results"] if r["success"])
+    return time.perf_counter() - start, latencies, ok
+
+
+async def fire(base_url, token, questions, args):
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=120) as client:
+        single = await run_single(client, questions[0], args.answers, args.concurrency)
+        batch = await run_batch(client, questions[1], args.answers, args.batch_size)
+    return single, batch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answers", type=int, default=1500)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--db", default="/tmp/bench_answer_batch.db")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+
+    import logging
+    logging.disable(logging.INFO)
+    import uvicorn
+    from main import app
+    from routes.auth import create_access_token
+
+    questions = (seed(args.answers), add_question())
+    token = create_access_token({"sub": "bench@bestar.local", "role": "admin"})
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        single, batch = asyncio.run(fire(f"http://127.0.0.1:{args.port}", token, questions, args))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    for label, (wall, latencies, ok) in ((f"single x{args.concurrency} in flight", single),
+                                         (f"batch of {args.batch_size}", batch)):
+        print(f"{label:<24} {ok}/{args.answers} stored in {wall:6.2f}s ({args.answers / wall:6.0f} answers/s)  "
+              f"request p50={percentile(latencies, 50) * 1000:.0f}ms p99={percentile(latencies, 99) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: per-certificate render time and PDF size, single-pass drawing vs the cached background template.
+
+- single pass: every certificate draws the whole page (gradient, border,
+  laurels, stars, static Arabic text) and then the guest's text, which is
+  what generate_certificate_pdf did before the template
+- template: generate_certificate_pdf as it is now, the background built once
+  and placed as a form XObject, only the name / score / rank drawn per guest
+
+Usage (from admin-backend/):
+    python scripts/bench_certificate_template.py [--guests 1000] [--font /path/Amiri-Regular.ttf --bold-font /path/Amiri-Bold.ttf]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile
+
+
+def single_pass_pdf(cg, guest_name, total_points, rank, total_participants):
+    buffer = BytesIO()
+    c = cg.canvas.Canvas(buffer, pagesize=(cg.PAGE_WIDTH, cg.PAGE_HEIGHT))
+    cg._draw_background(c, "كن نجماً", os.getenv("EVENT_DATE", "11 Feb 2026"))
+    cg._draw_guest(c, guest_name, total_points, rank, total_participants)
+    c.save()
+    return buffer.getvalue()
+
+
+def measure(render, guests):
+    times, sizes = [], []
+    for name, points, rank in guests:
+        start = time.perf_counter()
+        pdf = render(name, points, rank, len(guests))
+        times.append(time.perf_counter() - start)
+        sizes.append(len(pdf))
+    return times, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guests", type=int, default=1000)
+    parser.add_argument("--font", help="TrueType font for regular text (production uses Amiri)")
+    parser.add_argument("--bold-font", help="TrueType font for bold text")
+    args = parser.parse_args()
+
+    from services import certificate_generator as cg
+    if args.font:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        pdfmetrics.registerFont(TTFont("Bench-Regular", args.font))
+        pdfmetrics.registerFont(TTFont("Bench-Bold", args.bold_font or args.font))
+        cg.FONT_REGULAR, cg.FONT_BOLD = "Bench-Regular", "Bench-Bold"
+
+    first_names = ["محمد", "أحمد", "سارة", "مريم", "يوسف", "فاطمة", "عمر", "نور", "خالد", "هدى"]
+    last_names = ["علي", "حسن", "إبراهيم", "محمود", "عبد الله", "مصطفى", "السيد", "عثمان"]
+    guests = [(f"{first_names[i % 10]} {last_names[i % 8]} {first_names[(i // 80) % 10]}", 500 - i // 3, i + 1)
+              for i in range(args.guests)]
+
+    start = time.perf_counter()
+    cg._page_template("كن نجماً", os.getenv("EVENT_DATE", "11 Feb 2026"))
+    build = time.perf_counter() - start
+
+    print(f"{args.guests} guests, fonts {cg.FONT_REGULAR} / {cg.FONT_BOLD}; template built once in {build * 1000:.1f}ms")
+    for label, render in (("single pass", lambda *a: single_pass_pdf(cg, *a)),
+                          ("template", cg.generate_certificate_pdf)):
+        times, sizes = measure(render, guests)
+        ms = [t * 1000 for t in times]
+        print(f"{label:<12} total {sum(times):6.2f}s  per certificate mean {statistics.mean(ms):5.2f}ms "
+              f"p50 {percentile(ms, 50):5.2f}ms p99 {percentile(ms, 99):5.2f}ms  "
+              f"size mean {statistics.mean(sizes) / 1024:6.1f} KB, all {sum(sizes) / 1e6:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
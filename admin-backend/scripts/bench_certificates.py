@@ -0,0 +1,117 @@
+"""
+Benchmark: rendering a certificate campaign in a thread vs the render process pool.
+
+Renders --count certificates with generate_certificate_pdf while a heartbeat
+task ticks every 10ms on the same event loop, and reports wall time, PDFs per
+second and the worst heartbeat delay (how long the API would have stopped
+answering requests):
+
+- thread: asyncio.to_thread, what _send_certificate did before
+  services/render_pool.py (the drawing holds the GIL)
+- process pool: RenderPool with RENDER_WORKERS processes, --window in flight
+
+Then streams the same certificates through the ZIP export generator and
+reports time to first byte, total time and archive validity.
+
+Usage (from admin-backend/):
+    python scripts/bench_certificates.py [--count 60] [--window 8]
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def participants(count):
+    return [{"ticket_id": i + 1, "guest_name": f"مشارك رقم {i + 1}", "total_points": 500 - i, "rank": i + 1}
+            for i in range(count)]
+
+
+async def heartbeat(stop, interval=0.01):
+    """Worst delay between when a tick was due and when the loop ran it."""
+    worst = 0.0
+    while not stop.is_set():
+        due = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - due)
+    return worst
+
+
+async def timed(render_all):
+    stop = asyncio.Event()
+    beat = asyncio.ensure_future(heartbeat(stop))
+    start = time.perf_counter()
+    await render_all()
+    wall = time.perf_counter() - start
+    stop.set()
+    return wall, await beat
+
+
+async def run(args):
+    from services.certificate_generator import generate_certificate_pdf
+    from services.render_pool import RenderPool
+    from routes.certificates import _certificate_args, _certificate_zip
+
+    people = participants(args.count)
+    calls = [_certificate_args({**p, "total_participants": args.count}) for p in people]
+
+    async def in_thread():
+        for kwargs in calls:
+            await asyncio.to_thread(generate_certificate_pdf, **kwargs)
+
+    pool = RenderPool()
+    await pool.run(generate_certificate_pdf, **calls[0])   # spawn the workers outside the measurement
+
+    async def in_pool():
+        pending = set()
+        for kwargs in calls:
+            pending.add(asyncio.ensure_future(pool.run(generate_certificate_pdf, **kwargs)))
+            if len(pending) >= args.window:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        await asyncio.gather(*pending)
+
+    rows = [("thread (before)",) + await timed(in_thread), (f"process pool x{pool.workers}",) + await timed(in_pool)]
+    pool.shutdown()
+
+    start, first, archive = time.perf_counter(), None, io.BytesIO()
+    async for chunk in _certificate_zip(people, args.count):
+        if chunk and first is None:
+            first = time.perf_counter() - start
+        archive.write(chunk)
+    export = (first, time.perf_counter() - start, archive)
+    return rows, export
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=60)
+    parser.add_argument("--window", type=int, default=8, help="renders in flight in the pool run")
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite:////tmp/bench_certificates.db")
+
+    import logging
+    logging.disable(logging.WARNING)
+    from routes.certificates import render_pool
+
+    try:
+        rows, (first, total, archive) = asyncio.run(run(args))
+    finally:
+        render_pool.shutdown()
+
+    print(f"{args.count} certificates, {os.cpu_count()} CPU(s)")
+    for label, wall, stall in rows:
+        print(f"{label:<20} {wall:6.2f}s  {args.count / wall:6.1f} PDF/s  worst event-loop stall {stall * 1000:7.1f}ms")
+    with zipfile.ZipFile(archive) as z:
+        bad = z.testzip()
+        names = z.namelist()
+    print(f"ZIP export: first byte after {first:.2f}s, {len(names)} entries in {total:.2f}s, "
+          f"{archive.tell() / 1e6:.1f} MB, {'valid' if bad is None else 'corrupt entry ' + bad}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: /api/stats/dashboard from stat_counters vs the nine COUNT/SUM scans it ran before.
+
+Seeds --tickets tickets (mixed statuses and types, one customer each) on a
+scratch SQLite file, then times --rounds reads of each. It also times ticket
+status changes with and without the counter upkeep, which is what every
+write now pays, and checks the counters against a recount at the end.
+
+Usage (from admin-backend/):
+    python scripts/bench_dashboard.py [--tickets 50000] [--rounds 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile
+
+STATUSES = ["pending", "payment_submitted", "approved", "rejected", "activated"]
+
+
+def seed(count):
+    import models
+    from models import Customer, Ticket, TicketType
+
+    models.init_db()
+    with models.session_scope() as session:
+        customers = [Customer(name=f"Guest {i}", phone=f"2010{i:08d}") for i in range(count)]
+        session.add_all(customers)
+        session.flush()
+        session.add_all(Ticket(
+            code=f"{i:06d}", ticket_type=TicketType.VIP if i % 4 == 0 else TicketType.STUDENT,
+            price=500 if i % 4 == 0 else 100, customer_id=customer.id, status=STATUSES[i % 5],
+        ) for i, customer in enumerate(customers))
+
+
+async def scans():
+    """Replica of the previous get_dashboard_stats: nine scans of tickets plus a customer count."""
+    from sqlalchemy import func, select
+    from models import get_async_session, Ticket, Customer
+
+    session = get_async_session()
+    try:
+        result = {"total": (await session.execute(select(func.count(Ticket.id)))).scalar()}
+        for status in STATUSES:
+            result[status] = (await session.execute(select(func.count(Ticket.id)).where(
+                func.lower(Ticket.status) == status))).scalar()
+        for ticket_type in ("VIP", "STUDENT"):
+            result[ticket_type] = (await session.execute(select(func.count(Ticket.id)).where(
+                func.upper(Ticket.ticket_type) == ticket_type))).scalar()
+        result["revenue"] = (await session.execute(select(func.sum(Ticket.price)).where(
+            func.lower(Ticket.status).in_(["approved", "activated"])))).scalar()
+        result["customers"] = (await session.execute(select(func.count(Customer.id)))).scalar()
+        return result
+    finally:
+        await session.close()
+
+
+async def timed(call, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await call()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+async def status_changes(count, counted):
+    from sqlalchemy import event, select
+    from sqlalchemy.orm import Session
+    import models
+    from models import Ticket
+
+    if not counted:
+        event.remove(Session, "before_flush", models._count_flush)
+    try:
+        start = time.perf_counter()
+        for ticket_id in range(1, count + 1):
+            async with models.async_session_scope() as session:
+                ticket = (await session.execute(select(Ticket).where(Ticket.id == ticket_id))).scalar_one()
+                ticket.status = "approved" if ticket.status != "approved" else "activated"
+        return (time.perf_counter() - start) / count * 1000
+    finally:
+        if not counted:
+            event.listen(Session, "before_flush", models._count_flush)
+
+
+async def run(args):
+    import models
+    from routes.stats import get_dashboard_stats, check_dashboard_stats
+
+    rows = [("nine scans", await timed(scans, args.rounds)),
+            ("stat_counters", await timed(get_dashboard_stats, args.rounds))]
+    writes = [("without counters", await status_changes(args.writes, counted=False))]
+    with models.engine.begin() as conn:   # the uncounted changes above
+        models.rebuild_stat_counters(conn)
+    writes.append(("with counters", await status_changes(args.writes, counted=True)))
+    check = await check_dashboard_stats()
+    await models.async_engine.dispose()
+    return rows, writes, check
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--writes", type=int, default=200, help="status changes timed per variant")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_dashboard.db"
+    seed(args.tickets)
+    rows, writes, check = asyncio.run(run(args))
+    print(f"{args.tickets} tickets")
+    for label, ms in rows:
+        print(f"dashboard, {label:<14} p50 {percentile(ms, 50):8.2f}ms  p90 {percentile(ms, 90):8.2f}ms")
+    for label, ms in writes:
+        print(f"status change, {label:<17} {ms:6.2f}ms per commit")
+    print(f"counters consistent after the run: {check['consistent']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark: gate check-in throughput, server round-trip per scan vs offline journal + batch sync.
+
+Seeds --tickets approved tickets on a scratch database, starts the API and
+checks them in three ways:
+
+- online: the gate asks the server about every scan (one-scan POST
+  /api/tickets/activate/batch) and waits for the answer
+- offline: the gate verifies the signed QR itself and journals the scan
+  (scripts/gate_scanner.py), answering from the journal
+- sync: the offline journal pushed to /api/tickets/activate/batch
+
+--rescans of the offline tickets are scanned again at a second gate, earlier
+by the clock but synced later, to check that double scans are settled on
+the server: the first gate's admissions for them must come back as conflicts.
+
+Usage (from admin-backend/):
+    python scripts/bench_gate_scans.py [--tickets 5000] [--online 500] [--rescans 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_outbox import serve, stop
+from load_quiz_answers import percentile, seed
+
+
+def report(label, times):
+    ms = [t * 1000 for t in times]
+    print(f"{label:<22} p50 {percentile(ms, 50):7.3f}ms  p90 {percentile(ms, 90):7.3f}ms  "
+          f"{len(times) / sum(times):8.0f} scans/s  ({len(times)} scans)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--online", type=int, default=500, help="tickets checked in with a round-trip per scan")
+    parser.add_argument("--rescans", type=int, default=200, help="offline tickets scanned again at a second gate")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8777)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL=f"sqlite:///{tmp}/bench_gate.db", RENDER_CACHE_DIR=f"{tmp}/render-cache")
+    import logging
+    logging.disable(logging.WARNING)
+    seed(args.tickets)
+    import httpx
+    from datetime import datetime, timedelta
+    from sqlalchemy import func, select
+    from gate_scanner import GateJournal
+    from main import app
+    from models import GateScan, SessionLocal, Ticket
+    from routes.auth import create_access_token
+    from services.ticket_qr import ticket_qr
+
+    payloads = [ticket_qr.sign(i + 1, f"{i:06d}", "Student") for i in range(args.tickets)]
+    online, offline = payloads[:args.online], payloads[args.online:]
+    token = create_access_token({"sub": "bench@bestar.local", "role": "admin"})
+    api = serve(app, args.port)
+    try:
+        client = httpx.Client(base_url=f"http://127.0.0.1:{args.port}", headers={"Authorization": f"Bearer {token}"},
+                              timeout=60)
+        times = []
+        for i, payload in enumerate(online):
+            start = time.perf_counter()
+            response = client.post("/api/tickets/activate/batch", json={"gate_id": "online", "scans": [
+                {"scan_id": f"online:{i}", "payload": payload, "scanned_at": datetime.utcnow().isoformat()}]})
+            assert response.json()["results"][0]["result"] == "admitted", response.text
+            times.append(time.perf_counter() - start)
+        report("online (round-trip)", times)
+
+        north = GateJournal(f"{tmp}/north.db", "north")
+        north.configure(client)
+        times = []
+        for payload in offline:
+            start = time.perf_counter()
+            assert north.scan(payload)["result"] == "admitted"
+            times.append(time.perf_counter() - start)
+        report("offline (journal)", times)
+
+        # The second gate scanned the same tickets a minute earlier by its clock, but syncs after the first
+        south = GateJournal(f"{tmp}/south.db", "south")
+        south.configure(client)
+        for payload in offline[:args.rescans]:
+            south.scan(payload)
+        south.db.execute("UPDATE scans SET scanned_at = ?", ((datetime.utcnow() - timedelta(minutes=1)).isoformat(),))
+        south.db.commit()
+
+        start = time.perf_counter()
+        summary = north.sync(client, args.batch)
+        elapsed = time.perf_counter() - start
+        print(f"{'sync (batch ' + str(args.batch) + ')':<22} {elapsed * 1000:9.1f}ms total  "
+              f"{len(offline) / elapsed:8.0f} scans/s  {summary['counts']}")
+        south_summary = south.sync(client, args.batch)
+        resync = north.db.execute("UPDATE scans SET synced = 0").rowcount
+        north.db.commit()
+        summary = north.sync(client, args.batch)
+        print(f"second gate: {south_summary['counts']}; first gate re-sync of {resync} scans: {summary['counts']}, "
+              f"{len(summary['conflicts'])} conflicts")
+        assert len(summary["conflicts"]) == args.rescans
+    finally:
+        stop(*api)
+
+    with SessionLocal() as session:
+        activated = session.execute(select(func.count(Ticket.id)).where(Ticket.status == "activated")).scalar()
+        scans = session.execute(select(func.count(GateScan.id))).scalar()
+    print(f"{activated}/{args.tickets} tickets activated, {scans} scans stored")
+
+
+if __name__ == "__main__":
+    main()
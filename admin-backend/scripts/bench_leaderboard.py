@@ -0,0 +1,144 @@
+"""
+Benchmark: quiz leaderboard, one windowed SQL statement vs the old per-row lookups.
+
+Seeds a fresh SQLite file with N participants answering Q questions (a third
+of them VIP, a quarter in one custom group), then times /api/quiz/leaderboard
+for each filter next to a replica of the previous implementation, which ran
+one Ticket query (plus one group-membership query for group:N) per row.
+
+Usage (from admin-backend/):
+    python scripts/bench_leaderboard.py [--participants 2000] [--questions 50] [--rounds 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile
+
+
+def seed(participants, questions):
+    import models
+    from models import (Customer, Ticket, TicketStatus, TicketType, Question, QuestionType,
+                        QuestionStatus, Answer, QuizGroup, QuizGroupMember)
+
+    models.init_db()
+    rnd = random.Random(42)
+    with models.session_scope() as session:
+        customers = [Customer(name=f"Guest {i}", phone=f"2010{i:08d}") for i in range(participants)]
+        session.add_all(customers)
+        session.flush()
+        tickets = [Ticket(
+            code=f"{i:06d}", ticket_type=TicketType.VIP if i % 3 == 0 else TicketType.STUDENT,
+            price=100, customer_id=c.id, status=TicketStatus.APPROVED,
+        ) for i, c in enumerate(customers)]
+        session.add_all(tickets)
+        qs = [Question(text=f"Q{n}", question_type=QuestionType.MCQ, correct_answer="A",
+                       status=QuestionStatus.EXPIRED) for n in range(questions)]
+        session.add_all(qs)
+        group = QuizGroup(name="Table 1")
+        session.add(group)
+        session.flush()
+        session.add_all(QuizGroupMember(group_id=group.id, ticket_id=t.id) for t in tickets[::4])
+        answers = []
+        for q in qs:
+            for t, c in zip(tickets, customers):
+                correct = rnd.random() < 0.6
+                answers.append({"question_id": q.id, "ticket_id": t.id, "phone": c.phone, "answer_text": "A",
+                                "is_correct": correct, "points_earned": rnd.randint(1, 3) if correct else 0})
+        session.bulk_insert_mappings(Answer, answers)
+        return group.id
+
+
+async def legacy_leaderboard(group):
+    """The pre-change implementation: aggregate, then 1-2 lookups per row."""
+    from sqlalchemy import func, select, Integer
+    from sqlalchemy.orm import selectinload
+    from models import get_async_session, Answer, Ticket, QuizGroupMember, safe_value
+
+    session = get_async_session()
+    try:
+        results = (await session.execute(select(
+            Answer.ticket_id,
+            func.sum(Answer.points_earned).label("total_points"),
+            func.count(Answer.id).label("total_answers"),
+            func.sum(func.cast(Answer.is_correct, Integer)).label("correct_answers"),
+        ).group_by(Answer.ticket_id))).all()
+        leaderboard = []
+        for row in results:
+            ticket = (await session.execute(
+                select(Ticket).options(selectinload(Ticket.customer)).where(Ticket.id == row.ticket_id)
+            )).scalars().first()
+            if group in ("VIP", "Student") and safe_value(ticket.ticket_type) != group:
+                continue
+            if group and group.startswith("group:"):
+                is_member = (await session.execute(select(QuizGroupMember.id).where(
+                    QuizGroupMember.group_id == int(group.split(":")[1]),
+                    QuizGroupMember.ticket_id == ticket.id,
+                ))).first()
+                if not is_member:
+                    continue
+            leaderboard.append({"ticket_id": ticket.id, "total_points": int(row.total_points or 0)})
+        leaderboard.sort(key=lambda x: x["total_points"], reverse=True)
+        return leaderboard
+    finally:
+        await session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--participants", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--db", default="/tmp/bench_leaderboard.db")
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+
+    import logging
+    logging.disable(logging.WARNING)
+    from fastapi.testclient import TestClient
+    from main import app
+    from routes.auth import create_access_token
+
+    group_id = seed(args.participants, args.questions)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench@bestar.local'})}"}
+    print(f"{args.participants} participants x {args.questions} questions")
+
+    filters = [None, "VIP", f"group:{group_id}"]
+    with TestClient(app) as client:
+        for group in filters:
+            params = {"group": group} if group else {}
+            client.get("/api/quiz/leaderboard", params=params, headers=headers)  # warm-up
+            timings = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                resp = client.get("/api/quiz/leaderboard", params=params, headers=headers)
+                timings.append(time.perf_counter() - start)
+                resp.raise_for_status()
+            top = client.get("/api/quiz/leaderboard", params={**params, "limit": 10}, headers=headers)
+            start = time.perf_counter()
+            client.get("/api/quiz/leaderboard", params={**params, "limit": 10}, headers=headers)
+            top_ms = (time.perf_counter() - start) * 1000
+            line = (f"{group or 'all':<10} rows={top.json()['total_participants']:<5} "
+                    f"single query p50={percentile(timings, 50) * 1000:7.1f}ms  top-10={top_ms:6.1f}ms")
+
+            if not args.skip_legacy:
+                start = time.perf_counter()
+                legacy = asyncio.run(legacy_leaderboard(group))
+                line += f"  legacy={(time.perf_counter() - start) * 1000:8.1f}ms"
+                new_points = [e["total_points"] for e in resp.json()["leaderboard"]]
+                assert new_points == [e["total_points"] for e in legacy], "leaderboards differ"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: bytes on the wire for a bulk image campaign, inline base64 vs a shared media URL.
+
+Starts scripts/fake_evolution_api.py and the API (fast outbox envelope), then
+queues the same image campaign through POST /api/engagement/send twice:
+
+- inline: MEDIA_BASE_URL unset, every sendMedia request carries the whole
+  image as base64 (what every send did before routes/media.py)
+- shared URL: MEDIA_BASE_URL set, every request carries a URL to
+  /api/media/<sha256>, which the fake Evolution API downloads per message
+
+Usage (from admin-backend/):
+    python scripts/bench_media_campaign.py [--recipients 100] [--image-kb 1500]
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_outbox import serve, stop, wait_for
+from fake_evolution_api import create_app
+
+
+async def campaign(base_url, token, phones, image, label):
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": f"bench-media-{label}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=60) as client:
+        start = time.perf_counter()
+        job = (await client.post("/api/engagement/send", json={
+            "phones": phones, "type": "image", "caption": "صورة الحفلة",
+            "content": "data:image/jpeg;base64," + base64.b64encode(image).decode(),
+        })).json()
+        await wait_for(client, job["job_id"], lambda j: j["status"] == "completed", timeout=600)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=100)
+    parser.add_argument("--image-kb", type=int, default=1500)
+    parser.add_argument("--port", type=int, default=8772)
+    parser.add_argument("--evolution-port", type=int, default=8773)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{tmp}/bench_media.db", BLOB_STORE_DIR=f"{tmp}/blobs",
+        EVOLUTION_API_URL=f"http://127.0.0.1:{args.evolution_port}",
+        EVOLUTION_API_KEY="bench", EVOLUTION_INSTANCE_NAME="bench",
+        OUTBOX_RATE_PER_MIN="60000", OUTBOX_BURST="1", OUTBOX_JITTER="0", OUTBOX_BATCH_SIZE="0",
+        OUTBOX_POLL_INTERVAL="0.05",
+    )
+    os.environ.pop("MEDIA_BASE_URL", None)
+
+    import logging
+    logging.disable(logging.WARNING)
+    from main import app
+    from routes.auth import create_access_token
+
+    token = create_access_token({"sub": "bench@bestar.local", "role": "admin"})
+    base_url = f"http://127.0.0.1:{args.port}"
+    phones = [f"2010{i:08d}" for i in range(args.recipients)]
+    image = b"\xff\xd8\xff\xe0" + os.urandom(args.image_kb * 1024 - 4)
+
+    fake = create_app()
+    evolution = serve(fake, args.evolution_port)
+    api = serve(app, args.port)
+    rows = []
+    try:
+        for label, media_base_url in (("inline base64", None), ("shared media URL", base_url)):
+            if media_base_url:
+                os.environ["MEDIA_BASE_URL"] = media_base_url
+            fake.state.received.clear()
+            wall = asyncio.run(campaign(base_url, token, phones, image, label.split()[0]))
+            requests = sum(m["bytes"] for m in fake.state.received)
+            downloads = sum(m["media_bytes"] for m in fake.state.received)
+            rows.append((label, wall, requests, downloads))
+    finally:
+        stop(*api)
+        stop(*evolution)
+
+    print(f"{args.recipients} recipients, one {args.image_kb} KB image")
+    for label, wall, requests, downloads in rows:
+        print(f"{label:<17} requests to Evolution {requests / 1e6:8.1f} MB ({requests / args.recipients / 1e3:7.1f} KB/msg)"
+              f"  media downloaded by Evolution {downloads / 1e6:8.1f} MB  total {(requests + downloads) / 1e6:8.1f} MB"
+              f"  {wall:5.1f}s")
+
+
+if __name__ == "__main__":
+    main()
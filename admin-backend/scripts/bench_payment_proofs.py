@@ -0,0 +1,110 @@
+"""
+Benchmark: ticket list latency and DB file size with inline proofs vs the blob store.
+
+Seeds a fresh SQLite file with tickets carrying base64 data: URI proofs,
+times the list endpoints, then runs the payment-proof migration plus VACUUM
+and times them again.
+
+Usage (from admin-backend/):
+    python scripts/bench_payment_proofs.py [--tickets 300] [--proof-kb 500] [--rounds 5]
+"""
+import argparse
+import base64
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile
+
+ENDPOINTS = ("/api/tickets/", "/api/engagement/attendees", "/api/certificates/participants")
+
+
+def seed(count, proof_kb):
+    import models
+    from models import Customer, Ticket, TicketStatus, TicketType
+
+    models.init_db()
+    with models.session_scope() as session:
+        for i in range(count):
+            # Distinct bytes per ticket so the blob store cannot dedupe them away
+            payload = os.urandom(proof_kb * 1024)
+            customer = Customer(name=f"Guest {i}", phone=f"2010{i:08d}")
+            session.add(customer)
+            session.flush()
+            session.add(Ticket(
+                code=f"{i:06d}", ticket_type=TicketType.VIP, price=500, customer_id=customer.id,
+                status=TicketStatus.APPROVED,
+                payment_proof="data:image/jpeg;base64," + base64.b64encode(payload).decode(),
+            ))
+
+
+def measure(client, headers, rounds):
+    results = {}
+    for path in ENDPOINTS:
+        client.get(path, headers=headers)  # warm-up
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            resp = client.get(path, headers=headers)
+            timings.append(time.perf_counter() - start)
+            resp.raise_for_status()
+        results[path] = timings
+    return results
+
+
+def db_size(path):
+    return sum(os.path.getsize(path + s) for s in ("", "-wal") if os.path.exists(path + s))
+
+
+def report(label, size, results):
+    print(f"{label}: db={size / 1024 / 1024:.1f} MB")
+    for path, timings in results.items():
+        print(f"  {path:<34} p50={percentile(timings, 50) * 1000:7.1f}ms  max={max(timings) * 1000:7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=300)
+    parser.add_argument("--proof-kb", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--db", default="/tmp/bench_payment_proofs.db")
+    parser.add_argument("--blobs", default="/tmp/bench_payment_proofs_blobs")
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    shutil.rmtree(args.blobs, ignore_errors=True)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    os.environ["BLOB_STORE_DIR"] = args.blobs
+
+    import logging
+    logging.disable(logging.INFO)
+    from fastapi.testclient import TestClient
+    import models
+    from main import app
+    from models import Ticket, TicketDraft
+    from routes.auth import create_access_token
+    from migrate_payment_proofs import migrate_table
+    from sqlalchemy import text
+
+    seed(args.tickets, args.proof_kb)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench@bestar.local'})}"}
+
+    with TestClient(app) as client:
+        report("inline base64", db_size(args.db), measure(client, headers, args.rounds))
+
+        for model in (Ticket, TicketDraft):
+            migrate_table(model, batch_size=100)
+        with models.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+
+        report("blob store", db_size(args.db), measure(client, headers, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
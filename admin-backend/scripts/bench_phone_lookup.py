@@ -0,0 +1,117 @@
+"""
+Benchmark: phone -> ticket resolution at 50k customers, before and after phone_normalized.
+
+Seeds --customers customers (one approved ticket each) through Core, with
+phones stored the ways they accumulated: 2010..., 010..., +20 10... and
+10..., then lets init_db backfill phone_normalized. --lookups customers
+are then resolved from a randomly re-spelled phone with:
+
+- exact: the quiz/check lookup before, Customer.phone == the old _normalize_phone
+- variants IN: whatsapp_booking before, Customer.phone IN (a few spellings)
+- normalize every row: what a correct answer cost without the column
+  (one full scan per lookup; run on --scan-lookups only)
+- phone_normalized: one indexed equality (services.phones)
+
+Usage (from admin-backend/):
+    python scripts/bench_phone_lookup.py [--customers 50000] [--lookups 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile
+
+STORED = (lambda n: "2010" + n, lambda n: "010" + n, lambda n: f"+20 10{n[:2]} {n[2:5]} {n[5:]}", lambda n: "10" + n)
+TYPED = STORED + (lambda n: "0020 10" + n, lambda n: "2010" + n + "@s.whatsapp.net")
+
+
+def old_normalize(phone):
+    if phone.startswith("0") and len(phone) == 11:
+        return "20" + phone[1:]
+    if not phone.startswith("20") and len(phone) == 10:
+        return "20" + phone
+    return phone
+
+
+def old_variants(phone):
+    raw_phone = phone.replace("+", "").replace(" ", "").strip()
+    possible_phones = {raw_phone}
+    if raw_phone.startswith("0"): possible_phones.add("2" + raw_phone)
+    if raw_phone.startswith("20"): possible_phones.add("0" + raw_phone[2:])
+    possible_phones.add("2" + raw_phone if not raw_phone.startswith("2") else raw_phone)
+    return possible_phones
+
+
+def seed(count, rnd):
+    from sqlalchemy import insert
+    import models
+    from models import Customer, Ticket
+
+    models.Base.metadata.create_all(models.engine)
+    numbers = [f"{i:08d}" for i in rnd.sample(range(10 ** 8), count)]
+    with models.engine.begin() as conn:
+        conn.execute(insert(Customer), [{"id": i + 1, "name": f"Guest {i}", "phone": rnd.choice(STORED)(number)}
+                                        for i, number in enumerate(numbers)])
+        conn.execute(insert(Ticket), [{"code": f"{i:06d}", "ticket_type": "Student", "price": 100, "customer_id": i + 1,
+                                       "status": "approved"} for i in range(count)])
+    start = time.perf_counter()
+    models.init_db()
+    return numbers, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--scan-lookups", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_phones.db"
+    import logging
+    logging.disable(logging.WARNING)
+    rnd = random.Random(3)
+    numbers, backfill = seed(args.customers, rnd)
+    print(f"{args.customers} customers; init_db (phone and ticket-event backfills) took {backfill:.1f}s")
+
+    from sqlalchemy import select
+    import models
+    from models import Customer, Ticket
+    from services.phones import normalize_phone
+
+    picks = rnd.sample(range(args.customers), args.lookups)
+    queries = [(i + 1, rnd.choice(TYPED)(numbers[i])) for i in picks]
+    resolve = select(Ticket.id, Ticket.customer_id).join(Customer, Ticket.customer_id == Customer.id)
+
+    def scan(conn, typed):
+        wanted = normalize_phone(typed)
+        for customer_id, phone in conn.execute(select(Customer.id, Customer.phone)):
+            if normalize_phone(phone) == wanted:
+                return conn.execute(resolve.where(Customer.id == customer_id).limit(1)).first()
+
+    variants = [
+        ("exact", lambda conn, typed: conn.execute(resolve.where(Customer.phone == old_normalize(typed)).limit(1)).first()),
+        ("variants IN", lambda conn, typed: conn.execute(resolve.where(Customer.phone.in_(old_variants(typed))).limit(1)).first()),
+        ("normalize every row", scan),
+        ("phone_normalized", lambda conn, typed: conn.execute(
+            resolve.where(Customer.phone_normalized == normalize_phone(typed)).order_by(Customer.id).limit(1)).first()),
+    ]
+    with models.engine.connect() as conn:
+        for label, lookup in variants:
+            batch = queries[:args.scan_lookups] if label == "normalize every row" else queries
+            times, hits = [], 0
+            for customer_id, typed in batch:
+                start = time.perf_counter()
+                row = lookup(conn, typed)
+                times.append((time.perf_counter() - start) * 1000)
+                hits += bool(row and row.customer_id == customer_id)
+            print(f"{label:<20} p50 {percentile(times, 50):8.3f}ms  p90 {percentile(times, 90):8.3f}ms  "
+                  f"found {hits}/{len(batch)} ({hits / len(batch):.0%})")
+
+
+if __name__ == "__main__":
+    main()
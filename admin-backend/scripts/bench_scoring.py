@@ -0,0 +1,103 @@
+"""
+Benchmark: scoring 100k completion answers.
+
+Compares a replica of the previous scorer (four uncompiled re.sub calls per
+normalization, accepted answers re-normalized for every submission) with
+evaluate_answer() on a question's cached normalized answers, and with
+grade_answers() scoring the whole list through rapidfuzz.process.cdist.
+All three must agree on every answer.
+
+Usage (from admin-backend/):
+    python scripts/bench_scoring.py [--answers 100000] [--workers -1]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CORRECT_ANSWER = "جمال عبد الناصر||عبد الناصر||ناصر"
+VARIANTS = [
+    "جمال عبد الناصر", "جَمال عبدُ النّاصر", "عبدالناصر", "ناصر", "جمال عبد الناصر رحمه الله",
+    "انور السادات", "محمد نجيب", "السادات", "الملك فاروق", "جمال", "gamal abdel nasser",
+]
+
+
+def legacy_normalize(text):
+    if not text:
+        return ""
+    text = text.strip().lower()
+    text = re.sub(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06DC\u06DF-\u06E4\u06E7\u06E8\u06EA-\u06ED]', '', text)
+    text = re.sub(r'[إأآا]', 'ا', text)
+    text = text.replace('ة', 'ه')
+    text = text.replace('ى', 'ي')
+    text = re.sub(r'\s+', ' ', text)
+    return text
+
+
+def legacy_evaluate(answer_text, correct_answer, threshold=90.0):
+    from rapidfuzz import fuzz
+
+    best = 0.0
+    for option in [c.strip() for c in correct_answer.split("||") if c.strip()]:
+        a, c = legacy_normalize(answer_text), legacy_normalize(option)
+        if a == c:
+            similarity = 100.0
+        else:
+            similarity = max(fuzz.ratio(a, c), fuzz.partial_ratio(a, c),
+                             fuzz.token_sort_ratio(a, c), fuzz.token_set_ratio(a, c))
+        best = max(best, similarity)
+    return {"is_correct": best >= threshold, "similarity_score": round(best, 1)}
+
+
+def make_answers(count):
+    rnd = random.Random(42)
+    answers = []
+    for _ in range(count):
+        text = rnd.choice(VARIANTS)
+        if rnd.random() < 0.3:  # a typo
+            i = rnd.randrange(len(text))
+            text = text[:i] + text[i + 1:]
+        answers.append(text + (" " if rnd.random() < 0.2 else ""))
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answers", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=-1)
+    args = parser.parse_args()
+
+    from services.scoring import HAS_CDIST, evaluate_answer, grade_answers, normalize_options
+    from services.quiz_cache import split_correct_answers
+
+    answers = make_answers(args.answers)
+    options = normalize_options(split_correct_answers(CORRECT_ANSWER))
+    timings = {}
+
+    start = time.perf_counter()
+    legacy = [legacy_evaluate(a, CORRECT_ANSWER) for a in answers]
+    timings["legacy, per answer"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = [evaluate_answer(a, CORRECT_ANSWER, "completion", normalized_options=options) for a in answers]
+    timings["evaluate_answer, cached"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = grade_answers(answers, CORRECT_ANSWER, "completion", normalized_options=options, workers=args.workers)
+    timings["grade_answers" + (" (cdist)" if HAS_CDIST else " (no numpy)")] = time.perf_counter() - start
+
+    strip = lambda results: [(r["is_correct"], r["similarity_score"]) for r in results]
+    assert strip(legacy) == strip(single) == strip(batch), "scorers disagree"
+
+    print(f"{args.answers} answers x {len(options)} accepted variants, "
+          f"{sum(r['is_correct'] for r in batch)} correct")
+    for label, seconds in timings.items():
+        print(f"{label:<28} {seconds:7.2f}s  {args.answers / seconds:>9,.0f} answers/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark: per-call engine creation vs the shared pooled session factory.
+
+Runs the same small request-shaped unit of work (open session, look up a
+question and a customer, close) against one SQLite file, first the old way
+(new Engine + sessionmaker on every call) and then through models.get_session().
+
+Usage (from admin-backend/):
+    python scripts/bench_sessions.py [--requests 2000] [--db /tmp/bench_sessions.db]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--db", default="/tmp/bench_sessions.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    import models
+    from models import Customer, Question, QuestionType, init_db
+
+    init_db()
+    with models.session_scope() as session:
+        session.add(Customer(name="Bench", phone="201000000000"))
+        session.add(Question(text="q", question_type=QuestionType.MCQ, correct_answer="A"))
+
+    def unit_of_work(session):
+        try:
+            session.query(Question).filter(Question.id == 1).first()
+            session.query(Customer).filter(Customer.phone == "201000000000").first()
+        finally:
+            session.close()
+
+    def per_call_engine():
+        engine = create_engine(models.get_database_url(), connect_args={"check_same_thread": False})
+        return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    results = {}
+    for label, factory in (("per-call engine", per_call_engine), ("shared factory", models.get_session)):
+        unit_of_work(factory())  # warm-up
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            unit_of_work(factory())
+        elapsed = time.perf_counter() - start
+        results[label] = args.requests / elapsed
+        print(f"{label:>16}: {results[label]:9.1f} req/s  ({elapsed * 1000 / args.requests:.3f} ms/req)")
+
+    print(f"{'speedup':>16}: {results['shared factory'] / results['per-call engine']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: Arabic shaping cost per document, per-call shaping vs services/text_shaping.py.
+
+Replays the strings each document shapes for --documents guests with
+distinct names:
+
+- ticket: title, guest name, two venue lines, footer
+- certificate: the nine strings a certificate shaped per render before its
+  background was templated (event, title, "presented to", name, achievement,
+  score line, rank label, footer, location)
+
+"before" is what both generators did: a stock ArabicReshaper plus
+get_display on every string. "after" is reshape_arabic from
+services/text_shaping.py with a cold memo. It also times whole ticket
+renders with each.
+
+Usage (from admin-backend/):
+    python scripts/bench_text_shaping.py [--documents 1000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def ticket_strings(name):
+    return ["كن نجماً", name, "سوهاج - الكوامل", "قاعة قناة السويس", "نتمنى لك تجربة رائعة!"]
+
+
+def certificate_strings(name, points, rank, total):
+    return ["كن نجماً", "شهادة تقدير", "تُمنح هذه الشهادة إلى", name, "تقديراً لتميزه في مسابقة كن نجماً",
+            f"حصل على {points} نقطة  —  المركز {rank} من {total}", "المركز", "نتمنى لك المزيد من التميز والنجاح",
+            "سوهاج - الكوامل - قاعة قناة السويس"]
+
+
+def per_document(shape, documents):
+    start = time.perf_counter()
+    for strings in documents:
+        for text in strings:
+            shape(text)
+    return (time.perf_counter() - start) / len(documents)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--renders", type=int, default=200, help="whole ticket renders per variant")
+    args = parser.parse_args()
+
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+    from services import pdf_generator, text_shaping
+
+    stock = arabic_reshaper.ArabicReshaper(configuration={'delete_harakat': False, 'support_ligatures': True})
+
+    def before(text):
+        return get_display(stock.reshape(text)) if text else ""
+
+    first_names = ["محمد", "أحمد", "سارة", "مريم", "يوسف", "فاطمة", "عمر", "نور", "خالد", "هدى"]
+    names = [f"{first_names[i % 10]} {first_names[(i // 10) % 10]} {i}" for i in range(args.documents)]
+    workloads = {
+        "ticket": [ticket_strings(name) for name in names],
+        "certificate": [certificate_strings(name, 500 - i // 3, i + 1, args.documents) for i, name in enumerate(names)],
+    }
+
+    print(f"{args.documents} documents, memo size {text_shaping.CACHE_SIZE}")
+    for label, documents in workloads.items():
+        text_shaping._shape.cache_clear()
+        old = per_document(before, documents)
+        new = per_document(text_shaping.reshape_arabic, documents)
+        info = text_shaping._shape.cache_info()
+        print(f"{label:<12} shaping per document: before {old * 1e6:7.0f}us  after {new * 1e6:6.0f}us  "
+              f"({old / new:4.1f}x, memo hits {info.hits}/{info.hits + info.misses})")
+
+    renders = names[:args.renders]
+    for label, shape in (("before", before), ("after", text_shaping.reshape_arabic)):
+        pdf_generator.reshape_arabic = shape
+        start = time.perf_counter()
+        for i, name in enumerate(renders):
+            pdf_generator.generate_ticket_pdf(f"{i:06d}", "VIP", name, 500)
+        print(f"whole ticket render, {label:<6} {(time.perf_counter() - start) / len(renders) * 1000:6.2f}ms per document")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark: ticket code allocation at 10%, 50% and 90% of the 000000-999999 space.
+
+Fills a scratch SQLite file with tickets holding the first n codes of the
+sequence (as if the allocator had issued them), then for each fill level
+times --count allocations with:
+
+- random + SELECT: the previous Ticket.generate_unique_code_async, six
+  random digits and one lookup per attempt until a free code turns up
+- allocator: allocate_ticket_codes_async(1), one short block reservation
+  per TICKET_CODE_BLOCK codes and none in between
+- allocator, batch: allocate_ticket_codes_async(5), a five-ticket booking
+
+Usage (from admin-backend/):
+    python scripts/bench_ticket_codes.py [--count 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FILLS = (0.10, 0.50, 0.90)
+
+
+def fill(conn, start, end, permutation):
+    from sqlalchemy import insert, update
+    from models import Ticket, TicketCodeSequence
+
+    chunk = 50000
+    for first in range(start, end, chunk):
+        conn.execute(insert(Ticket), [
+            {"code": permutation.code(n), "ticket_type": "Student", "price": 100, "customer_id": 1, "status": "approved"}
+            for n in range(first, min(first + chunk, end))
+        ])
+    conn.execute(update(TicketCodeSequence).values(next_value=end))
+
+
+async def random_select(count):
+    """Replica of the previous generate_unique_code_async; returns (seconds, attempts)."""
+    from sqlalchemy import select
+    from models import get_async_session, Ticket
+
+    attempts = 0
+    session = get_async_session()
+    try:
+        start = time.perf_counter()
+        for _ in range(count):
+            while True:
+                attempts += 1
+                code = ''.join(random.choices(string.digits, k=6))
+                if not (await session.execute(select(Ticket.id).where(Ticket.code == code))).first():
+                    break
+        return time.perf_counter() - start, attempts
+    finally:
+        await session.close()
+
+
+async def allocator(count, batch):
+    import models
+
+    models.ticket_codes = models.CodeAllocator()   # a fresh process: its first call reserves a block
+    start = time.perf_counter()
+    for _ in range(count // batch):
+        await models.allocate_ticket_codes_async(batch)
+    return time.perf_counter() - start
+
+
+async def run(args):
+    import models
+    from services.ticket_codes import CodePermutation, CODE_SPACE
+
+    with models.session_scope() as session:
+        permutation = CodePermutation(session.get(models.TicketCodeSequence, 1).key)
+    issued = 0
+    print(f"{args.count} codes per variant, block size {models.TICKET_CODE_BLOCK}")
+    for level in FILLS:
+        target = int(CODE_SPACE * level)
+        t = time.perf_counter()
+        with models.engine.begin() as conn:
+            fill(conn, issued, target, permutation)
+        issued = target
+        fill_time = time.perf_counter() - t
+        old, attempts = await random_select(args.count)
+        new = await allocator(args.count, 1)
+        batch = await allocator(args.count, 5)
+        print(f"{int(level * 100):>3}% full ({fill_time:4.1f}s to fill):  random + SELECT {old / args.count * 1e6:7.0f}us/code "
+              f"({attempts / args.count:4.1f} attempts)   allocator {new / args.count * 1e6:5.0f}us/code   "
+              f"batch of 5 {batch / args.count * 1e6:5.0f}us/code")
+    await models.async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_codes.db"
+    import models
+    from models import Customer
+
+    models.init_db()
+    with models.session_scope() as session:
+        session.add(Customer(id=1, name="Guest", phone="201000000000"))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
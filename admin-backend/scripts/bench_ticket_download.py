@@ -0,0 +1,85 @@
+"""
+Benchmark: GET /api/tickets/{id}/pdf at the gate, first download vs repeats.
+
+Seeds --tickets approved tickets on a scratch database, starts the API and
+downloads each ticket --rounds times:
+
+- first: rendered in the pool (what every download cost before the cache)
+- memory: served from the in-memory LRU
+- disk: memory cleared, as after a restart
+- 304: the client revalidates with If-None-Match
+
+Usage (from admin-backend/):
+    python scripts/bench_ticket_download.py [--tickets 50] [--rounds 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_outbox import serve, stop
+from load_quiz_answers import percentile, seed
+
+
+async def download_all(base_url, token, ticket_ids, etags=None):
+    import httpx
+
+    times, received = [], {}
+    async with httpx.AsyncClient(base_url=base_url, headers={"Authorization": f"Bearer {token}"}, timeout=60) as client:
+        for ticket_id in ticket_ids:
+            headers = {"If-None-Match": etags[ticket_id]} if etags else {}
+            start = time.perf_counter()
+            response = await client.get(f"/api/tickets/{ticket_id}/pdf", headers=headers)
+            times.append(time.perf_counter() - start)
+            assert response.status_code == (304 if etags else 200), response.status_code
+            received[ticket_id] = response.headers["etag"]
+    return times, received
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8776)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL=f"sqlite:///{tmp}/bench_download.db", RENDER_CACHE_DIR=f"{tmp}/render-cache")
+    import logging
+    logging.disable(logging.WARNING)
+    seed(args.tickets)
+    from main import app
+    from routes.auth import create_access_token
+    from routes.tickets import ticket_pdf_cache
+
+    token = create_access_token({"sub": "bench@bestar.local", "role": "admin"})
+    base_url = f"http://127.0.0.1:{args.port}"
+    ids = list(range(1, args.tickets + 1))
+    rows = []
+    api = serve(app, args.port)
+    try:
+        times, etags = asyncio.run(download_all(base_url, token, ids))
+        rows.append(("first (render)", times))
+        times = []
+        for _ in range(args.rounds):
+            times += asyncio.run(download_all(base_url, token, ids))[0]
+        rows.append(("memory", times))
+        ticket_pdf_cache._memory.clear()
+        rows.append(("disk", asyncio.run(download_all(base_url, token, ids))[0]))
+        rows.append(("304", asyncio.run(download_all(base_url, token, ids, etags))[0]))
+    finally:
+        stop(*api)
+
+    print(f"{args.tickets} tickets; cache misses {ticket_pdf_cache.misses}, memory hits {ticket_pdf_cache.hits}, "
+          f"disk hits {ticket_pdf_cache.disk_hits}")
+    for label, times in rows:
+        ms = [t * 1000 for t in times]
+        print(f"{label:<15} p50 {percentile(ms, 50):6.1f}ms  p90 {percentile(ms, 90):6.1f}ms  ({len(ms)} requests)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: ticket list endpoints on a large event.
+
+Seeds a fresh SQLite file with N approved tickets (one customer each), then
+times the admin list endpoints and counts the SQL statements each request
+issues, so N+1 regressions show up as a statement count that grows with N.
+
+Usage (from admin-backend/):
+    python scripts/bench_ticket_lists.py [--tickets 5000] [--rounds 5] [--page-size 500]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile
+
+ENDPOINTS = (
+    "/api/tickets/",
+    "/api/stats/recent-tickets?limit=50",
+    "/api/engagement/attendees",
+    "/api/engagement/hidden",
+    "/api/certificates/participants",
+)
+
+
+def seed(count):
+    import models
+    from models import Customer, Ticket, TicketStatus, TicketType
+
+    models.init_db()
+    with models.session_scope() as session:
+        customers = [Customer(name=f"Guest {i}", phone=f"2010{i:08d}") for i in range(count)]
+        session.add_all(customers)
+        session.flush()
+        session.add_all(Ticket(
+            code=f"{i:06d}", ticket_type=TicketType.VIP, price=500, customer_id=c.id,
+            status=TicketStatus.APPROVED, payment_proof="تم التحويل من رقم 010",
+        ) for i, c in enumerate(customers))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--db", default="/tmp/bench_ticket_lists.db")
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+
+    import logging
+    logging.disable(logging.WARNING)
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    import models
+    from main import app
+    from routes.auth import create_access_token
+
+    seed(args.tickets)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench@bestar.local'})}"}
+
+    statements = [0]
+
+    @event.listens_for(models.async_engine.sync_engine, "before_cursor_execute")
+    def count(*_):
+        statements[0] += 1
+
+    with TestClient(app) as client:
+        for path in ENDPOINTS:
+            client.get(path, headers=headers)  # warm-up
+            timings = []
+            for _ in range(args.rounds):
+                statements[0] = 0
+                start = time.perf_counter()
+                client.get(path, headers=headers).raise_for_status()
+                timings.append(time.perf_counter() - start)
+            print(f"{path:<38} p50={percentile(timings, 50) * 1000:7.1f}ms  statements={statements[0]}")
+
+        # Walk the full ticket list page by page with the keyset cursor
+        pages, total, cursor = 0, 0, None
+        start = time.perf_counter()
+        while True:
+            params = {"limit": args.page_size}
+            if cursor:
+                params["cursor"] = cursor
+            resp = client.get("/api/tickets/", headers=headers, params=params)
+            resp.raise_for_status()
+            pages += 1
+            total += len(resp.json())
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        print(f"keyset walk: {total} tickets in {pages} pages of {args.page_size}, "
+              f"{(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: ticket PDF rendering on the event loop vs the pre-warmed render pool.
+
+- in the request: generate_ticket_pdf called on the event loop, one per
+  approval, which is what approve_ticket did (QR at ERROR_CORRECT_H included)
+- pool: the same --count renders submitted together to RenderPool
+
+A heartbeat task ticks every 10ms meanwhile; its worst delay is how long
+every other request would have waited. It also times the first render on a
+cold pool (spawn + imports + fonts inside the render) against a pool brought
+up with start() and the generators' warm-ups.
+
+Usage (from admin-backend/):
+    python scripts/bench_ticket_render.py [--count 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_certificates import timed
+
+
+def tickets(count):
+    return [{"ticket_code": f"{i:06d}", "ticket_type": "VIP" if i % 5 == 0 else "Student",
+             "customer_name": f"ضيف رقم {i}", "price": 100} for i in range(count)]
+
+
+async def first_render(pool, kwargs, warm):
+    from services.pdf_generator import generate_ticket_pdf
+
+    if warm:
+        await pool.start()
+    start = time.perf_counter()
+    await pool.run(generate_ticket_pdf, **kwargs)
+    return time.perf_counter() - start
+
+
+async def run(args):
+    from services.pdf_generator import generate_ticket_pdf, warm_up
+    from services.render_pool import RenderPool
+
+    calls = tickets(args.count)
+    cold = RenderPool()
+    cold_first = await first_render(cold, calls[0], warm=False)
+    cold.shutdown()
+    pool = RenderPool()
+    pool.add_warmup(warm_up)
+    warm_first = await first_render(pool, calls[0], warm=True)
+
+    async def in_request():
+        for kwargs in calls:
+            generate_ticket_pdf(**kwargs)
+            await asyncio.sleep(0)
+
+    async def in_pool():
+        await asyncio.gather(*(pool.run(generate_ticket_pdf, **kwargs) for kwargs in calls))
+
+    rows = [("in the request",) + await timed(in_request), (f"pool x{pool.workers}",) + await timed(in_pool)]
+    pool.shutdown()
+    return cold_first, warm_first, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=50)
+    args = parser.parse_args()
+
+    cold_first, warm_first, rows = asyncio.run(run(args))
+    print(f"{args.count} tickets, {os.cpu_count()} CPU(s)")
+    print(f"first render: cold pool {cold_first * 1000:.0f}ms, started + warmed pool {warm_first * 1000:.0f}ms")
+    for label, wall, stall in rows:
+        print(f"{label:<16} {wall:6.2f}s  {args.count / wall:6.1f} PDF/s  worst event-loop stall {stall * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark: hourly booking/revenue series from ticket_rollups vs bucketing the tickets table.
+
+Seeds --tickets tickets spread over the last --days days on a scratch SQLite
+file (a third approved, a tenth of those activated, a quarter sold by
+distributors). init_db backfills ticket_events and the rollups from them.
+It then times, --rounds times each:
+
+- scan: what a "bookings per hour" view had to do before, reading every
+  ticket's created_at/approved_at/status and bucketing in Python
+- rollups: GET /api/stats/timeseries for the same window
+
+It also checks that both agree on bookings and revenue per hour.
+
+Usage (from admin-backend/):
+    python scripts/bench_timeseries.py [--tickets 50000] [--days 30] [--rounds 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile
+
+
+def seed(count, days):
+    from sqlalchemy import insert
+    import models
+    from models import Customer, Distributor, Ticket, TicketStatus, TicketType
+
+    models.init_db()
+    rnd = random.Random(7)
+    now = datetime.utcnow()
+    with models.engine.begin() as conn:
+        distributors = [conn.execute(insert(Distributor).values(name=f"D{i}", phone=f"2012{i:08d}")).inserted_primary_key[0]
+                        for i in range(4)]
+        conn.execute(insert(Customer), [{"id": i + 1, "name": f"Guest {i}", "phone": f"2010{i:08d}"} for i in range(count)])
+        rows = []
+        for i in range(count):
+            created_at = now - timedelta(seconds=rnd.randrange(days * 86400))
+            status = rnd.choice([TicketStatus.PENDING, TicketStatus.PAYMENT_SUBMITTED, TicketStatus.APPROVED, TicketStatus.REJECTED])
+            if status == TicketStatus.APPROVED and rnd.random() < 0.1:
+                status = TicketStatus.ACTIVATED
+            paid = status in (TicketStatus.APPROVED, TicketStatus.ACTIVATED)
+            rows.append({
+                "code": f"{i:06d}", "ticket_type": (TicketType.VIP if i % 4 == 0 else TicketType.STUDENT).value,
+                "price": 500 if i % 4 == 0 else 100, "customer_id": i + 1, "status": status.value,
+                "distributor_id": rnd.choice(distributors) if i % 4 == 1 else None, "created_at": created_at,
+                "approved_at": min(created_at + timedelta(hours=rnd.randrange(48)), now) if paid else None, "updated_at": created_at,
+            })
+        conn.execute(insert(Ticket), rows)   # Core insert: no events, as for tickets that predate the log
+    models.init_db()
+
+
+def scan(since):
+    """Bookings and revenue per hour from the tickets table itself."""
+    from sqlalchemy import select
+    import models
+    from models import Ticket, rollup_bucket, REVENUE_STATUSES
+
+    series = {}
+    with models.engine.connect() as conn:
+        for created_at, approved_at, status, price in conn.execute(
+            select(Ticket.created_at, Ticket.approved_at, Ticket.status, Ticket.price)
+        ):
+            if created_at >= since:
+                point = series.setdefault(rollup_bucket("hour", created_at), {"bookings": 0, "revenue": 0})
+                point["bookings"] += 1
+            if status in REVENUE_STATUSES and approved_at and approved_at >= since:
+                point = series.setdefault(rollup_bucket("hour", approved_at), {"bookings": 0, "revenue": 0})
+                point["revenue"] += price
+    return series
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_timeseries.db"
+    import logging
+    logging.disable(logging.WARNING)
+    start = time.perf_counter()
+    seed(args.tickets, args.days)
+    print(f"{args.tickets} tickets over {args.days} days, seeded and backfilled in {time.perf_counter() - start:.1f}s")
+
+    import models
+    from routes.stats import get_timeseries
+
+    until = datetime.utcnow()
+    since = models.rollup_bucket("hour", until - timedelta(days=args.days))
+    rows = []
+    times = []
+    for _ in range(args.rounds):
+        t = time.perf_counter()
+        expected = scan(since)
+        times.append((time.perf_counter() - t) * 1000)
+    rows.append(("scan tickets", times))
+
+    async def read():
+        times, result = [], None
+        for _ in range(args.rounds):
+            t = time.perf_counter()
+            result = await get_timeseries(period="hour", since=since, until=until)
+            times.append((time.perf_counter() - t) * 1000)
+        await models.async_engine.dispose()
+        return times, result
+
+    times, result = asyncio.run(read())
+    rows.append(("ticket_rollups", times))
+    for label, ms in rows:
+        print(f"{label:<15} p50 {percentile(ms, 50):8.2f}ms  p90 {percentile(ms, 90):8.2f}ms")
+    got = {datetime.fromisoformat(p["bucket"]): {"bookings": p["bookings"], "revenue": p["revenue"]}
+           for p in result["points"] if p["bookings"] or p["revenue"]}
+    print(f"{len(result['points'])} hourly points; rollups match the scan: {got == expected}")
+
+
+if __name__ == "__main__":
+    main()
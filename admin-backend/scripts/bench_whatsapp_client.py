@@ -0,0 +1,150 @@
+"""
+Benchmark: per-message overhead of WhatsApp sends against a local mock Evolution API.
+
+Starts scripts/fake_evolution_api.py with uvicorn, over TLS with a throwaway self-signed
+certificate unless --plain, then sends N text messages:
+
+- legacy: a fresh httpx.AsyncClient per message, like the old WhatsAppService
+- shared: WhatsAppService.send_message through services.http_client's pool
+
+both one at a time and with --concurrency in flight.
+
+Usage (from admin-backend/):
+    python scripts/bench_whatsapp_client.py [--messages 300] [--concurrency 20] [--plain]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile
+from fake_evolution_api import create_app
+
+
+def self_signed_cert(directory):
+    """Write a localhost certificate + key; returns (certfile, keyfile)."""
+    import ipaddress
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5)).not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), True)
+        .sign(key, hashes.SHA256())
+    )
+    certfile, keyfile = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(certfile, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return certfile, keyfile
+
+
+async def legacy_send(api_url, instance, phone, message):
+    """The pre-change WhatsAppService.send_message transport."""
+    import httpx
+
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{api_url}/message/sendText/{instance}",
+                                     json={"number": phone, "text": message},
+                                     headers={"apikey": "bench", "Content-Type": "application/json"},
+                                     timeout=30.0)
+        response.raise_for_status()
+        return response.json()
+
+
+async def measure(send, messages, concurrency):
+    in_flight = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with in_flight:
+            start = time.perf_counter()
+            result = await send(f"2010{i:08d}", "رسالة تجريبية")
+            latencies.append(time.perf_counter() - start)
+            assert result, "send failed"
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    return time.perf_counter() - start, latencies
+
+
+async def run(api_url, args):
+    from services.http_client import http_client
+    from services.whatsapp_service import WhatsAppService
+
+    service = WhatsAppService()
+    instance = service.instance_name
+    await http_client.start()
+    try:
+        await service.send_message("201000000000", "warm-up")
+        rows = []
+        for concurrency in (1, args.concurrency):
+            legacy = await measure(lambda p, m: legacy_send(api_url, instance, p, m), args.messages, concurrency)
+            shared = await measure(service.send_message, args.messages, concurrency)
+            rows.append((concurrency, legacy, shared))
+        return rows
+    finally:
+        await http_client.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--plain", action="store_true", help="plain HTTP instead of TLS")
+    args = parser.parse_args()
+
+    import logging
+    import uvicorn
+
+    tmp = tempfile.mkdtemp()
+    ssl = {}
+    scheme = "http"
+    if not args.plain:
+        certfile, keyfile = self_signed_cert(tmp)
+        ssl = {"ssl_certfile": certfile, "ssl_keyfile": keyfile}
+        os.environ["SSL_CERT_FILE"] = certfile   # trusted by httpx for both transports
+        scheme = "https"
+    api_url = f"{scheme}://127.0.0.1:{args.port}"
+    os.environ.update(EVOLUTION_API_URL=api_url, EVOLUTION_API_KEY="bench", EVOLUTION_INSTANCE_NAME="bench")
+    logging.disable(logging.WARNING)
+
+    server = uvicorn.Server(uvicorn.Config(create_app(), host="127.0.0.1", port=args.port, log_level="warning", **ssl))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        rows = asyncio.run(run(api_url, args))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    print(f"{args.messages} text messages to a mock Evolution API over {scheme}")
+    for concurrency, legacy, shared in rows:
+        for label, (wall, latencies) in (("client per message", legacy), ("shared pool", shared)):
+            print(f"{concurrency:>3} in flight  {label:<19} {wall:6.2f}s  "
+                  f"{wall / args.messages * 1000:6.2f}ms/message  p50={percentile(latencies, 50) * 1000:6.2f}ms "
+                  f"p99={percentile(latencies, 99) * 1000:6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
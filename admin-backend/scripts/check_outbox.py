@@ -0,0 +1,147 @@
+"""
+End-to-end check of the outbound message queue against the fake Evolution API.
+
+Seeds N approved tickets, starts scripts/fake_evolution_api.py (failing a
+share of requests) and the API with fast pacing/backoff, then:
+
+1. queues an engagement text campaign and a thank-you job through the API,
+   re-posting the campaign with the same Idempotency-Key;
+2. restarts the API mid-campaign (messages left "sending" are requeued);
+3. waits for /api/jobs/{id} to report completion and checks every phone
+   was reached, how many were duplicated by the restart, and that every
+   thank-you message left exactly one ThankYouLog row.
+
+Usage (from admin-backend/):
+    python scripts/check_outbox.py [--messages 200] [--fail-rate 0.2]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_evolution_api import create_app
+from load_quiz_answers import seed
+
+
+def serve(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.02)
+    return server, thread
+
+
+def stop(server, thread):
+    server.should_exit = True
+    thread.join()
+
+
+async def wait_for(client, job_id, predicate, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = (await client.get(f"/api/jobs/{job_id}")).json()
+        if predicate(job):
+            return job
+        await asyncio.sleep(0.1)
+    raise TimeoutError(f"job {job_id} stuck: {job}")
+
+
+async def queue_jobs(base_url, token, phones, ticket_ids):
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "check-outbox-campaign"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=30) as client:
+        body = {"phones": phones, "type": "text", "content": "اهلا بيك في كن نجماً"}
+        first = (await client.post("/api/engagement/send", json=body)).json()
+        again = (await client.post("/api/engagement/send", json=body)).json()
+        assert first["job_id"] == again["job_id"], "Idempotency-Key did not dedupe the campaign"
+        thanks = (await client.post("/api/certificates/send-thanks",
+                                    headers={"Idempotency-Key": "check-outbox-thanks"},
+                                    json={"ticket_ids": ticket_ids, "message": "شكراً يا {name}"})).json()
+        await wait_for(client, first["job_id"], lambda job: job["sent"] >= len(phones) * 0.4)
+        return first["job_id"], thanks["job_id"]
+
+
+async def finish(base_url, token, job_ids):
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=30) as client:
+        return [await wait_for(client, job_id, lambda job: job["status"] == "completed") for job_id in job_ids]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    parser.add_argument("--db", default="/tmp/check_outbox.db")
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--evolution-port", type=int, default=8769)
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{args.db}",
+        EVOLUTION_API_URL=f"http://127.0.0.1:{args.evolution_port}",
+        EVOLUTION_API_KEY="check", EVOLUTION_INSTANCE_NAME="check",
+        OUTBOX_RATE_PER_MIN="20000", OUTBOX_BURST="1", OUTBOX_JITTER="0.003",
+        OUTBOX_BATCH_PAUSE_MIN="0.05", OUTBOX_BATCH_PAUSE_MAX="0.1",
+        OUTBOX_BACKOFF_BASE="0.05", OUTBOX_POLL_INTERVAL="0.05", OUTBOX_MAX_ATTEMPTS="8",
+    )
+
+    import logging
+    logging.disable(logging.ERROR)
+    from main import app
+    from models import session_scope, Ticket, ThankYouLog
+    from routes.auth import create_access_token
+
+    seed(args.messages)
+    with session_scope() as session:
+        ticket_ids = [t.id for t in session.query(Ticket.id).all()]
+    phones = [f"2010{i:08d}" for i in range(args.messages)]
+    thanks_tickets = ticket_ids[:50]   # seeded in phone order, so these are the first 50 phones
+    token = create_access_token({"sub": "check@bestar.local", "role": "admin"})
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    fake = create_app(fail_rate=args.fail_rate, latency=0.002, seed=1)
+    evolution = serve(fake, args.evolution_port)
+    try:
+        api = serve(app, args.port)
+        campaign_id, thanks_id = asyncio.run(queue_jobs(base_url, token, phones, thanks_tickets))
+        stop(*api)
+        print("API restarted mid-campaign")
+        api = serve(app, args.port)
+        campaign, thanks = asyncio.run(finish(base_url, token, [campaign_id, thanks_id]))
+        stop(*api)
+    finally:
+        stop(*evolution)
+
+    texts = Counter(m["number"] for m in fake.state.received)
+    with session_scope() as session:
+        thank_logs = session.query(ThankYouLog).count()
+    missing = [p for p in phones if texts[p] == 0]
+    expected = Counter(phones) + Counter(phones[:len(thanks_tickets)])   # campaign + thanks
+    duplicated = sum(max(0, texts[p] - expected[p]) for p in phones)
+
+    for job in (campaign, thanks):
+        print(f"job {job['id']} {job['kind']:<10} {job['status']}: sent={job['sent']} failed={job['failed']} "
+              f"of {job['total']}")
+    print(f"fake Evolution API: {len(fake.state.received)} accepted, {fake.state.rejected} rejected (retried)")
+    print(f"phones never reached: {len(missing)}, repeated by the restart (at-least-once): {duplicated}, "
+          f"thank-you log rows: {thank_logs}/{thanks['total']}")
+    assert campaign["total"] == args.messages and not missing
+    assert thank_logs == thanks["total"]
+
+
+if __name__ == "__main__":
+    main()
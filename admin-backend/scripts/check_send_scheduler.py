@@ -0,0 +1,121 @@
+"""
+Check the shared send scheduler: two campaigns at once stay inside one
+envelope per WhatsApp number, and a quiz question queued mid-campaign
+pre-empts the thank-you backlog.
+
+Runs the real outbox (routes/jobs.py + services/outbox.py) on a scratch
+SQLite database with a recording handler instead of Evolution API, and a
+fast envelope so the run takes seconds:
+
+1. queue a thank-you job and an engagement campaign together on the main
+   instance, plus a small job on a second instance;
+2. once some messages are out, queue a quiz question;
+3. report the peak send rate per instance against the envelope and how
+   long the quiz waited behind the backlog.
+
+Usage (from admin-backend/):
+    python scripts/check_send_scheduler.py [--messages 150] [--rate 600]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def peak(times, window):
+    """Most sends inside any `window` seconds."""
+    best, start = 0, 0
+    for end, t in enumerate(times):
+        while t - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def run(args):
+    from models import init_db, async_engine
+    from routes import jobs
+
+    sends = []   # (monotonic time, instance, job kind)
+
+    async def record(phone, payload, instance):
+        sends.append((time.monotonic(), payload["instance"], payload["job"]))
+        return True
+
+    jobs.register_handler("record", record)
+
+    def messages(job, count, instance=jobs.DEFAULT_INSTANCE):
+        return [{"phone": f"2010{i:08d}", "kind": "record", "instance": instance,
+                 "payload": {"job": job, "instance": instance}} for i in range(count)]
+
+    init_db()
+    await jobs.start_outbox()
+    try:
+        await jobs.enqueue_job("thanks", messages("thanks", args.messages))
+        await jobs.enqueue_job("engagement", messages("engagement", args.messages))
+        await jobs.enqueue_job("vip", messages("vip", args.messages // 5, instance="second-number"))
+        while len(sends) < args.messages // 4:
+            await asyncio.sleep(0.01)
+        quiz_queued = time.monotonic()
+        await jobs.enqueue_job("quiz", messages("quiz", args.messages // 5))
+        total = 2 * args.messages + 2 * (args.messages // 5)
+        while len(sends) < total:
+            await asyncio.sleep(0.05)
+        stats = await jobs.get_send_stats()
+    finally:
+        await jobs.stop_outbox()
+        await async_engine.dispose()
+    return sends, quiz_queued, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=150, help="per campaign")
+    parser.add_argument("--rate", type=float, default=600.0, help="envelope, messages per minute per instance")
+    parser.add_argument("--burst", type=int, default=3)
+    parser.add_argument("--db", default="/tmp/check_send_scheduler.db")
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    interval = 60.0 / args.rate
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{args.db}", EVOLUTION_INSTANCE_NAME="main-number",
+        OUTBOX_RATE_PER_MIN=str(args.rate), OUTBOX_BURST=str(args.burst), OUTBOX_JITTER=str(interval / 5),
+        OUTBOX_BATCH_SIZE="25", OUTBOX_BATCH_PAUSE_MIN=str(interval * 3), OUTBOX_BATCH_PAUSE_MAX=str(interval * 4),
+        OUTBOX_POLL_INTERVAL="0.05",
+    )
+    import logging
+    logging.disable(logging.WARNING)
+
+    sends, quiz_queued, stats = asyncio.run(run(args))
+
+    by_instance = defaultdict(list)
+    for t, instance, _ in sends:
+        by_instance[instance].append(t)
+    window = 25 * interval   # one batch worth of slots
+    allowed = args.burst - 1 + window / interval
+    print(f"envelope: {args.rate:.0f}/min per instance, burst {args.burst}, batch pause every 25")
+    for instance, times in by_instance.items():
+        span = times[-1] - times[0]
+        print(f"{instance:<14} {len(times):>4} sends in {span:5.2f}s = {len(times) / span * 60:6.0f}/min average, "
+              f"peak {peak(times, window)} in {window:.2f}s (envelope allows {allowed:.0f})")
+        assert peak(times, window) <= allowed
+
+    main_sends = [(t, job) for t, instance, job in sends if instance == "main-number"]
+    quiz_times = [t for t, job in main_sends if job == "quiz"]
+    overtaken = sum(1 for t, job in main_sends if job != "quiz" and quiz_queued <= t <= quiz_times[-1])
+    print(f"quiz: first send {quiz_times[0] - quiz_queued:.2f}s after queueing, all {len(quiz_times)} out in "
+          f"{quiz_times[-1] - quiz_queued:.2f}s; {overtaken} campaign messages went out meanwhile "
+          f"(slots already reserved by workers)")
+    print(f"stats after drain: queue_depth={stats['queue_depth']} instances={sorted(stats['instances'])}")
+    assert overtaken <= int(os.getenv("OUTBOX_WORKERS", 4))
+
+
+if __name__ == "__main__":
+    main()
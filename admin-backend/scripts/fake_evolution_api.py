@@ -0,0 +1,82 @@
+"""
+Fake Evolution API for local WhatsApp testing.
+
+Accepts /message/sendText|sendMedia/{instance} like Evolution API, records
+every accepted message in memory (with its request size), and can fail a
+share of requests with HTTP 500 to exercise retries. A media URL is
+downloaded like Evolution does, and its size recorded. GET /_received lists
+what arrived; POST /_reset clears it.
+
+Usage (from admin-backend/):
+    python scripts/fake_evolution_api.py [--port 8080] [--fail-rate 0.2] [--latency 0.05]
+then point EVOLUTION_API_URL at http://127.0.0.1:8080 (any API key/instance).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+def create_app(fail_rate: float = 0.0, latency: float = 0.0, seed: int = 0):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI(title="Fake Evolution API")
+    rnd = random.Random(seed)
+    app.state.received = []
+    app.state.rejected = 0
+
+    async def download(url: str) -> int:
+        import httpx
+
+        async with httpx.AsyncClient(timeout=60) as client:
+            response = await client.get(url)
+            response.raise_for_status()
+            return len(response.content)
+
+    @app.post("/message/{kind}/{instance}")
+    async def send(kind: str, instance: str, request: Request):
+        body = await request.body()
+        payload = json.loads(body)
+        media = payload.get("media") or ""
+        media_bytes = await download(media) if media.startswith(("http://", "https://")) else 0
+        if latency:
+            await asyncio.sleep(latency)
+        if rnd.random() < fail_rate:
+            app.state.rejected += 1
+            return JSONResponse({"status": 500, "error": "Internal Server Error"}, status_code=500)
+        app.state.received.append({
+            "kind": kind, "instance": instance, "number": payload.get("number"),
+            "mediatype": payload.get("mediatype"), "at": time.time(),
+            "bytes": len(body), "media_bytes": media_bytes,
+        })
+        return {"key": {"remoteJid": f"{payload.get('number')}@s.whatsapp.net", "fromMe": True,
+                        "id": f"FAKE{len(app.state.received)}"}, "status": "PENDING"}
+
+    @app.get("/_received")
+    async def received():
+        return {"received": app.state.received, "rejected": app.state.rejected}
+
+    @app.post("/_reset")
+    async def reset():
+        app.state.received.clear()
+        app.state.rejected = 0
+        return {"ok": True}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(args.fail_rate, args.latency), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Reference gate client: check tickets in offline and sync the scan journal.
+
+The gate fetches the event id and QR key from /api/tickets/gate/config
+once while online (kept in the journal, so a restart works offline). Each
+scan is then verified locally (services.ticket_qr), checked against the
+gate's own earlier scans and written to a local SQLite journal before the
+gate answers. Pending scans are pushed to /api/tickets/activate/batch in
+bulk whenever the network allows. The server settles double scans across
+gates: a scan this gate admitted that another gate admitted earlier comes
+back as a conflict.
+
+Usage (from admin-backend/); scanned QR text is read line by line from stdin,
+as a USB scanner types it:
+    python scripts/gate_scanner.py --api https://admin-bestar.mrailabs.com --token JWT --gate north-1
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.ticket_qr import TicketSigner
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS scans (
+    scan_id TEXT PRIMARY KEY,
+    ticket_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    scanned_at TEXT NOT NULL,
+    local_result TEXT NOT NULL,       -- admitted / duplicate, as answered at the gate
+    server_result TEXT,               -- after sync: admitted / duplicate / conflict / not_found / not_approved / invalid
+    synced INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_scans_ticket ON scans (ticket_id, scanned_at);
+CREATE INDEX IF NOT EXISTS ix_scans_pending ON scans (synced, scanned_at);
+"""
+
+
+class GateJournal:
+    def __init__(self, path: str, gate_id: str):
+        self.gate_id = gate_id
+        self.db = sqlite3.connect(path)
+        # WAL + NORMAL: a scan survives the app crashing, and committing one costs no fsync
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        config = dict(self.db.execute("SELECT key, value FROM config"))
+        self.signer = TicketSigner(config["secret"], config["event_id"]) if config else None
+
+    def configure(self, client):
+        """Fetch the event id and QR key (needs the network once)."""
+        response = client.get("/api/tickets/gate/config")
+        response.raise_for_status()
+        config = response.json()
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
+                                [("secret", config["secret"]), ("event_id", config["event_id"])])
+        self.signer = TicketSigner(config["secret"], config["event_id"])
+
+    def scan(self, payload: str) -> dict:
+        """Answer a scan at once, from the signature and this gate's journal; the scan is journaled before returning."""
+        claim = self.signer.verify(payload)
+        if claim is None:
+            return {"result": "invalid"}
+        first = self.db.execute("SELECT scanned_at FROM scans WHERE ticket_id = ? ORDER BY scanned_at LIMIT 1",
+                                (claim.ticket_id,)).fetchone()
+        result = "duplicate" if first else "admitted"
+        with self.db:
+            self.db.execute(
+                "INSERT INTO scans (scan_id, ticket_id, payload, scanned_at, local_result) VALUES (?, ?, ?, ?, ?)",
+                (f"{self.gate_id}:{uuid.uuid4().hex}", claim.ticket_id, payload.strip(),
+                 datetime.utcnow().isoformat(), result),
+            )
+        return {"result": result, "ticket_id": claim.ticket_id, "code": claim.code, "ticket_type": claim.ticket_type,
+                "first_scanned_at": first[0] if first else None}
+
+    def pending(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM scans WHERE synced = 0").fetchone()[0]
+
+    def sync(self, client, batch_size: int = 500) -> dict:
+        """Push pending scans in batches; returns the server's counts and the scans admitted here but not there."""
+        counts, conflicts = {}, []
+        while True:
+            rows = self.db.execute(
+                "SELECT scan_id, payload, scanned_at, local_result FROM scans WHERE synced = 0 ORDER BY scanned_at LIMIT ?",
+                (batch_size,),
+            ).fetchall()
+            if not rows:
+                return {"counts": counts, "conflicts": conflicts}
+            response = client.post("/api/tickets/activate/batch", json={
+                "gate_id": self.gate_id,
+                "scans": [{"scan_id": scan_id, "payload": payload, "scanned_at": scanned_at}
+                          for scan_id, payload, scanned_at, _ in rows],
+            })
+            response.raise_for_status()
+            local = {scan_id: local_result for scan_id, _, _, local_result in rows}
+            results = response.json()["results"]
+            for result in results:
+                counts[result["result"]] = counts.get(result["result"], 0) + 1
+                if local[result["scan_id"]] == "admitted" and result["result"] != "admitted":
+                    conflicts.append(result)
+            with self.db:
+                self.db.executemany("UPDATE scans SET synced = 1, server_result = ? WHERE scan_id = ?",
+                                    [(result["result"], result["scan_id"]) for result in results])
+
+
+def main():
+    import httpx
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--api", required=True)
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--gate", required=True)
+    parser.add_argument("--journal", default="gate_journal.db")
+    parser.add_argument("--sync-every", type=int, default=50, help="scans between sync attempts")
+    args = parser.parse_args()
+
+    journal = GateJournal(args.journal, args.gate)
+    client = httpx.Client(base_url=args.api, headers={"Authorization": f"Bearer {args.token}"}, timeout=10)
+
+    def try_sync():
+        try:
+            summary = journal.sync(client)
+        except httpx.HTTPError as e:
+            print(f"sync postponed ({e}); {journal.pending()} scans pending", file=sys.stderr)
+            return
+        for conflict in summary["conflicts"]:
+            print(f"CONFLICT ticket {conflict.get('ticket_id')}: {conflict['result']} {conflict.get('first_scan', '')}",
+                  file=sys.stderr)
+
+    if journal.signer is None:
+        journal.configure(client)
+    scans = 0
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        outcome = journal.scan(line)
+        print(outcome["result"].upper(), outcome.get("ticket_type", ""), outcome.get("code", ""), flush=True)
+        scans += 1
+        if scans % args.sync_every == 0:
+            try_sync()
+    try_sync()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Load script: replay a burst of quiz answers while admins poll the dashboard.
+
+Seeds a fresh SQLite file with approved tickets and one active question,
+starts the API in-process with uvicorn, then fires every answer at
+/api/quiz/answer concurrently together with /api/stats/dashboard polls.
+Reports the "database is locked" error rate and latency percentiles.
+
+Usage (from admin-backend/):
+    python scripts/load_quiz_answers.py --answers 500
+    python scripts/load_quiz_answers.py --journal-mode DELETE   # old behaviour
+    python scripts/load_quiz_answers.py --serialize-writes      # single-writer gate
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def seed(count):
+    from datetime import datetime, timedelta
+    import models
+    from models import Customer, Ticket, TicketStatus, TicketType, Question, QuestionType, QuestionStatus
+
+    models.init_db()
+    with models.session_scope() as session:
+        for i in range(count):
+            customer = Customer(name=f"Guest {i}", phone=f"2010{i:08d}")
+            session.add(customer)
+            session.flush()
+            session.add(Ticket(
+                code=f"{i:06d}", ticket_type=TicketType.STUDENT, price=100,
+                customer_id=customer.id, status=TicketStatus.APPROVED,
+            ))
+        question = Question(
+            text="Load test", question_type=QuestionType.MCQ, correct_answer="A",
+            status=QuestionStatus.ACTIVE, sent_at=datetime.utcnow(),
+            expires_at=datetime.utcnow() + timedelta(hours=1),
+        )
+        session.add(question)
+        session.flush()
+        return question.id
+
+
+async def fire(base_url, token, question_id, answers, dashboard_polls, concurrency):
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies, dashboard_latencies = [], []
+    errors = {"locked": 0, "other": 0}
+    # Cap in-flight requests: with thousands queued the client pool itself becomes the bottleneck
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=120) as client:
+        async def answer(i):
+            async with in_flight:
+                start = time.perf_counter()
+                resp = await client.post("/api/quiz/answer", json={
+                    "phone": f"2010{i:08d}", "question_id": question_id, "answer_text": "A",
+                })
+                latencies.append(time.perf_counter() - start)
+            if resp.status_code != 200:
+                errors["locked" if "locked" in resp.text else "other"] += 1
+
+        async def dashboard():
+            async with in_flight:
+                start = time.perf_counter()
+                resp = await client.get("/api/stats/dashboard")
+                dashboard_latencies.append(time.perf_counter() - start)
+            if resp.status_code != 200:
+                errors["locked" if "locked" in resp.text else "other"] += 1
+
+        tasks = [answer(i) for i in range(answers)] + [dashboard() for _ in range(dashboard_polls)]
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+
+    return latencies, dashboard_latencies, errors, wall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answers", type=int, default=500)
+    parser.add_argument("--dashboard-polls", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--db", default="/tmp/load_quiz_answers.db")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--journal-mode", default="WAL")
+    parser.add_argument("--serialize-writes", action="store_true")
+    args = parser.parse_args()
+
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    os.environ["SQLITE_JOURNAL_MODE"] = args.journal_mode
+    os.environ["DB_SERIALIZE_WRITES"] = "1" if args.serialize_writes else "0"
+
+    import logging
+    logging.disable(logging.INFO)
+    import uvicorn
+    from main import app
+    from routes.auth import create_access_token
+
+    question_id = seed(args.answers)
+    token = create_access_token({"sub": "load@bestar.local", "role": "admin"})
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        latencies, dashboard_latencies, errors, wall = asyncio.run(
+            fire(f"http://127.0.0.1:{args.port}", token, question_id, args.answers, args.dashboard_polls,
+                 args.concurrency)
+        )
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    total = len(latencies) + len(dashboard_latencies)
+    print(f"journal_mode={args.journal_mode} serialize_writes={args.serialize_writes} concurrency={args.concurrency}")
+    print(f"requests: {total} in {wall:.2f}s ({total / wall:.0f} req/s)")
+    print(f"lock errors: {errors['locked']} ({100.0 * errors['locked'] / total:.2f}%), other errors: {errors['other']}")
+    print(f"answer latency    p50={percentile(latencies, 50) * 1000:.0f}ms p99={percentile(latencies, 99) * 1000:.0f}ms")
+    print(f"dashboard latency p50={percentile(dashboard_latencies, 50) * 1000:.0f}ms "
+          f"p99={percentile(dashboard_latencies, 99) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
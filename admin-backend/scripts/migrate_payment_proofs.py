@@ -0,0 +1,80 @@
+"""
+One-shot migration: move inline base64 payment proofs into the blob store.
+
+Walks tickets and ticket_drafts in id order, in batches, and for every row
+whose payment_proof is a data: URI writes the decoded bytes to the blob
+store, records key/size/mime and clears the column. Each batch commits on
+its own so the script can be interrupted and re-run safely.
+
+Usage (from admin-backend/):
+    python scripts/migrate_payment_proofs.py [--batch-size 200] [--vacuum]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def migrate_table(model, batch_size):
+    import models
+    from services.blob_store import blob_store, parse_data_uri, sniff_mime
+
+    moved = skipped = freed = 0
+    last_id = 0
+    while True:
+        with models.session_scope() as session:
+            rows = (
+                session.query(model)
+                .filter(model.id > last_id, model.payment_proof.like("data:%"))
+                .order_by(model.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for row in rows:
+                last_id = row.id
+                parsed = parse_data_uri(row.payment_proof)
+                if not parsed:
+                    skipped += 1
+                    continue
+                data, _ = parsed
+                freed += len(row.payment_proof)
+                row.payment_proof_key = blob_store.put(data)
+                row.payment_proof_size = len(data)
+                row.payment_proof_mime = sniff_mime(data)
+                row.payment_proof = None
+                moved += 1
+        print(f"  {model.__tablename__}: {moved} moved, {skipped} skipped (up to id {last_id})")
+    return moved, skipped, freed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the SQLite file afterwards to reclaim space")
+    args = parser.parse_args()
+
+    import models
+    from models import Ticket, TicketDraft
+    from sqlalchemy import text
+
+    models.init_db()
+    total_moved = total_freed = 0
+    for model in (Ticket, TicketDraft):
+        moved, _, freed = migrate_table(model, args.batch_size)
+        total_moved += moved
+        total_freed += freed
+
+    print(f"✅ Moved {total_moved} proofs out of the database (~{total_freed / 1024 / 1024:.1f} MB of base64)")
+
+    if args.vacuum and models.engine.dialect.name == "sqlite":
+        with models.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        print("✅ VACUUM complete")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Simulator: how long a quiz question takes to reach every attendee, against its answer window.
+
+Runs the real SendScheduler / OutboxWorkerPool from services/outbox.py with
+an in-memory queue and a fixed per-request latency instead of the database
+and Evolution API. Time is compressed by --speedup and scaled back for the
+report. Scenarios:
+
+- serial: the old _send_quiz_bulk, one number, 3-8s random gap and a 60-90s
+  pause every 25, one request at a time
+- outbox, 1 number: the shared default envelope (OUTBOX_RATE_PER_MIN etc.)
+- fan-out: --instances numbers with the quiz envelope given on the command
+  line (what OUTBOX_INSTANCE_ENVELOPES would set), --workers requests in flight
+
+For each it prints the delivery-time distribution after the question is
+sent, how many recipients still had time under a single deadline of
+sent_at + --time-limit, and when the question closes now that each recipient
+gets the full limit from their own delivery time.
+
+Usage (from admin-backend/):
+    python scripts/simulate_quiz_fanout.py [--attendees 1000] [--time-limit 60] [--instances 5] [--rate 120]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_quiz_answers import percentile
+
+
+def simulate_serial(attendees, latency, seed=0):
+    """Delivery times of the pre-outbox loop: send, then sleep 3-8s (60-90s after every 25th)."""
+    rnd = random.Random(seed)
+    now, times = 0.0, []
+    for i in range(attendees):
+        now += latency
+        times.append(now)
+        if i < attendees - 1:
+            now += rnd.uniform(60, 90) if (i + 1) % 25 == 0 else rnd.uniform(3, 8)
+    return times
+
+
+async def simulate_outbox(attendees, instances, envelope, workers, latency, speedup):
+    """Delivery times through the real scheduler and worker pool, in simulated seconds."""
+    from services.outbox import OutboxWorkerPool, SendScheduler
+
+    scaled = dict(envelope)
+    scaled["rate_per_min"] = envelope["rate_per_min"] * speedup
+    scaled["jitter"] = envelope["jitter"] / speedup
+    scaled["batch_pause"] = tuple(p / speedup for p in envelope["batch_pause"])
+    queues = {name: deque() for name in instances}
+    for i in range(attendees):
+        queues[instances[i % len(instances)]].append(i)
+    delivered = []
+    done = asyncio.Event()
+
+    async def peek():
+        return [name for name, queue in queues.items() if queue]
+
+    async def claim(instance):
+        return queues[instance].popleft() if queues[instance] else None
+
+    async def deliver(message):
+        await asyncio.sleep(latency / speedup)
+        delivered.append(time.monotonic())
+        if len(delivered) == attendees:
+            done.set()
+
+    pool = OutboxWorkerPool(peek, claim, deliver, workers=workers,
+                            scheduler=SendScheduler(instance_envelopes={}, **scaled), poll_interval=0.01)
+    start = time.monotonic()
+    pool.start()
+    await done.wait()
+    await pool.stop(grace=0)
+    return [(t - start) * speedup for t in delivered]
+
+
+def report(label, times, time_limit):
+    times = sorted(times)
+    in_time = sum(1 for t in times if t < time_limit)
+    remaining = [max(0.0, time_limit - t) for t in times]
+    print(f"{label:<34} p50 {percentile(times, 50):7.1f}s  p90 {percentile(times, 90):7.1f}s  "
+          f"p99 {percentile(times, 99):7.1f}s  last {times[-1]:7.1f}s | before sent_at+{time_limit}s: "
+          f"{in_time:>5}/{len(times)} ({100.0 * in_time / len(times):5.1f}%), median time left "
+          f"{percentile(remaining, 50):4.1f}s | per-recipient window closes at {times[-1] + time_limit:7.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attendees", type=int, default=1000)
+    parser.add_argument("--time-limit", type=int, default=60, help="Question.time_limit_seconds")
+    parser.add_argument("--latency", type=float, default=0.3, help="Evolution API round trip, seconds")
+    parser.add_argument("--instances", type=int, default=5, help="fan-out numbers")
+    parser.add_argument("--rate", type=float, default=120.0, help="fan-out messages per minute per number")
+    parser.add_argument("--burst", type=int, default=3)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=0, help="fan-out sends between pauses (0 = none)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--speedup", type=float, default=200.0, help="simulated seconds per real second")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    from services import outbox
+
+    default_envelope = {
+        "rate_per_min": outbox.RATE_PER_MIN, "burst": outbox.BURST, "jitter": outbox.JITTER,
+        "batch_size": outbox.BATCH_SIZE, "batch_pause": (outbox.BATCH_PAUSE_MIN, outbox.BATCH_PAUSE_MAX),
+    }
+    fanout_envelope = {
+        "rate_per_min": args.rate, "burst": args.burst, "jitter": args.jitter,
+        "batch_size": args.batch_size, "batch_pause": default_envelope["batch_pause"],
+    }
+    print(f"{args.attendees} attendees, {args.time_limit}s answer limit, {args.latency * 1000:.0f}ms per request")
+    report("serial (old _send_quiz_bulk)", simulate_serial(args.attendees, args.latency), args.time_limit)
+    report(f"outbox, 1 number @ {outbox.RATE_PER_MIN:g}/min",
+           asyncio.run(simulate_outbox(args.attendees, ["main"], default_envelope, outbox.WORKERS,
+                                       args.latency, args.speedup)), args.time_limit)
+    names = [f"quiz-{n + 1}" for n in range(args.instances)]
+    report(f"fan-out, {args.instances} numbers @ {args.rate:g}/min",
+           asyncio.run(simulate_outbox(args.attendees, names, fanout_envelope, args.workers,
+                                       args.latency, args.speedup)), args.time_limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Content-addressed blob store for uploaded files (payment proofs, bulk WhatsApp media)
+
+Blobs live on local disk under data/blobs/<aa>/<bb>/<sha256>, keyed by the
+SHA-256 of their content, so the same screenshot uploaded twice is stored
+once. Database rows keep only the key, size and mime type.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from typing import Iterator, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOB_DIR = os.getenv("BLOB_STORE_DIR", os.path.join(BASE_DIR, "data", "blobs"))
+CHUNK_SIZE = 64 * 1024
+
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URI_RE = re.compile(r"^data:([\w.+-]+/[\w.+-]+)?(;[\w=-]+)*;base64,", re.IGNORECASE)
+
+
+class BlobStore:
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+
+    @staticmethod
+    def is_valid_key(key: str) -> bool:
+        return bool(key) and bool(_KEY_RE.match(key))
+
+    def path(self, key: str) -> str:
+        if not self.is_valid_key(key):
+            raise ValueError(f"Invalid blob key: {key!r}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return self.is_valid_key(key) and os.path.exists(self.path(key))
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self.path(key))
+
+    def put(self, data: bytes) -> str:
+        """Store bytes and return their key. Existing content is not rewritten."""
+        key = hashlib.sha256(data).hexdigest()
+        path = self.path(key)
+        if os.path.exists(path):
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file in the same directory, then rename atomically
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key
+
+    def get(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the bytes [start, end] (inclusive) of a blob in chunks."""
+        path = self.path(key)
+        if end is None:
+            end = os.path.getsize(path) - 1
+        remaining = end - start + 1
+        with open(path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def parse_data_uri(value: Optional[str]) -> Optional[Tuple[bytes, str]]:
+    """Decode a 'data:<mime>;base64,...' string into (bytes, mime), else None."""
+    if not value:
+        return None
+    match = _DATA_URI_RE.match(value)
+    if not match:
+        return None
+    mime = (match.group(1) or "application/octet-stream").lower()
+    try:
+        data = base64.b64decode(value[match.end():], validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    return data, mime
+
+
+_MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+)
+
+
+def sniff_mime(data: bytes, default: str = "application/octet-stream") -> str:
+    """Mime type from the first bytes of common image/PDF files."""
+    for magic, mime in _MAGIC:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return default
+
+
+def decode_base64_media(value: Optional[str]) -> Optional[Tuple[bytes, str]]:
+    """A data: URI or bare base64 string as (bytes, mime), else None (e.g. an http URL)."""
+    parsed = parse_data_uri(value)
+    if parsed:
+        return parsed
+    if not value or value.startswith(("http://", "https://")):
+        return None
+    try:
+        data = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return data, sniff_mime(data)
+
+
+blob_store = BlobStore()
@@ -3,30 +3,15 @@ Premium Certificate PDF Generator — Be Star
 Generates elegant gold & black certificates using ReportLab with Arabic support.
 """
 import os
+from functools import lru_cache
 from io import BytesIO
 from reportlab.lib.colors import HexColor, white, Color
 from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfdoc
 from reportlab.lib.units import mm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from services.text_shaping import reshape_arabic, register_fonts
 import math
 
-# Arabic text reshaping
-try:
-    import arabic_reshaper
-    from bidi.algorithm import get_display
-    ARABIC_SUPPORT = True
-    print("Arabic support successfully initialized.")
-    # Configure reshaper to handle ligatures and harakat properly
-    configuration = {
-        'delete_harakat': False,
-        'support_ligatures': True,
-    }
-    reshaper = arabic_reshaper.ArabicReshaper(configuration=configuration)
-except ImportError as e:
-    ARABIC_SUPPORT = False
-    print(f"CRITICAL: Failed to import ARABIC text support libraries. Text will be disconnected. Error: {e}")
-
 # Colors
 GOLD = HexColor("#D4AF37")
 GOLD_LIGHT = HexColor("#F5E6A3")
@@ -36,30 +21,7 @@ DARK_CARD = HexColor("#141414")
 CREAM = HexColor("#FFF8E7")
 
 # Fonts
-FONT_REGULAR = "Helvetica"
-FONT_BOLD = "Helvetica-Bold"
-
-try:
-    pdfmetrics.registerFont(TTFont('Amiri-Regular', '/app/fonts/Amiri-Regular.ttf'))
-    pdfmetrics.registerFont(TTFont('Amiri-Bold', '/app/fonts/Amiri-Bold.ttf'))
-    FONT_REGULAR = 'Amiri-Regular'
-    FONT_BOLD = 'Amiri-Bold'
-except Exception as e:
-    print(f"Certificate: Error loading Arabic fonts: {e}")
-
-
-def reshape_arabic(text: str) -> str:
-    """Reshape Arabic text for proper display in PDF"""
-    if not text:
-        return ""
-    if not ARABIC_SUPPORT:
-        return text
-    try:
-        reshaped = reshaper.reshape(text)
-        return get_display(reshaped)
-    except Exception as e:
-        print(f"Certificate: Error reshaping Arabic text: {e}")
-        return text
+FONT_REGULAR, FONT_BOLD = register_fonts()
 
 
 def _draw_star(c, cx, cy, outer_r, inner_r, points=5, fill_color=GOLD):
@@ -149,24 +111,91 @@ def _draw_ornamental_border(c, width, height, margin=5*mm):
         c.drawPath(p, fill=True, stroke=False)
 
 
-def generate_certificate_pdf(
-    guest_name: str,
-    total_points: int,
-    rank: int,
-    total_participants: int,
-    event_name: str = None
-) -> bytes:
+# A4 Landscape
+PAGE_WIDTH, PAGE_HEIGHT = 297 * mm, 210 * mm
+
+# Vertical layout, shared by the background and the per-guest layer
+HEADER_H = 28 * mm
+HEADER_Y = PAGE_HEIGHT - 12 * mm - HEADER_H
+STAR_Y = HEADER_Y - 12 * mm
+TITLE_Y = STAR_Y - 18 * mm
+PRESENTED_Y = TITLE_Y - 18 * mm
+NAME_Y = PRESENTED_Y - 18 * mm
+ACHIEVE_Y = NAME_Y - 20 * mm
+SCORE_Y = ACHIEVE_Y - 18 * mm
+BADGE_X, BADGE_Y = PAGE_WIDTH - 42 * mm, SCORE_Y + 15 * mm
+
+
+class _RecordingCanvas(canvas.Canvas):
+    """Canvas that remembers every string it draws as (font, size, text)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.strings = []
+
+    def drawString(self, x, y, text, *args, **kwargs):
+        self.strings.append((self._fontname, self._fontsize, text))
+        super().drawString(x, y, text, *args, **kwargs)
+
+    def drawCentredString(self, x, y, text, *args, **kwargs):
+        self.strings.append((self._fontname, self._fontsize, text))
+        super().drawCentredString(x, y, text, *args, **kwargs)
+
+    def drawRightString(self, x, y, text, *args, **kwargs):
+        self.strings.append((self._fontname, self._fontsize, text))
+        super().drawRightString(x, y, text, *args, **kwargs)
+
+
+class _PageTemplate:
     """
-    Generate a premium certificate PDF.
-    
-    Returns: PDF as bytes
+    The static part of the certificate (everything but the guest's name,
+    score and rank), drawn once and stamped into each PDF as a form XObject.
+
+    ReportLab assigns font names, TrueType subset codes and alpha states per
+    document, so draw() re-registers the recorded strings in the same order
+    before placing the form; the cached operators then mean the same thing in
+    the new document. Only the registration is repeated, not the drawing or
+    the Arabic reshaping.
     """
-    buffer = BytesIO()
-    
-    # A4 Landscape
-    width, height = 297 * mm, 210 * mm
-    c = canvas.Canvas(buffer, pagesize=(width, height))
-    
+    FORM_NAME = "CertificateBackground"
+
+    def __init__(self, event_name: str, event_date: str):
+        scratch = _RecordingCanvas(BytesIO(), pagesize=(PAGE_WIDTH, PAGE_HEIGHT))
+        _draw_background(scratch, event_name, event_date)
+        self.code = [scratch._preamble] + scratch._code
+        self.strings = scratch.strings
+        self.ext_gstate = scratch._extgstate.getState()
+        self.compression = scratch._pageCompression
+
+    def draw(self, c):
+        for font_name, size, text in self.strings:
+            t = c.beginText()
+            t.setFont(font_name, size)
+            t.textOut(text)
+
+        form = pdfdoc.PDFFormXObject(0, 0, PAGE_WIDTH, PAGE_HEIGHT)
+        form.compression = self.compression
+        form.setStreamList(self.code)
+        # PDFFormXObject leaves ExtGState out of its own resources; the gradient needs it
+        resources = pdfdoc.PDFResourceDictionary()
+        resources.basicFonts()
+        resources.basicProcs()
+        if self.ext_gstate:
+            resources.ExtGState = self.ext_gstate
+        form.Resources = resources
+        c._doc.addForm(self.FORM_NAME, form)
+        c.doForm(self.FORM_NAME)
+
+
+@lru_cache(maxsize=4)
+def _page_template(event_name: str, event_date: str) -> _PageTemplate:
+    return _PageTemplate(event_name, event_date)
+
+
+def _draw_background(c, event_name: str, event_date: str):
+    """Everything on the certificate that is the same for every guest."""
+    width, height = PAGE_WIDTH, PAGE_HEIGHT
+
     # ━━━━━━━━━━━ BACKGROUND ━━━━━━━━━━━
     c.setFillColor(DARK_BG)
     c.rect(0, 0, width, height, fill=True, stroke=False)
@@ -184,8 +213,8 @@ def generate_certificate_pdf(
     _draw_ornamental_border(c, width, height)
     
     # ━━━━━━━━━━━ TOP HEADER BAND ━━━━━━━━━━━
-    header_h = 28 * mm
-    header_y = height - 12 * mm - header_h
+    header_h = HEADER_H
+    header_y = HEADER_Y
     
     # Gold gradient band
     c.setFillColor(GOLD)
@@ -202,18 +231,18 @@ def generate_certificate_pdf(
     
     # Arabic subtitle
     c.setFont(FONT_REGULAR, 14)
-    arabic_event = reshape_arabic(event_name or "كن نجماً")
+    arabic_event = reshape_arabic(event_name)
     c.drawCentredString(width / 2, header_y + 5 * mm, arabic_event)
     
     # ━━━━━━━━━━━ STARS DECORATION ━━━━━━━━━━━
     # Three stars above the title
-    star_y = header_y - 12 * mm
+    star_y = STAR_Y
     _draw_star(c, width / 2, star_y, 5 * mm, 2 * mm)
     _draw_star(c, width / 2 - 18 * mm, star_y, 3 * mm, 1.2 * mm)
     _draw_star(c, width / 2 + 18 * mm, star_y, 3 * mm, 1.2 * mm)
     
     # ━━━━━━━━━━━ CERTIFICATE TITLE ━━━━━━━━━━━
-    title_y = star_y - 18 * mm
+    title_y = TITLE_Y
     c.setFillColor(GOLD_LIGHT)
     c.setFont(FONT_BOLD, 36)
     cert_title = reshape_arabic("شهادة تقدير")
@@ -236,20 +265,14 @@ def generate_certificate_pdf(
     _draw_laurel_branch(c, width / 2 + 55 * mm, laurel_y, side="right", scale=0.8)
     
     # ━━━━━━━━━━━ PRESENTED TO ━━━━━━━━━━━
-    presented_y = title_y - 18 * mm
+    presented_y = PRESENTED_Y
     c.setFillColor(GOLD)
     c.setFont(FONT_REGULAR, 13)
     presented_text = reshape_arabic("تُمنح هذه الشهادة إلى")
     c.drawCentredString(width / 2, presented_y, presented_text)
     
-    # ━━━━━━━━━━━ GUEST NAME (HERO) ━━━━━━━━━━━
-    name_y = presented_y - 18 * mm
-    c.setFillColor(white)
-    c.setFont(FONT_BOLD, 32)
-    display_name = reshape_arabic(guest_name)
-    c.drawCentredString(width / 2, name_y, display_name)
-    
-    # Underline for name
+    # Underline for the guest name
+    name_y = NAME_Y
     c.setStrokeColor(GOLD)
     c.setLineWidth(0.5)
     c.setDash(1, 1)
@@ -258,7 +281,7 @@ def generate_certificate_pdf(
     c.setDash()  # Reset dash
     
     # ━━━━━━━━━━━ ACHIEVEMENT TEXT ━━━━━━━━━━━
-    achieve_y = name_y - 20 * mm
+    achieve_y = ACHIEVE_Y
     c.setFillColor(GOLD_LIGHT)
     c.setFont(FONT_REGULAR, 14)
     
@@ -266,7 +289,7 @@ def generate_certificate_pdf(
     c.drawCentredString(width / 2, achieve_y, achieve_line1)
     
     # Score highlight box
-    score_y = achieve_y - 18 * mm
+    score_y = SCORE_Y
     box_w = 140 * mm
     box_h = 16 * mm
     c.setFillColor(Color(0.83, 0.69, 0.22, 0.1))
@@ -274,14 +297,9 @@ def generate_certificate_pdf(
     c.setLineWidth(0.8)
     c.roundRect(width / 2 - box_w / 2, score_y - 4 * mm, box_w, box_h, 3 * mm, fill=True, stroke=True)
     
-    c.setFillColor(GOLD)
-    c.setFont(FONT_BOLD, 16)
-    score_text = reshape_arabic(f"حصل على {total_points} نقطة  —  المركز {rank} من {total_participants}")
-    c.drawCentredString(width / 2, score_y + 2 * mm, score_text)
-    
     # ━━━━━━━━━━━ RANK BADGE (Right Side) ━━━━━━━━━━━
-    badge_x = width - 42 * mm
-    badge_y = score_y + 15 * mm
+    badge_x = BADGE_X
+    badge_y = BADGE_Y
     badge_r = 13 * mm
     
     # Outer circle
@@ -294,12 +312,8 @@ def generate_certificate_pdf(
     c.setFillColor(DARK_BG)
     c.circle(badge_x, badge_y, badge_r - 2.5 * mm, fill=True, stroke=False)
     
-    # Rank number
-    c.setFillColor(GOLD)
-    c.setFont(FONT_BOLD, 24)
-    c.drawCentredString(badge_x, badge_y + 2 * mm, f"#{rank}")
-    
     # Label
+    c.setFillColor(GOLD)
     c.setFont(FONT_REGULAR, 7)
     rank_label = reshape_arabic("المركز")
     c.drawCentredString(badge_x, badge_y - 7 * mm, rank_label)
@@ -349,10 +363,51 @@ def generate_certificate_pdf(
     
     # Event info in footer
     c.setFont(FONT_REGULAR, 8)
-    event_date = os.getenv("EVENT_DATE", "11 Feb 2026")
     event_location = reshape_arabic("سوهاج - الكوامل - قاعة قناة السويس")
     c.drawString(20 * mm, 14 * mm, f"{event_date}")
     c.drawRightString(width - 20 * mm, 14 * mm, event_location)
+
+
+def _draw_guest(c, guest_name: str, total_points: int, rank: int, total_participants: int):
+    """The per-guest text on top of the background: name, score line and rank number."""
+    width = PAGE_WIDTH
+
+    # ━━━━━━━━━━━ GUEST NAME (HERO) ━━━━━━━━━━━
+    c.setFillColor(white)
+    c.setFont(FONT_BOLD, 32)
+    display_name = reshape_arabic(guest_name)
+    c.drawCentredString(width / 2, NAME_Y, display_name)
+    
+    # ━━━━━━━━━━━ SCORE ━━━━━━━━━━━
+    c.setFillColor(GOLD)
+    c.setFont(FONT_BOLD, 16)
+    score_text = reshape_arabic(f"حصل على {total_points} نقطة  —  المركز {rank} من {total_participants}")
+    c.drawCentredString(width / 2, SCORE_Y + 2 * mm, score_text)
+    
+    # ━━━━━━━━━━━ RANK NUMBER ━━━━━━━━━━━
+    c.setFont(FONT_BOLD, 24)
+    c.drawCentredString(BADGE_X, BADGE_Y + 2 * mm, f"#{rank}")
+
+
+def generate_certificate_pdf(
+    guest_name: str,
+    total_points: int,
+    rank: int,
+    total_participants: int,
+    event_name: str = None
+) -> bytes:
+    """
+    Generate a premium certificate PDF: the cached background form with the
+    guest's text drawn over it.
+    
+    Returns: PDF as bytes
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(PAGE_WIDTH, PAGE_HEIGHT))
+    
+    template = _page_template(event_name or "كن نجماً", os.getenv("EVENT_DATE", "11 Feb 2026"))
+    template.draw(c)
+    _draw_guest(c, guest_name, total_points, rank, total_participants)
     
     # ━━━━━━━━━━━ FINALIZE ━━━━━━━━━━━
     c.save()
@@ -360,3 +415,8 @@ def generate_certificate_pdf(
     pdf_bytes = buffer.getvalue()
     buffer.close()
     return pdf_bytes
+
+
+def warm_up():
+    """Render pool worker warm-up: fonts, reshaper and the cached background template."""
+    generate_certificate_pdf(guest_name="ضيف", total_points=0, rank=1, total_participants=1)
@@ -0,0 +1,98 @@
+"""
+Shared outbound HTTP client
+
+One pooled httpx.AsyncClient per process for everything we send to
+Evolution API (WhatsApp) and n8n, so bursts of messages reuse warm
+keep-alive connections instead of paying a TCP (+TLS) handshake each.
+main.py opens it on startup and closes it on shutdown; callers pass a
+per-operation timeout name ("text", "media", "certificate", "webhook").
+
+HTTP/2 is used when HTTP2_ENABLED=1 and the `h2` package is installed
+(pip install "httpx[http2]"); it only applies to https:// endpoints.
+"""
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 50))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))   # seconds an idle connection is kept
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "0").lower() in ("1", "true", "yes")
+
+# Read/write budget per operation, seconds
+TIMEOUTS = {
+    "text": 30.0,
+    "media": 60.0,
+    "certificate": 120.0,
+    "webhook": 10.0,
+}
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class SharedHTTPClient:
+    def __init__(self, http2: bool = HTTP2_ENABLED, verify=True):
+        if http2 and not _h2_available():
+            logger.warning("HTTP2_ENABLED set but h2 is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.verify = verify
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2,
+            verify=self.verify,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=self.timeout("text"),
+        )
+
+    @staticmethod
+    def timeout(operation: str) -> httpx.Timeout:
+        budget = TIMEOUTS.get(operation, TIMEOUTS["text"])
+        return httpx.Timeout(budget, connect=min(CONNECT_TIMEOUT, budget))
+
+    async def start(self):
+        self._ensure_client()
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The pooled client for the running loop (opened on first use outside the app)."""
+        return self._ensure_client()
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            # Pooled connections belong to the loop that opened them
+            self._client = self._new_client()
+            self._loop = loop
+        return self._client
+
+    async def post(self, url: str, operation: str = "text", **kwargs) -> httpx.Response:
+        return await self.client.post(url, timeout=self.timeout(operation), **kwargs)
+
+
+http_client = SharedHTTPClient()
@@ -0,0 +1,221 @@
+"""
+In-memory quiz leaderboard
+
+Keeps per-ticket totals in sorted key lists (one for everyone, one per
+ticket type) so a submitted answer is a bisect remove + insert, and top-K
+or rank-of-ticket lookups never touch the database. The board is rebuilt
+from the answers table at startup and whenever it is invalidated (question
+or ticket deleted); answers recorded while a rebuild query is in flight are
+buffered and replayed if the rebuild did not already see them.
+
+Readers that want live updates wait on `wait_for_change(version)`.
+"""
+import asyncio
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional
+
+RANKINGS = ("row", "competition", "dense")
+ALL = None
+
+
+class _Entry:
+    __slots__ = ("ticket_id", "guest_name", "phone", "ticket_type",
+                 "total_points", "total_answers", "correct_answers")
+
+    def __init__(self, ticket_id, guest_name=None, phone=None, ticket_type=None):
+        self.ticket_id = ticket_id
+        self.guest_name = guest_name
+        self.phone = phone
+        self.ticket_type = ticket_type
+        self.total_points = 0
+        self.total_answers = 0
+        self.correct_answers = 0
+
+    @property
+    def key(self):
+        return (-self.total_points, self.ticket_id)
+
+
+class _Board:
+    """Sorted (-points, ticket_id) keys plus the distinct point values for dense ranks."""
+
+    def __init__(self):
+        self.keys: List[tuple] = []
+        self.distinct: List[int] = []          # sorted negative point values
+        self.counts: Dict[int, int] = {}
+
+    def add(self, key):
+        insort(self.keys, key)
+        neg_points = key[0]
+        if self.counts.get(neg_points, 0) == 0:
+            insort(self.distinct, neg_points)
+        self.counts[neg_points] = self.counts.get(neg_points, 0) + 1
+
+    def remove(self, key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+            neg_points = key[0]
+            self.counts[neg_points] -= 1
+            if self.counts[neg_points] == 0:
+                del self.counts[neg_points]
+                del self.distinct[bisect_left(self.distinct, neg_points)]
+
+    def rank(self, key, ranking: str) -> int:
+        if ranking == "competition":
+            return bisect_left(self.keys, (key[0], -1)) + 1
+        if ranking == "dense":
+            return bisect_left(self.distinct, key[0]) + 1
+        return bisect_left(self.keys, key) + 1
+
+
+class Leaderboard:
+    def __init__(self):
+        self.entries: Dict[int, _Entry] = {}
+        self.boards: Dict[Optional[str], _Board] = {ALL: _Board()}
+        self.loaded = False
+        self.version = 0
+        self._rebuilding = False
+        self._stale = False
+        self._buffer: List[tuple] = []
+        self._changed: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    # ── Loading ──
+
+    def begin_rebuild(self):
+        self._rebuilding = True
+        self._stale = False
+        self._buffer = []
+
+    def finish_rebuild(self, rows: Iterable, upto_answer_id: int):
+        """
+        Load totals from `rows` (ticket_id, guest_name, phone, ticket_type,
+        total_points, total_answers, correct_answers), which cover answers up
+        to `upto_answer_id`, then replay anything recorded after that.
+        """
+        self.entries = {}
+        self.boards = {ALL: _Board()}
+        for row in rows:
+            entry = _Entry(row.ticket_id, row.guest_name, row.phone, row.ticket_type)
+            entry.total_points = int(row.total_points or 0)
+            entry.total_answers = int(row.total_answers or 0)
+            entry.correct_answers = int(row.correct_answers or 0)
+            self._insert(entry)
+        buffered, self._buffer = self._buffer, []
+        self._rebuilding = False
+        self.loaded = not self._stale
+        for args in buffered:
+            if args[0] > upto_answer_id:
+                self._apply(*args)
+        self._notify()
+
+    def invalidate(self):
+        """Totals changed in a way we cannot replay (deletes); rebuild on next read."""
+        self.loaded = False
+        self._stale = self._rebuilding
+        self._notify()
+
+    # ── Updates ──
+
+    def record_answer(self, answer_id: int, ticket_id: int, points: int, is_correct: bool,
+                      guest_name: Optional[str] = None, phone: Optional[str] = None,
+                      ticket_type: Optional[str] = None):
+        args = (answer_id, ticket_id, points, is_correct, guest_name, phone, ticket_type)
+        if self._rebuilding:
+            self._buffer.append(args)
+            return
+        if not self.loaded:
+            return  # the next rebuild reads it from the database
+        self._apply(*args)
+        self._notify()
+
+    def _apply(self, answer_id, ticket_id, points, is_correct, guest_name, phone, ticket_type):
+        entry = self.entries.get(ticket_id)
+        if entry is None:
+            entry = _Entry(ticket_id, guest_name, phone, ticket_type)
+        else:
+            self._remove(entry)
+            entry.guest_name = entry.guest_name or guest_name
+        entry.total_points += int(points or 0)
+        entry.total_answers += 1
+        entry.correct_answers += 1 if is_correct else 0
+        self._insert(entry)
+
+    def _insert(self, entry: _Entry):
+        self.entries[entry.ticket_id] = entry
+        self.boards[ALL].add(entry.key)
+        if entry.ticket_type:
+            self.boards.setdefault(entry.ticket_type, _Board()).add(entry.key)
+
+    def _remove(self, entry: _Entry):
+        self.boards[ALL].remove(entry.key)
+        if entry.ticket_type in self.boards:
+            self.boards[entry.ticket_type].remove(entry.key)
+
+    # ── Queries ──
+
+    def top(self, limit: Optional[int] = None, offset: int = 0, ticket_type: Optional[str] = None,
+            ranking: str = "row") -> List[dict]:
+        board = self.boards.get(ticket_type) or _Board()
+        end = None if not limit else offset + limit
+        return [self._as_dict(self.entries[key[1]], board, ranking) for key in board.keys[offset:end]]
+
+    def rank_of(self, ticket_id: int, ticket_type: Optional[str] = None, ranking: str = "row") -> Optional[dict]:
+        entry = self.entries.get(ticket_id)
+        if entry is None or (ticket_type and entry.ticket_type != ticket_type):
+            return None
+        return self._as_dict(entry, self.boards[ticket_type], ranking)
+
+    def count(self, ticket_type: Optional[str] = None) -> int:
+        board = self.boards.get(ticket_type)
+        return len(board.keys) if board else 0
+
+    @staticmethod
+    def _as_dict(entry: _Entry, board: _Board, ranking: str) -> dict:
+        return {
+            "ticket_id": entry.ticket_id,
+            "guest_name": entry.guest_name or (entry.phone or "—"),
+            "phone": entry.phone or "—",
+            "ticket_type": entry.ticket_type,
+            "total_points": entry.total_points,
+            "total_answers": entry.total_answers,
+            "correct_answers": entry.correct_answers,
+            "rank": board.rank(entry.key, ranking),
+        }
+
+    # ── Change notification ──
+
+    def _notify(self):
+        """Wake waiters; safe to call from the sync routes' threadpool too."""
+        self.version += 1
+        event, self._changed = self._changed, None
+        if event is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            event.set()
+        else:
+            self._loop.call_soon_threadsafe(event.set)
+
+    async def wait_for_change(self, version: int, timeout: float) -> bool:
+        """Wait until `self.version` moves past `version`; False on timeout."""
+        if self.version != version:
+            return True
+        if self._changed is None:
+            self._loop = asyncio.get_running_loop()
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+quiz_leaderboard = Leaderboard()
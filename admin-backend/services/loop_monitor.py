@@ -0,0 +1,66 @@
+"""
+Event-loop lag monitor
+
+A background task sleeps for a fixed interval and records how late it wakes
+up. Any blocking call on the event loop (sync DB access, CPU-bound PDF work)
+shows up directly as lag, so this is the number to watch when checking that
+async handlers are not stalling WhatsApp sends and background tasks.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.25))   # seconds between probes
+WINDOW = int(os.getenv("LOOP_LAG_WINDOW", 240))          # samples kept (~1 min)
+WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", 200))
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = INTERVAL, window: int = WINDOW):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self.samples.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms > WARN_MS:
+                logger.warning(f"⚠️ Event loop blocked for {lag_ms:.0f}ms")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"samples": 0, "last_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(ordered),
+            "last_ms": round(self.samples[-1], 2),
+            "p50_ms": round(ordered[len(ordered) // 2], 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+            "max_ms": round(self.max_lag_ms, 2),
+        }
+
+
+loop_monitor = LoopLagMonitor()
@@ -1,7 +1,8 @@
-import httpx
 import os
 import logging
 
+from services.http_client import http_client
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,16 +16,11 @@ async def trigger_ticket_approved_workflow(ticket_data: dict):
     Sends ticket details to n8n to generate/send PDF via WhatsApp.
     """
     try:
-        async with httpx.AsyncClient() as client:
-            logger.info(f"Triggering n8n webhook at: {N8N_WEBHOOK_URL} for ticket {ticket_data.get('code')}")
-            response = await client.post(
-                N8N_WEBHOOK_URL,
-                json=ticket_data,
-                timeout=10.0
-            )
-            response.raise_for_status()
-            logger.info(f"Successfully triggered n8n workflow for ticket {ticket_data.get('code')}")
-            return True
+        logger.info(f"Triggering n8n webhook at: {N8N_WEBHOOK_URL} for ticket {ticket_data.get('code')}")
+        response = await http_client.post(N8N_WEBHOOK_URL, "webhook", json=ticket_data)
+        response.raise_for_status()
+        logger.info(f"Successfully triggered n8n workflow for ticket {ticket_data.get('code')}")
+        return True
     except Exception as e:
         logger.error(f"Failed to trigger n8n workflow: {str(e)}")
         return False
@@ -0,0 +1,289 @@
+"""
+Outbound message queue — send scheduling, retry backoff and the worker pool
+
+Bulk WhatsApp sends are written to the outbox_messages table first and
+drained here, so a restart mid-campaign resumes where it stopped and a
+failed send is retried with exponential backoff instead of being lost.
+
+The pool is storage-agnostic: routes/jobs.py supplies `peek()` (Evolution
+instances with due messages, most urgent first), `claim(instance)` (mark
+that instance's highest-priority due message as sending and return it, or
+None) and `deliver(message)`.
+
+Every send takes a token from its instance's bucket in one SendScheduler,
+so however many campaigns run at once the WhatsApp number never goes above
+the configured envelope: OUTBOX_RATE_PER_MIN with OUTBOX_BURST, a random
+0-OUTBOX_JITTER gap on top, and a 60-90s pause every OUTBOX_BATCH_SIZE
+sends. OUTBOX_INSTANCE_ENVELOPES can override any of these per number,
+e.g. for numbers dedicated to quiz fan-out. Workers claim only once they hold a
+token, so a quiz question queued behind a thank-you campaign goes out at
+the very next slot.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))
+POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 2.0))     # idle re-check, seconds
+STOP_GRACE = float(os.getenv("OUTBOX_STOP_GRACE", 10.0))          # let in-flight sends finish on shutdown
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 5.0))       # first retry after ~5s
+BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 600.0))
+
+# Anti-ban envelope, applied per Evolution instance across all jobs
+RATE_PER_MIN = float(os.getenv("OUTBOX_RATE_PER_MIN", 10.0))      # sustained messages per minute
+BURST = int(os.getenv("OUTBOX_BURST", 2))                         # back-to-back sends allowed after idling
+JITTER = float(os.getenv("OUTBOX_JITTER", 3.0))                   # extra random gap per send, seconds
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 25))              # sends between long pauses
+BATCH_PAUSE_MIN = float(os.getenv("OUTBOX_BATCH_PAUSE_MIN", 60.0))
+BATCH_PAUSE_MAX = float(os.getenv("OUTBOX_BATCH_PAUSE_MAX", 90.0))
+# Per-number overrides of the envelope above (TokenBucket arguments), as JSON, e.g. for numbers
+# dedicated to quiz fan-out: {"quiz-1": {"rate_per_min": 120, "batch_size": 0}}
+INSTANCE_ENVELOPES: Dict[str, dict] = json.loads(os.getenv("OUTBOX_INSTANCE_ENVELOPES") or "{}")
+
+# Claim order between jobs sharing an instance (higher first): a quiz question
+# is only useful while it is open, thank-you notes can wait.
+PRIORITIES = {"quiz": 100, "tickets": 60, "vip": 50, "certificates": 20, "engagement": 10, "thanks": 0}
+
+
+def backoff_delay(attempts: int) -> float:
+    """Seconds before retry number `attempts` (1-based): exponential, capped, half jitter."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return random.uniform(delay / 2, delay)
+
+
+class TokenBucket:
+    """
+    Send slots for one WhatsApp number. Reservations follow GCRA: one slot
+    every 60/rate seconds, up to `burst` early after idling; jitter and the
+    batch pause only ever push slots later.
+    """
+
+    def __init__(self, rate_per_min: float = RATE_PER_MIN, burst: int = BURST, jitter: float = JITTER,
+                 batch_size: int = BATCH_SIZE, batch_pause=(BATCH_PAUSE_MIN, BATCH_PAUSE_MAX)):
+        self.interval = 60.0 / rate_per_min
+        self.burst = max(1, burst)
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.sent = 0
+        self.waiting = 0
+        self._tat = 0.0              # theoretical arrival time of the next slot
+        self._paused_until = 0.0
+        self._recent = deque()       # monotonic times of sends in the last minute
+
+    def next_slot(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(now, self._tat - (self.burst - 1) * self.interval, self._paused_until)
+
+    def reserve(self) -> float:
+        """Book the next slot; returns seconds to wait for it."""
+        now = time.monotonic()
+        slot = self.next_slot(now) + random.uniform(0, self.jitter)
+        self._tat = max(self._tat, slot) + self.interval
+        self.sent += 1
+        if self.batch_size and self.sent % self.batch_size == 0:
+            pause = random.uniform(*self.batch_pause)
+            self._paused_until = slot + pause
+            logger.info(f"⏸️ Batch {self.sent // self.batch_size} complete. Pausing {pause:.0f}s after this send...")
+        return slot - now
+
+    def refund(self):
+        """Give back a reserved slot that found nothing to send."""
+        self.sent -= 1
+        self._tat = max(time.monotonic(), self._tat - self.interval)
+
+    def record(self):
+        now = time.monotonic()
+        self._recent.append(now)
+        while self._recent and self._recent[0] < now - 60:
+            self._recent.popleft()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self._recent and self._recent[0] < now - 60:
+            self._recent.popleft()
+        return {
+            "rate_per_min": round(60.0 / self.interval, 2),
+            "sent_last_minute": len(self._recent),
+            "sent_total": self.sent,
+            "waiting_workers": self.waiting,
+            "next_slot_in": round(self.next_slot(now) - now, 2),
+            "paused_for": round(max(0.0, self._paused_until - now), 2),
+        }
+
+
+class SendScheduler:
+    """One token bucket per Evolution instance, shared by every job and worker."""
+
+    def __init__(self, instance_envelopes: Optional[Dict[str, dict]] = None, **envelope):
+        self.envelope = envelope
+        self.instance_envelopes = INSTANCE_ENVELOPES if instance_envelopes is None else instance_envelopes
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = asyncio.Lock()
+
+    def bind(self):
+        """Fresh lock for the running loop (the pool may be restarted on a new loop)."""
+        self._lock = asyncio.Lock()
+
+    def bucket(self, instance: str) -> TokenBucket:
+        if instance not in self._buckets:
+            envelope = {**self.envelope, **self.instance_envelopes.get(instance, {})}
+            self._buckets[instance] = TokenBucket(**envelope)
+        return self._buckets[instance]
+
+    def next_slot(self, instance: str) -> float:
+        return self.bucket(instance).next_slot()
+
+    async def acquire(self, instance: str):
+        bucket = self.bucket(instance)
+        async with self._lock:
+            wait = bucket.reserve()
+        if wait > 0:
+            bucket.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                bucket.waiting -= 1
+
+    def refund(self, instance: str):
+        self.bucket(instance).refund()
+
+    def record(self, instance: str):
+        self.bucket(instance).record()
+
+    def stats(self) -> dict:
+        sample = TokenBucket(**self.envelope)
+        return {
+            "envelope": {
+                "rate_per_min": round(60.0 / sample.interval, 2),
+                "burst": sample.burst,
+                "jitter": sample.jitter,
+                "batch_size": sample.batch_size,
+                "batch_pause": list(sample.batch_pause),
+                "instance_overrides": self.instance_envelopes,
+            },
+            "instances": {name: bucket.stats() for name, bucket in self._buckets.items()},
+        }
+
+
+class OutboxWorkerPool:
+    def __init__(self, peek: Callable[[], Awaitable[List[str]]],
+                 claim: Callable[[str], Awaitable[Optional[object]]],
+                 deliver: Callable[[object], Awaitable[None]],
+                 workers: int = WORKERS, scheduler: Optional[SendScheduler] = None,
+                 poll_interval: float = POLL_INTERVAL):
+        self.peek = peek
+        self.claim = claim
+        self.deliver = deliver
+        self.workers = workers
+        self.scheduler = scheduler or SendScheduler()
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._claim_lock: Optional[asyncio.Lock] = None
+        self._busy: set = set()
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return any(not t.done() for t in self._tasks)
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._claim_lock = asyncio.Lock()
+        self.scheduler.bind()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._run(n)) for n in range(self.workers)]
+
+    async def stop(self, grace: float = STOP_GRACE):
+        """
+        Cancel idle/waiting workers now; give workers mid-claim or mid-send up
+        to `grace` seconds so a message the API already accepted is not sent
+        again after a restart. Claimed-but-unsent messages are requeued on start.
+        """
+        self._stopping = True
+        in_flight = [t for t in self._tasks if t in self._busy]
+        for task in self._tasks:
+            if task not in self._busy:
+                task.cancel()
+        if in_flight:
+            await asyncio.wait(in_flight, timeout=grace)
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._busy.clear()
+
+    def wake(self):
+        """New messages were queued; idle workers re-check now instead of at the next poll."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _idle(self):
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self, n: int):
+        task = asyncio.current_task()
+        while True:
+            try:
+                instances = await self.peek()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker {n}: peek failed: {e}")
+                instances = []
+            if not instances:
+                await self._idle()
+                continue
+            # Most urgent instance unless another one can send sooner
+            instance = min(instances, key=lambda i: (self.scheduler.next_slot(i), instances.index(i)))
+            await self.scheduler.acquire(instance)
+
+            # Claim only now, holding the token, so the highest priority wins the slot
+            self._busy.add(task)
+            try:
+                async with self._claim_lock:   # one claim at a time per process
+                    message = await self.claim(instance)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker {n}: claim failed: {e}")
+                message = None
+            finally:
+                self._busy.discard(task)
+            if self._stopping:
+                return
+            if message is None:
+                self.scheduler.refund(instance)
+                continue
+            self.scheduler.record(instance)
+            self._busy.add(task)
+            try:
+                await self.deliver(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker {n}: deliver failed: {e}")
+            finally:
+                self._busy.discard(task)
+            if self._stopping:
+                return
@@ -0,0 +1,56 @@
+"""
+Keyset (cursor) pagination for newest-first list endpoints
+
+Lists are ordered by (created_at DESC, id DESC). The cursor is the
+(created_at, id) of the last row on the page, so the next page is a plain
+index range scan instead of an ever-growing OFFSET.
+"""
+import base64
+import os
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import tuple_
+
+MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", 5000))
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Default to, and never exceed, MAX_PAGE_SIZE."""
+    if not limit or limit < 1:
+        return MAX_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for anything that is not a cursor we issued."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (UnicodeDecodeError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(query, created_col, id_col, cursor: Optional[str], limit: int):
+    """
+    Apply newest-first ordering, the cursor bound and limit to a select().
+    One extra row is fetched so next_cursor() can tell whether a next page exists.
+    """
+    if cursor:
+        query = query.where(tuple_(created_col, id_col) < tuple_(*decode_cursor(cursor)))
+    return query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1)
+
+
+def next_cursor(rows: list, limit: int, created_attr: str = "created_at", id_attr: str = "id") -> Optional[str]:
+    """Trim the look-ahead row off `rows` (in place) and return the cursor for the next page."""
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return encode_cursor(getattr(last, created_attr), getattr(last, id_attr))
@@ -3,64 +3,23 @@ PDF Ticket Generator Service - With Arabic Support (Fixed)
 """
 import qrcode
 from io import BytesIO
+import hashlib
 import os
 from reportlab.lib.colors import HexColor, white
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import mm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-
-# Arabic text reshaping
-try:
-    import arabic_reshaper
-    from bidi.algorithm import get_display
-    ARABIC_SUPPORT = True
-    print("Ticket PDF: Arabic support successfully initialized.")
-    # Configure reshaper to handle ligatures properly
-    configuration = {
-        'delete_harakat': False,
-        'support_ligatures': True,
-    }
-    reshaper = arabic_reshaper.ArabicReshaper(configuration=configuration)
-except ImportError as e:
-    ARABIC_SUPPORT = False
-    print(f"CRITICAL Ticket PDF: Failed to import ARABIC text support libraries. Text will be disconnected. Error: {e}")
+from services.text_shaping import reshape_arabic, register_fonts
 
+# Changes whenever this file does, so cached renders never outlive a layout change
+with open(__file__, "rb") as _source:
+    LAYOUT_VERSION = hashlib.sha1(_source.read()).hexdigest()[:12]
 
 # Colors
 GOLD = HexColor("#D4AF37")
 DARK_BG = HexColor("#0a0a0a")
 
-
-# Try to register Arabic-compatible fonts
-FONT_REGULAR = "Helvetica"
-FONT_BOLD = "Helvetica-Bold"
-
-# Register Arabic fonts
-try:
-    pdfmetrics.registerFont(TTFont('Amiri-Regular', '/app/fonts/Amiri-Regular.ttf'))
-    pdfmetrics.registerFont(TTFont('Amiri-Bold', '/app/fonts/Amiri-Bold.ttf'))
-    FONT_REGULAR = 'Amiri-Regular'
-    FONT_BOLD = 'Amiri-Bold'
-except Exception as e:
-    print(f"Error loading Arabic fonts: {e}")
-    # Fallback to Helvetica
-    FONT_REGULAR = "Helvetica"
-    FONT_BOLD = "Helvetica-Bold"
-
-
-def reshape_arabic(text: str) -> str:
-    """Reshape Arabic text for proper display in PDF"""
-    if not text:
-        return ""
-    if not ARABIC_SUPPORT:
-        return text
-    try:
-        reshaped = reshaper.reshape(text)
-        return get_display(reshaped)
-    except Exception as e:
-        print(f"Ticket PDF: Error reshaping Arabic text: {e}")
-        return text
+# Fonts
+FONT_REGULAR, FONT_BOLD = register_fonts()
 
 
 def generate_qr_code_image(data: str) -> BytesIO:
@@ -87,9 +46,14 @@ def generate_ticket_pdf(
     ticket_code: str,
     ticket_type: str,
     customer_name: str,
-    price: int
+    price: int,
+    qr_payload: str = None
 ) -> bytes:
-    """Generate ticket as PDF using ReportLab with Arabic support"""
+    """Generate ticket as PDF using ReportLab with Arabic support
+
+    The QR code carries qr_payload (the signed gate payload, services.ticket_qr),
+    or just the ticket code when there is none.
+    """
     
     buffer = BytesIO()
     width, height = 105*mm, 175*mm  # Taller to fit QR code
@@ -188,7 +152,7 @@ def generate_ticket_pdf(
     
     # 1. QR Code (Left)
     from reportlab.lib.utils import ImageReader
-    qr_buffer = generate_qr_code_image(ticket_code)
+    qr_buffer = generate_qr_code_image(qr_payload or ticket_code)
     qr_img = ImageReader(qr_buffer)
     qr_size = 30*mm
     # Draw QR on the left side
@@ -260,6 +224,11 @@ def generate_ticket_pdf(
     return pdf_bytes
 
 
+def warm_up():
+    """Render pool worker warm-up: one throwaway ticket loads the fonts, reshaper and QR/PNG encoders."""
+    generate_ticket_pdf(ticket_code="BS-WARMUP", ticket_type="VIP", customer_name="ضيف", price=0)
+
+
 def generate_ticket_html(
     ticket_code: str,
     ticket_type: str,
@@ -0,0 +1,34 @@
+"""
+Phone number canonicalization shared by lookups, storage and outgoing WhatsApp messages
+
+Numbers arrive as typed by guests and admins or as WhatsApp sends them:
+01012345678, +20 101 234 5678, 0020101..., 201012345678@s.whatsapp.net,
+Arabic-Indic digits. All of them map to one form, E.164 digits without the
+"+" (201012345678), which is also what Evolution API expects. Numbers
+without a country code get PHONE_COUNTRY_CODE (Egypt by default).
+Customers, ticket guests and VIP guests keep it in an indexed
+*_normalized column, so a lookup is a single equality on that column.
+"""
+import os
+
+COUNTRY_CODE = os.getenv("PHONE_COUNTRY_CODE", "20")
+NATIONAL_DIGITS = int(os.getenv("PHONE_NATIONAL_DIGITS", 10))   # 1012345678
+
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+
+
+def normalize_phone(phone) -> str:
+    """Canonical E.164 digits (no "+") for any way of writing a number; "" when there are no digits."""
+    if not phone:
+        return ""
+    phone = str(phone).split("@", 1)[0].split(":", 1)[0].translate(_DIGITS)   # WhatsApp JID / device suffix
+    digits = "".join(ch for ch in phone if "0" <= ch <= "9")
+    if digits.startswith("00"):                                    # international prefix
+        digits = digits[2:]
+    elif digits.startswith("0") and len(digits) == NATIONAL_DIGITS + 1:   # national trunk prefix
+        digits = COUNTRY_CODE + digits[1:]
+    elif len(digits) == NATIONAL_DIGITS and not digits.startswith(COUNTRY_CODE):
+        digits = COUNTRY_CODE + digits
+    if digits.startswith(COUNTRY_CODE + "0") and len(digits) == len(COUNTRY_CODE) + NATIONAL_DIGITS + 1:
+        digits = COUNTRY_CODE + digits[len(COUNTRY_CODE) + 1:]    # +20 010..., trunk kept after the code
+    return digits
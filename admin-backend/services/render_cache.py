@@ -0,0 +1,129 @@
+"""
+Cache of rendered documents (ticket PDFs) keyed by a hash of their rendering inputs
+
+A key covers everything that changes the output, so editing a ticket's name
+or type simply produces a new key and the old render ages out; nothing has
+to be invalidated by hand. The most recent renders are kept in memory
+(RENDER_CACHE_ITEMS), all of them on disk under data/render-cache/<name>/
+(RENDER_CACHE_MAX_MB, least recently used removed first), so a restart does
+not re-render every ticket at the gate. Concurrent requests for the same key
+share one render.
+"""
+import asyncio
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join(BASE_DIR, "data", "render-cache"))
+MAX_ITEMS = int(os.getenv("RENDER_CACHE_ITEMS", 256))
+MAX_BYTES = int(float(os.getenv("RENDER_CACHE_MAX_MB", 200)) * 1024 * 1024)
+
+
+class RenderCache:
+    def __init__(self, name: str, suffix: str = ".pdf", max_items: int = MAX_ITEMS, max_bytes: int = MAX_BYTES):
+        self.root = os.path.join(CACHE_DIR, name)
+        self.suffix = suffix
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._disk_bytes: Optional[int] = None   # scanned on first write
+        self.hits = self.disk_hits = self.misses = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + self.suffix)
+
+    # ── memory ──
+
+    def _remember(self, key: str, data: bytes):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def contains(self, key: str) -> bool:
+        return key in self._memory or os.path.exists(self.path(key))
+
+    # ── disk (blocking; called through asyncio.to_thread) ──
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)   # mtime doubles as last use for pruning
+        return data
+
+    def _write(self, key: str, data: bytes):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(size for _, size, _ in self._files())
+        else:
+            self._disk_bytes += len(data)
+        if self._disk_bytes > self.max_bytes:
+            self._prune()
+
+    def _files(self):
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(self.suffix):
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _prune(self):
+        """Drop least recently used files down to 90% of the cap."""
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._disk_bytes = total
+
+    # ── lookup ──
+
+    async def get_or_render(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return data
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load_or_render(key, render))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _load_or_render(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        data = await asyncio.to_thread(self._read, key)
+        if data is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            data = await render()
+            await asyncio.to_thread(self._write, key, data)
+        self._remember(key, data)
+        return data
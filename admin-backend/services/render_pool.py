@@ -0,0 +1,142 @@
+"""
+Process pool for CPU-bound PDF rendering
+
+generate_certificate_pdf is pure Python drawing (borders, laurels, stars):
+tens of milliseconds of CPU per certificate holding the GIL, so a thread
+does not keep the event loop responsive while a campaign renders. RenderPool
+runs such functions in a ProcessPoolExecutor sized to the cores
+(RENDER_WORKERS overrides). Generators register a warm-up (load fonts, build
+static templates) that every worker runs once as it starts, and start()
+brings all workers up ahead of the first render.
+
+RenderAhead sits between a queue of known-ahead work and its consumer: it
+starts rendering up to `lookahead` items in queue order, and the consumer
+takes each result by key, so a paced WhatsApp send finds its PDF already
+rendered instead of waiting on it. Anything not prefetched (a retry, a
+restart) is rendered on demand in the same pool.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("RENDER_WORKERS", 0)) or os.cpu_count() or 1
+LOOKAHEAD = int(os.getenv("RENDER_LOOKAHEAD", 0)) or WORKERS * 4
+
+
+def render_key(args: dict) -> str:
+    """Stable key for a render call: same arguments, same PDF."""
+    return hashlib.sha1(json.dumps(args, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def _warm_up(warmups):
+    """Worker initializer: a failing warm-up only costs that worker its head start."""
+    for fn in warmups:
+        try:
+            fn()
+        except Exception as e:
+            logger.warning(f"Render worker warm-up {fn.__module__}.{fn.__name__} failed: {e}")
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+class RenderPool:
+    def __init__(self, workers: int = WORKERS):
+        self.workers = workers
+        self._warmups: List[Callable[[], None]] = []
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._started: Optional[asyncio.Future] = None
+
+    def add_warmup(self, fn: Callable[[], None]):
+        """Run fn (a module-level function) in each worker as it starts; register at import time."""
+        self._warmups.append(fn)
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: the API process has aiosqlite/httpx threads that must not be forked mid-flight
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_warm_up, initargs=(tuple(self._warmups),))
+        return self._executor
+
+    def start(self) -> asyncio.Future:
+        """Bring every worker up (and through its warm-ups) in the background instead of on the first renders."""
+        loop = asyncio.get_running_loop()
+        executor = self._ensure_executor()
+        self._started = asyncio.gather(*(loop.run_in_executor(executor, _ready) for _ in range(self.workers)),
+                                       return_exceptions=True)
+        return self._started
+
+    async def run(self, fn: Callable[..., bytes], **kwargs) -> bytes:
+        loop = asyncio.get_running_loop()
+        executor = self._ensure_executor()
+        try:
+            return await loop.run_in_executor(executor, functools.partial(fn, **kwargs))
+        except BrokenProcessPool:
+            # a worker died (OOM, killed); the next render starts a fresh pool
+            if self._executor is executor:
+                self.shutdown()
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class RenderAhead:
+    """Bounded producer/consumer over RenderPool: prefetch() in queue order, take() by key."""
+
+    def __init__(self, pool: RenderPool, render: Callable[..., bytes], lookahead: int = LOOKAHEAD):
+        self.pool = pool
+        self.render = render
+        self.lookahead = lookahead
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    def _bind(self):
+        """Fresh state for the running loop (the app may be restarted on a new loop)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._futures = {}
+            self._slots = asyncio.Semaphore(self.lookahead)
+
+    @property
+    def pending(self) -> int:
+        return len(self._futures)
+
+    def prefetch(self, items: Iterable[dict]) -> asyncio.Task:
+        """Start rendering items (render kwargs) in order, never more than `lookahead` untaken."""
+        self._bind()
+        return asyncio.ensure_future(self._produce(list(items)))
+
+    async def _produce(self, items):
+        for args in items:
+            key = render_key(args)
+            if key in self._futures:
+                continue
+            await self._slots.acquire()
+            self._futures[key] = asyncio.ensure_future(self.pool.run(self.render, **args))
+
+    async def take(self, args: dict) -> bytes:
+        self._bind()
+        future = self._futures.pop(render_key(args), None)
+        if future is None:
+            return await self.pool.run(self.render, **args)
+        self._slots.release()
+        return await future
+
+
+render_pool = RenderPool()
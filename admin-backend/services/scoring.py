@@ -2,9 +2,14 @@
 Quiz Scoring Engine - Fuzzy text matching for completion questions
 Uses rapidfuzz for high-performance fuzzy string matching.
 Falls back to basic matching if rapidfuzz not installed.
+
+Accepted answers are normalized once per question (see services.quiz_cache);
+grade_answers() scores a whole list of answers at once with rapidfuzz's
+process.cdist, which runs on a native thread pool when numpy is available.
 """
 import re
 import logging
+from typing import Iterable, List, Optional, Sequence, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -17,23 +22,42 @@ except ImportError:
     HAS_RAPIDFUZZ = False
     logger.warning("rapidfuzz not installed, using basic matching")
 
+# process.cdist returns numpy arrays; without numpy batches are scored one by one
+try:
+    import numpy as np
+    from rapidfuzz import process
+    HAS_CDIST = HAS_RAPIDFUZZ
+except ImportError:
+    HAS_CDIST = False
+
+if HAS_RAPIDFUZZ:
+    # Best of these is the similarity score
+    SCORERS = (fuzz.ratio, fuzz.partial_ratio, fuzz.token_sort_ratio, fuzz.token_set_ratio)
+
+# Tashkeel (diacritics) dropped; alef variants, taa marbuta and ya folded — one str.translate pass
+_TASHKEEL = [
+    *range(0x0610, 0x061B), *range(0x064B, 0x0660), 0x0670,
+    *range(0x06D6, 0x06DD), *range(0x06DF, 0x06E5), 0x06E7, 0x06E8, *range(0x06EA, 0x06EE),
+]
+_ARABIC_TABLE = str.maketrans({
+    **dict.fromkeys(map(chr, _TASHKEEL)),
+    'إ': 'ا', 'أ': 'ا', 'آ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+})
+
 
 def normalize_arabic(text: str) -> str:
     """Normalize Arabic text for comparison"""
     if not text:
         return ""
-    text = text.strip().lower()
-    # Remove tashkeel (diacritics)
-    text = re.sub(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06DC\u06DF-\u06E4\u06E7\u06E8\u06EA-\u06ED]', '', text)
-    # Normalize alef variants
-    text = re.sub(r'[إأآا]', 'ا', text)
-    # Normalize taa marbuta
-    text = text.replace('ة', 'ه')
-    # Normalize ya
-    text = text.replace('ى', 'ي')
-    # Remove extra spaces
-    text = re.sub(r'\s+', ' ', text)
-    return text
+    # Lowercase, strip diacritics, fold letter variants, collapse whitespace
+    return " ".join(text.lower().translate(_ARABIC_TABLE).split())
+
+
+def normalize_options(options: Iterable[str]) -> Tuple[str, ...]:
+    """Normalize a question's accepted answers once, for reuse across submissions."""
+    return tuple(normalize_arabic(option) for option in options)
 
 
 def basic_similarity(s1: str, s2: str) -> float:
@@ -49,35 +73,41 @@ def basic_similarity(s1: str, s2: str) -> float:
     return (len(intersection) / len(union)) * 100
 
 
-def calculate_similarity(answer: str, correct: str) -> float:
-    """
-    Calculate similarity between user answer and correct answer.
-    Returns a score 0-100.
-    """
-    # Normalize both texts
-    norm_answer = normalize_arabic(answer)
-    norm_correct = normalize_arabic(correct)
-    
+def _similarity(norm_answer: str, norm_correct: str) -> float:
     # Exact match
     if norm_answer == norm_correct:
         return 100.0
     
     if HAS_RAPIDFUZZ:
         # Use multiple fuzzy matching strategies and take the best
-        scores = [
-            fuzz.ratio(norm_answer, norm_correct),
-            fuzz.partial_ratio(norm_answer, norm_correct),
-            fuzz.token_sort_ratio(norm_answer, norm_correct),
-            fuzz.token_set_ratio(norm_answer, norm_correct),
-        ]
-        return max(scores)
+        return max(scorer(norm_answer, norm_correct) for scorer in SCORERS)
     else:
         return basic_similarity(norm_answer, norm_correct)
 
 
-def evaluate_answer(answer_text: str, correct_answer: str, question_type: str, threshold: float = 90.0) -> dict:
+def calculate_similarity(answer: str, correct: str) -> float:
+    """
+    Calculate similarity between user answer and correct answer.
+    Returns a score 0-100.
+    """
+    return _similarity(normalize_arabic(answer), normalize_arabic(correct))
+
+
+def _completion_result(best_similarity: float, threshold: float) -> dict:
+    return {
+        "is_correct": best_similarity >= threshold,
+        "similarity_score": round(best_similarity, 1),
+        "method": "fuzzy_match" if HAS_RAPIDFUZZ else "basic_match"
+    }
+
+
+def evaluate_answer(answer_text: str, correct_answer: str, question_type: str, threshold: float = 90.0,
+                    correct_options: Optional[Sequence[str]] = None,
+                    normalized_options: Optional[Sequence[str]] = None) -> dict:
     """
     Evaluate a participant's answer.
+    `correct_options` is correct_answer already split on "||", `normalized_options`
+    the same after normalize_arabic (both cached per question in services.quiz_cache).
     
     Returns:
         {
@@ -103,21 +133,40 @@ def evaluate_answer(answer_text: str, correct_answer: str, question_type: str, t
     
     elif question_type == "completion":
         # Completion: fuzzy matching against one or more correct answers (separated by ||)
-        correct_options = [c.strip() for c in correct_answer.split("||") if c.strip()]
-        if not correct_options:
+        if normalized_options is None:
+            if correct_options is None:
+                correct_options = [c.strip() for c in correct_answer.split("||") if c.strip()]
+            normalized_options = normalize_options(correct_options)
+        if not normalized_options:
             return {"is_correct": False, "similarity_score": 0.0, "method": "no_correct_answer"}
         
-        best_similarity = 0.0
-        for option in correct_options:
-            similarity = calculate_similarity(answer_text, option)
-            if similarity > best_similarity:
-                best_similarity = similarity
-        
-        is_correct = best_similarity >= threshold
-        return {
-            "is_correct": is_correct,
-            "similarity_score": round(best_similarity, 1),
-            "method": "fuzzy_match" if HAS_RAPIDFUZZ else "basic_match"
-        }
+        norm_answer = normalize_arabic(answer_text)
+        best_similarity = max(_similarity(norm_answer, option) for option in normalized_options)
+        return _completion_result(best_similarity, threshold)
     
     return {"is_correct": False, "similarity_score": 0.0, "method": "unknown"}
+
+
+def grade_answers(answer_texts: Sequence[str], correct_answer: str, question_type: str, threshold: float = 90.0,
+                  normalized_options: Optional[Sequence[str]] = None, workers: int = -1) -> List[dict]:
+    """
+    Evaluate many answers to one question; same results as evaluate_answer() per item.
+    Completion answers are scored against every accepted variant in one
+    process.cdist call per scorer, spread over `workers` threads (-1 = all cores).
+    """
+    if question_type != "completion" or not HAS_CDIST or not answer_texts:
+        return [evaluate_answer(text, correct_answer, question_type, threshold,
+                                normalized_options=normalized_options) for text in answer_texts]
+    
+    if normalized_options is None:
+        normalized_options = normalize_options(c.strip() for c in correct_answer.split("||") if c.strip())
+    if not normalized_options:
+        return [{"is_correct": False, "similarity_score": 0.0, "method": "no_correct_answer"} for _ in answer_texts]
+    
+    norm_answers = [normalize_arabic(text) for text in answer_texts]
+    choices = list(normalized_options)
+    best = None
+    for scorer in SCORERS:
+        scores = process.cdist(norm_answers, choices, scorer=scorer, dtype=np.float64, workers=workers)
+        best = scores if best is None else np.maximum(best, scores)
+    return [_completion_result(float(score), threshold) for score in best.max(axis=1)]
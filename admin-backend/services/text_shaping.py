@@ -0,0 +1,75 @@
+"""
+Arabic text shaping and fonts shared by the PDF generators (tickets, certificates)
+
+ReportLab draws characters in the order it is given, so Arabic strings are
+reshaped (joined letter forms, ligatures) and reordered for display first.
+The same labels repeat across thousands of documents, so shaped strings are
+memoized in a bounded LRU (TEXT_SHAPING_CACHE_SIZE). Fonts are registered
+once per process, by the first register_fonts() call.
+"""
+import os
+from functools import lru_cache
+from typing import Tuple
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+CACHE_SIZE = int(os.getenv("TEXT_SHAPING_CACHE_SIZE", 4096))
+
+# Arabic text reshaping
+try:
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+
+    class _Reshaper(arabic_reshaper.ArabicReshaper):
+        # ArabicReshaper means to build its ligature regex once, but its hasattr() check never
+        # sees the name-mangled attribute, so every reshape() rebuilt it from the configuration
+        @property
+        def _ligatures_re(self):
+            try:
+                return self._compiled_ligatures_re
+            except AttributeError:
+                self._compiled_ligatures_re = super()._ligatures_re
+                return self._compiled_ligatures_re
+
+    ARABIC_SUPPORT = True
+    print("Arabic support successfully initialized.")
+    # Configure reshaper to handle ligatures and harakat properly
+    configuration = {
+        'delete_harakat': False,
+        'support_ligatures': True,
+    }
+    reshaper = _Reshaper(configuration=configuration)
+except ImportError as e:
+    ARABIC_SUPPORT = False
+    print(f"CRITICAL: Failed to import ARABIC text support libraries. Text will be disconnected. Error: {e}")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _shape(text: str) -> str:
+    return get_display(reshaper.reshape(text))
+
+
+def reshape_arabic(text: str) -> str:
+    """Reshape Arabic text for proper display in PDF"""
+    if not text:
+        return ""
+    if not ARABIC_SUPPORT:
+        return text
+    try:
+        return _shape(text)
+    except Exception as e:
+        print(f"Error reshaping Arabic text: {e}")
+        return text
+
+
+@lru_cache(maxsize=None)
+def register_fonts() -> Tuple[str, str]:
+    """(regular, bold) font names: Amiri, registered once per process, or Helvetica without the font files."""
+    try:
+        pdfmetrics.registerFont(TTFont('Amiri-Regular', '/app/fonts/Amiri-Regular.ttf'))
+        pdfmetrics.registerFont(TTFont('Amiri-Bold', '/app/fonts/Amiri-Bold.ttf'))
+        return 'Amiri-Regular', 'Amiri-Bold'
+    except Exception as e:
+        print(f"Error loading Arabic fonts: {e}")
+        return "Helvetica", "Helvetica-Bold"
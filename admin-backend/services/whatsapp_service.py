@@ -1,8 +1,10 @@
 import os
-import httpx
 import logging
 from typing import Optional
 
+from services.http_client import http_client
+from services.phones import normalize_phone
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -12,6 +14,10 @@ class WhatsAppService:
         self.api_url = os.getenv("EVOLUTION_API_URL")
         self.api_key = os.getenv("EVOLUTION_API_KEY")
         self.instance_name = os.getenv("EVOLUTION_INSTANCE_NAME")
+        # Numbers a quiz question is spread across (comma-separated); defaults to the main instance
+        self.instance_names = [
+            name.strip() for name in os.getenv("EVOLUTION_INSTANCE_NAMES", "").split(",") if name.strip()
+        ] or [self.instance_name]
         
         if not all([self.api_url, self.api_key, self.instance_name]):
             logger.warning("WhatsApp Service configuration missing. Notifications will not be sent.")
@@ -22,18 +28,19 @@ class WhatsAppService:
             "Content-Type": "application/json"
         }
 
-    async def send_message(self, phone: str, message: str) -> Optional[dict]:
+    async def _post(self, endpoint: str, payload: dict, operation: str):
+        """POST to Evolution API over the shared keep-alive pool (services.http_client)."""
+        return await http_client.post(endpoint, operation, json=payload, headers=self._get_headers())
+
+    async def send_message(self, phone: str, message: str, instance: Optional[str] = None) -> Optional[dict]:
         """Send a text message to a phone number"""
         if not self.api_url or not self.api_key:
             return None
 
-        # Format phone number (ensure country code)
-        if phone.startswith("0") and len(phone) == 11:
-            phone = "20" + phone[1:]
-        elif not phone.startswith("20") and len(phone) == 10:
-             phone = "20" + phone
+        # Format phone number (services.phones)
+        phone = normalize_phone(phone)
             
-        endpoint = f"{self.api_url}/message/sendText/{self.instance_name}"
+        endpoint = f"{self.api_url}/message/sendText/{instance or self.instance_name}"
         
         payload = {
             "number": phone,
@@ -41,32 +48,23 @@ class WhatsAppService:
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    endpoint, 
-                    json=payload, 
-                    headers=self._get_headers(),
-                    timeout=30.0
-                )
-                logger.info(f"WhatsApp Text Response ({phone}): {response.status_code} - {response.text}")
-                response.raise_for_status()
-                return response.json()
+            response = await self._post(endpoint, payload, "text")
+            logger.info(f"WhatsApp Text Response ({phone}): {response.status_code} - {response.text}")
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
             logger.error(f"Failed to send WhatsApp message to {phone}: {str(e)}")
             return None
 
-    async def send_pdf_ticket(self, phone: str, pdf_url: str, caption: str = "تذكرتك من Be Star") -> Optional[dict]:
+    async def send_pdf_ticket(self, phone: str, pdf_url: str, caption: str = "تذكرتك من Be Star", instance: Optional[str] = None) -> Optional[dict]:
         """Send a PDF ticket to a phone number (Using Media Message)"""
         if not self.api_url or not self.api_key:
             return None
 
-         # Format phone number
-        if phone.startswith("0") and len(phone) == 11:
-            phone = "20" + phone[1:]
-        elif not phone.startswith("20") and len(phone) == 10:
-             phone = "20" + phone
+        # Format phone number (services.phones)
+        phone = normalize_phone(phone)
 
-        endpoint = f"{self.api_url}/message/sendMedia/{self.instance_name}"
+        endpoint = f"{self.api_url}/message/sendMedia/{instance or self.instance_name}"
         
         payload = {
             "number": phone,
@@ -78,88 +76,68 @@ class WhatsAppService:
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    endpoint, 
-                    json=payload, 
-                    headers=self._get_headers(),
-                    timeout=60.0
-                )
-                logger.info(f"WhatsApp PDF Response ({phone}): {response.status_code} - {response.text}")
-                response.raise_for_status()
-                return response.json()
+            response = await self._post(endpoint, payload, "media")
+            logger.info(f"WhatsApp PDF Response ({phone}): {response.status_code} - {response.text}")
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
             logger.error(f"Failed to send PDF ticket to {phone}: {str(e)}")
             return None
 
-    async def send_image(self, phone: str, base64_data: str, caption: str = "") -> Optional[dict]:
-        """Send an image via base64 to a phone number"""
+    async def send_image(self, phone: str, base64_data: str, caption: str = "", instance: Optional[str] = None,
+                         mimetype: str = "image/jpeg") -> Optional[dict]:
+        """Send an image (base64 or a URL Evolution can download) to a phone number"""
         if not self.api_url or not self.api_key:
             return None
 
-        # Format phone number
-        if phone.startswith("0") and len(phone) == 11:
-            phone = "20" + phone[1:]
-        elif not phone.startswith("20") and len(phone) == 10:
-             phone = "20" + phone
+        # Format phone number (services.phones)
+        phone = normalize_phone(phone)
 
-        endpoint = f"{self.api_url}/message/sendMedia/{self.instance_name}"
+        endpoint = f"{self.api_url}/message/sendMedia/{instance or self.instance_name}"
         
         payload = {
             "number": phone,
             "mediatype": "image",
-            "mimetype": "image/jpeg",
+            "mimetype": mimetype,
             "caption": caption,
             "media": base64_data,
-            "fileName": "image.jpg"
+            "fileName": "image." + mimetype.rsplit("/", 1)[-1].replace("jpeg", "jpg")
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    endpoint, 
-                    json=payload, 
-                    headers=self._get_headers(),
-                    timeout=60.0
-                )
-                logger.info(f"WhatsApp Image Response ({phone}): {response.status_code}")
-                response.raise_for_status()
-                return response.json()
+            response = await self._post(endpoint, payload, "media")
+            logger.info(f"WhatsApp Image Response ({phone}): {response.status_code}")
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
             logger.error(f"Failed to send image to {phone}: {str(e)}")
             return None
 
-    async def send_link(self, phone: str, url: str, title: str = "", description: str = "") -> Optional[dict]:
+    async def send_link(self, phone: str, url: str, title: str = "", description: str = "", instance: Optional[str] = None) -> Optional[dict]:
         """Send a link message to a phone number"""
         if not self.api_url or not self.api_key:
             return None
 
-        # Format phone number
-        if phone.startswith("0") and len(phone) == 11:
-            phone = "20" + phone[1:]
-        elif not phone.startswith("20") and len(phone) == 10:
-             phone = "20" + phone
+        # Format phone number (services.phones)
+        phone = normalize_phone(phone)
 
         # Send as formatted text with link
         message = f"🔗 *{title}*\n{description}\n\n{url}" if title else url
-        return await self.send_message(phone, message)
+        return await self.send_message(phone, message, instance)
 
-    async def send_certificate(self, phone: str, pdf_base64: str, guest_name: str, rank: int = 0) -> Optional[dict]:
+    async def send_certificate(self, phone: str, pdf_base64: str, guest_name: str, rank: int = 0, instance: Optional[str] = None) -> Optional[dict]:
         """Send a certificate PDF document via WhatsApp"""
         if not self.api_url or not self.api_key:
             logger.error("WhatsApp not configured (missing api_url or api_key)")
             return None
 
-        # Format phone number
-        if phone.startswith("0") and len(phone) == 11:
-            phone = "20" + phone[1:]
-        elif not phone.startswith("20") and len(phone) == 10:
-             phone = "20" + phone
+        # Format phone number (services.phones)
+        phone = normalize_phone(phone)
 
         rank_text = f" 🏆 (المركز {rank})" if rank else ""
         caption = f"🌟 مبروك يا {guest_name}!{rank_text}\n\nدي شهادة تقديرك من إيفنت كن نجماً ⭐\nفخورين بيك وبمشاركتك! 🎉"
 
-        endpoint = f"{self.api_url}/message/sendMedia/{self.instance_name}"
+        endpoint = f"{self.api_url}/message/sendMedia/{instance or self.instance_name}"
         
         payload = {
             "number": phone,
@@ -172,16 +150,10 @@ class WhatsAppService:
 
         try:
             logger.info(f"Sending certificate to {phone}, base64 length: {len(pdf_base64)}")
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    endpoint, 
-                    json=payload, 
-                    headers=self._get_headers(),
-                    timeout=120.0
-                )
-                logger.info(f"WhatsApp Certificate Response ({phone}): {response.status_code} - {response.text[:500]}")
-                response.raise_for_status()
-                return response.json()
+            response = await self._post(endpoint, payload, "certificate")
+            logger.info(f"WhatsApp Certificate Response ({phone}): {response.status_code} - {response.text[:500]}")
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
             logger.error(f"Failed to send certificate to {phone}: {str(e)}")
             return None
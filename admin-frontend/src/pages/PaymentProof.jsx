@@ -22,11 +22,15 @@ function PaymentProof() {
     const fetchTicket = async () => {
         setLoading(true)
         try {
-            const res = await apiFetch('/api/tickets/')
-            const data = await res.json()
-            const found = data.find(t => t.id === parseInt(id))
-            if (found) {
-                setTicket(found)
+            const res = await apiFetch(`/api/tickets/${id}`)
+            if (res.ok) {
+                const data = await res.json()
+                setTicket({
+                    ...data,
+                    customer_name: data.customer.name,
+                    customer_phone: data.customer.phone,
+                    customer_email: data.customer.email,
+                })
             } else {
                 setError('التذكرة غير موجودة')
             }
@@ -202,7 +206,7 @@ function PaymentProof() {
                             <Image className="w-4 h-4 text-gold-400" />
                             <h3 className="text-white/60 text-sm font-medium">صورة إثبات الدفع</h3>
                         </div>
-                        {ticket.payment_proof.startsWith('data:image') || ticket.payment_proof.startsWith('http') ? (
+                        {ticket.payment_proof.startsWith('data:image') || ticket.payment_proof.startsWith('http') || ticket.payment_proof.startsWith('/api/') ? (
                             <div className="rounded-xl overflow-hidden border border-gold-500/20 bg-black/30">
                                 <img
                                     src={ticket.payment_proof}
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react'
-import { apiFetch } from '../utils/api'
+import { apiFetch, apiStream } from '../utils/api'
 import {
     HelpCircle, Users, Trophy, ClipboardList, Plus, Send, Trash2, Clock,
     CheckCircle, XCircle, ChevronDown, ChevronUp, Search, Timer, Award, X,
@@ -49,8 +49,29 @@ export default function QuizEngine() {
         fetchAttendees()
     }, [])
 
+    // The ticket-type boards are live (SSE, top 500); custom groups are fetched once
     useEffect(() => {
-        if (activeTab === 'leaderboard') fetchLeaderboard()
+        if (activeTab !== 'leaderboard') return
+        if (lbFilter.startsWith('group:')) {
+            fetchLeaderboard()
+            return
+        }
+        const controller = new AbortController()
+        const follow = async () => {
+            while (!controller.signal.aborted) {
+                try {
+                    await apiStream(`${API}/leaderboard/stream?top=500&group=${lbFilter}`, applyLeaderboardEvent,
+                        { signal: controller.signal })
+                } catch (e) {
+                    if (controller.signal.aborted) return
+                    console.error(e)
+                    fetchLeaderboard()
+                }
+                await new Promise(resolve => setTimeout(resolve, 3000))
+            }
+        }
+        follow()
+        return () => controller.abort()
     }, [activeTab, lbFilter])
 
     // ═══════ Data Fetching ═══════
@@ -80,6 +101,18 @@ export default function QuizEngine() {
         } catch (e) { console.error(e) }
     }
 
+    const applyLeaderboardEvent = (event, data) => {
+        if (event === 'snapshot') {
+            setLeaderboard(data.leaderboard || [])
+        } else if (event === 'delta') {
+            setLeaderboard(prev => {
+                const replaced = new Set([...data.removed, ...data.changed.map(e => e.ticket_id)])
+                return [...prev.filter(p => !replaced.has(p.ticket_id)), ...data.changed]
+                    .sort((a, b) => a.rank - b.rank)
+            })
+        }
+    }
+
     const fetchAttendees = async () => {
         try {
             const res = await apiFetch('/api/engagement/attendees')
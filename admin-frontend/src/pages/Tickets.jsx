@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { apiFetch } from '../utils/api'
+import { apiFetch, apiFetchAll } from '../utils/api'
 import {
     Search,
     Filter,
@@ -30,9 +30,7 @@ function Tickets() {
             const url = statusFilter === 'all'
                 ? '/api/tickets/'
                 : `/api/tickets/?status=${statusFilter}`
-            const res = await apiFetch(url)
-            const data = await res.json()
-            setTickets(data)
+            setTickets(await apiFetchAll(url))
         } catch (error) {
             console.error('Error fetching tickets:', error)
         } finally {
@@ -182,7 +180,7 @@ function Tickets() {
                                         <td>{getStatusBadge(ticket.status)}</td>
                                         <td>
                                             <div className="flex items-center gap-2">
-                                                {ticket.payment_proof && (
+                                                {ticket.has_payment_proof && (
                                                     <button
                                                         onClick={() => navigate(`/tickets/${ticket.id}/proof`)}
                                                         className="p-2 rounded-lg bg-blue-500/20 text-blue-400 hover:bg-blue-500/30 transition-colors"
@@ -28,3 +28,53 @@ export async function apiFetch(url, options = {}) {
 
     return res
 }
+
+/**
+ * GET a keyset-paginated list in full: follows the X-Next-Cursor header
+ * page by page (the API caps each response at LIST_MAX_PAGE_SIZE rows).
+ */
+export async function apiFetchAll(url, options = {}) {
+    const rows = []
+    let cursor = null
+    do {
+        const pageUrl = cursor
+            ? `${url}${url.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(cursor)}`
+            : url
+        const res = await apiFetch(pageUrl, options)
+        if (!res.ok) break
+        rows.push(...(await res.json()))
+        cursor = res.headers.get('X-Next-Cursor')
+    } while (cursor)
+    return rows
+}
+
+/**
+ * Read a Server-Sent Events endpoint with fetch, so the Authorization
+ * header goes along (EventSource cannot set it). Calls onEvent(event, data)
+ * per message with data parsed as JSON; comments (heartbeats) are skipped.
+ * Resolves when the stream ends; abort it through options.signal.
+ */
+export async function apiStream(url, onEvent, options = {}) {
+    const res = await apiFetch(url, { ...options, headers: { ...options.headers, Accept: 'text/event-stream' } })
+    if (!res.ok || !res.body) throw new Error(`stream failed: ${res.status}`)
+
+    const reader = res.body.pipeThrough(new TextDecoderStream()).getReader()
+    let buffer = ''
+    for (;;) {
+        const { value, done } = await reader.read()
+        if (done) return
+        buffer += value.replace(/\r\n/g, '\n')
+        let end
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, end)
+            buffer = buffer.slice(end + 2)
+            let event = 'message'
+            const data = []
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim()
+                else if (line.startsWith('data:')) data.push(line.slice(5).trimStart())
+            }
+            if (data.length) onEvent(event, JSON.parse(data.join('\n')))
+        }
+    }
+}